@@ -0,0 +1,303 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * End to end benchmarks of the Safety Printer MCU connection, against the virtual MCU (Simulator.py, Linux only).
+ * By sensor count and BAUD rate:
+ *
+ *    <R1> poll round trip (p50, p99)
+ *    trip latency: from the trip to the interlockUpdate message, and from the first tripped <R1> answer on the wire
+ *    host side trip reaction (Tracing.py): from the status frame received to the interlockUpdate message
+ *    connect() time to connected
+ *    CPU time per hour of idle monitoring
+ *
+ * By sensor count only (no serial link): <R1> parser and CRC-16 throughput (frames/s).
+ *
+ * Results are compared with the stored baselines (connection_baselines.json). A result worse than its baseline by more
+ * than the tolerance is a regression: it is marked REGRESSION and the script exits with status 1. Baselines depend on
+ * the machine, so store them again with --update after a hardware change or an intended performance change.
+ * Run it with the same python that runs OctoPrint:
+ *
+ *    python benchmarks/connection_benchmark.py [--quick] [--update] [--tolerance 0.5]
+ *
+ '''
+
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+# Runs from a checkout without installing the plugin: the repository root goes first on the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from octoprint_SafetyPrinter import Protocol
+from octoprint_SafetyPrinter.Connection import Connection
+from octoprint_SafetyPrinter.Crc16 import crc16
+from octoprint_SafetyPrinter.Simulator import Simulator
+from tests.PluginStandIn import StandInPlugin, StandInPluginManager
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "connection_baselines.json")
+TOLERANCE = 0.5 # Allowed relative degradation
+
+SENSORS = (1, 16, 64, 256)
+BAUD_RATES = (38400, 115200, 250000)
+QUICK_SENSORS = (1, 16)
+QUICK_BAUD_RATES = (115200,)
+
+# Per sensors x BAUD combination
+RTT_TIME = 3.0 # Time (s) polling
+TRIPS = 8
+CONNECTS = 5
+IDLE_TIME = 20.0
+
+# Metric: (unit, higher is better, absolute slack). The slack keeps tiny values (ex.: 1 ms) from failing on noise.
+METRICS = {
+    "r1_rtt_p50": ("ms", False, 2.0),
+    "r1_rtt_p99": ("ms", False, 5.0),
+    "r1_errors": ("", False, 0),
+    "trip_to_ui_mean": ("ms", False, 20.0),
+    "trip_to_ui_max": ("ms", False, 100.0),
+    "wire_to_ui_p50": ("ms", False, 5.0),
+    "wire_to_ui_max": ("ms", False, 10.0),
+    "reaction_max": ("ms", False, 5.0),
+    "connect": ("ms", False, 20.0),
+    "parse_r1": ("frames/s", True, 0),
+    "crc16_r1": ("frames/s", True, 0),
+    "idle_cpu": ("s/h", False, 1.0),
+}
+
+class TripWatcher(StandInPluginManager):
+    # Plugin messages to the UI. Keeps the time the first tripped interlockUpdate was sent, drops the others.
+
+    def __init__(self):
+        StandInPluginManager.__init__(self)
+        self.tripEvent = threading.Event()
+        self.tripTime = None
+
+    def received(self, message):
+        if (message.get("type") == "interlockUpdate") and message.get("interlockStatus") and not self.tripEvent.is_set():
+            self.tripTime = time.monotonic()
+            self.tripEvent.set()
+
+class Bench():
+    # One virtual MCU and the plugin connected to it
+
+    def __init__(self, sensors, baudRate):
+        self.dataFolder = tempfile.mkdtemp(prefix="SafetyPrinterBenchmark")
+        self.simulator = Simulator(sensors, baudRate=baudRate)
+        self.simulator.start()
+        self.plugin = StandInPlugin(self.simulator.path, self.dataFolder, baudRate, TripWatcher())
+        self.plugin._settings.values["showTerminal"] = False
+        self.plugin.settingsCache.rebuild()
+        self.conn = None
+
+    def connect(self):
+        # Returns the connect() time (s)
+        board = self.plugin.boards.board()
+        if self.conn is not None:
+            self.conn.closeConnection()
+        self.conn = board.conn = Connection(self.plugin, board)
+        start = time.monotonic()
+        self.conn.connect(False)
+        elapsed = time.monotonic() - start
+        if not self.conn.is_connected():
+            raise RuntimeError("Not connected to the virtual MCU (%s)" % self.conn.state)
+        return elapsed
+
+    def close(self):
+        self.plugin.close()
+        self.simulator.close()
+        shutil.rmtree(self.dataFolder, ignore_errors=True)
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(round(p * (len(values) - 1)))]
+
+def key(metric, sensors, baudRate=None):
+    if baudRate is None:
+        return "%s[sensors=%d]" % (metric, sensors)
+    return "%s[sensors=%d,baud=%d]" % (metric, sensors, baudRate)
+
+# *******************************  Benchmarks
+
+def bench_rtt(results, sensors, baudRate, duration):
+    bench = Bench(sensors, baudRate)
+    try:
+        bench.connect()
+        conn = bench.conn
+        frameTime = (len(bench.simulator.status()) + 16) * 10 / baudRate
+        polls = max(10, min(200, int(duration / frameTime)))
+        times = []
+        errors = 0
+        for i in range(polls + 3):
+            start = time.monotonic()
+            answer = conn.send_command("<R1>")
+            elapsed = time.monotonic() - start
+            if answer == "Error":
+                errors += 1
+            elif i >= 3: # warm up
+                times.append(elapsed)
+        results[key("r1_rtt_p50", sensors, baudRate)] = percentile(times, 0.5) * 1000 if times else None
+        results[key("r1_rtt_p99", sensors, baudRate)] = percentile(times, 0.99) * 1000 if times else None
+        results[key("r1_errors", sensors, baudRate)] = errors
+    finally:
+        bench.close()
+
+def bench_trip(results, sensors, baudRate, trips):
+    # Printing: polled every PollScheduler.POLL_PRINTING. The trip happens at a random time between two polls, so
+    # trip_to_ui is mostly the poll period. wire_to_ui is the transfer and plugin part: from the first byte of the
+    # first tripped <R1> answer sent by the MCU to the interlockUpdate message.
+    bench = Bench(sensors, baudRate)
+    try:
+        bench.connect()
+        plugin = bench.plugin
+        plugin._printer.printing = True
+        plugin.boards.startTimer()
+        fromTrip = []
+        fromWire = []
+        phases = random.Random(trips)
+        for _ in range(trips):
+            plugin._plugin_manager.tripEvent.clear()
+            time.sleep(phases.uniform(0.5, 1.0))
+            start = time.monotonic()
+            bench.simulator.trip()
+            if not plugin._plugin_manager.tripEvent.wait(5.0):
+                raise RuntimeError("Trip not reported to the UI")
+            fromTrip.append(plugin._plugin_manager.tripTime - start)
+            fromWire.append(plugin._plugin_manager.tripTime - bench.simulator.tripWireTime)
+            bench.simulator.reset()
+            deadline = time.monotonic() + 5.0
+            while bench.conn.interlockStatus and time.monotonic() < deadline:
+                time.sleep(0.05)
+        results[key("trip_to_ui_mean", sensors, baudRate)] = sum(fromTrip) / len(fromTrip) * 1000
+        results[key("trip_to_ui_max", sensors, baudRate)] = max(fromTrip) * 1000
+        results[key("wire_to_ui_p50", sensors, baudRate)] = percentile(fromWire, 0.5) * 1000
+        results[key("wire_to_ui_max", sensors, baudRate)] = max(fromWire) * 1000
+        # Host side only, from the plugin traces (status frame received to UI message sent)
+        results[key("reaction_max", sensors, baudRate)] = max(trace["total"] for trace in plugin.tracer.traces() if trace["kind"] == "trip") * 1000
+    finally:
+        bench.close()
+
+def bench_connect(results, sensors, baudRate, connects):
+    bench = Bench(sensors, baudRate)
+    try:
+        times = [bench.connect() for _ in range(connects)]
+        results[key("connect", sensors, baudRate)] = percentile(times, 0.5) * 1000
+    finally:
+        bench.close()
+
+def bench_parser(results, sensors):
+    simulator = Simulator(sensors)
+    try:
+        frame = simulator.status()
+    finally:
+        simulator.close()
+    for metric, function in (("parse_r1", lambda: Protocol.parseStatus(frame)), ("crc16_r1", lambda: crc16(frame))):
+        number = max(10, 20000 // sensors)
+        best = min(timeit.repeat(function, number=number, repeat=5))
+        results[key(metric, sensors)] = number / best
+
+def bench_idle(results, sensors, baudRate, duration):
+    # Idle monitoring: printer connected, not printing, polled every PollScheduler.POLL_IDLE.
+    # CPU time of the whole process, minus the virtual MCU thread.
+    bench = Bench(sensors, baudRate)
+    try:
+        bench.connect()
+        bench.plugin.boards.startTimer()
+        simClock = time.pthread_getcpuclockid(bench.simulator.ident)
+        time.sleep(1.0)
+        start = time.monotonic()
+        cpu = time.process_time() - time.clock_gettime(simClock)
+        time.sleep(duration)
+        cpu = time.process_time() - time.clock_gettime(simClock) - cpu
+        results[key("idle_cpu", sensors, baudRate)] = cpu * 3600 / (time.monotonic() - start)
+    finally:
+        bench.close()
+
+# *******************************  Baselines
+
+def compare(results, baselines, tolerance):
+    # Prints the results and returns the regressions
+    regressions = []
+    print("%-40s %12s %12s %9s" % ("metric", "result", "baseline", ""))
+    for name in sorted(results):
+        value = results[name]
+        unit, higher, slack = METRICS[name.split("[")[0]]
+        baseline = baselines.get(name)
+        status = ""
+        if value is None:
+            status = "REGRESSION"
+        elif baseline is None:
+            status = "new"
+        elif higher and value < baseline * (1 - tolerance) - slack:
+            status = "REGRESSION"
+        elif (not higher) and value > baseline * (1 + tolerance) + slack:
+            status = "REGRESSION"
+        if status == "REGRESSION":
+            regressions.append(name)
+        print("%-40s %12s %12s %9s %s" % (name, "-" if value is None else "%.1f" % value,
+                                          "-" if baseline is None else "%.1f" % baseline, unit, status))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Safety Printer connection benchmarks, against the virtual MCU.")
+    parser.add_argument("--quick", action="store_true", help="fewer sensor counts and BAUD rates, shorter runs")
+    parser.add_argument("--update", action="store_true", help="store the results as the new baselines")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="allowed relative degradation (default: %.2f)" % TOLERANCE)
+    parser.add_argument("--baselines", default=BASELINES, help="baselines file")
+    args = parser.parse_args()
+    if not sys.platform.startswith("linux"):
+        parser.error("the virtual MCU needs a Linux pseudo-terminal")
+    logging.basicConfig(level=logging.ERROR)
+
+    sensorCounts = QUICK_SENSORS if args.quick else SENSORS
+    baudRates = QUICK_BAUD_RATES if args.quick else BAUD_RATES
+    scale = 3 if args.quick else 1
+    results = {}
+    for sensors in sensorCounts:
+        bench_parser(results, sensors)
+        for baudRate in baudRates:
+            bench_rtt(results, sensors, baudRate, RTT_TIME / scale)
+            bench_connect(results, sensors, baudRate, CONNECTS)
+            bench_trip(results, sensors, baudRate, TRIPS // scale)
+            bench_idle(results, sensors, baudRate, IDLE_TIME / scale)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines) as f:
+            baselines = json.load(f)
+    regressions = compare(results, baselines, args.tolerance)
+
+    if args.update:
+        baselines.update((name, round(value, 3)) for name, value in results.items() if value is not None)
+        with open(args.baselines, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print("Baselines stored in %s" % args.baselines)
+    elif regressions:
+        print("REGRESSION: %d result(s) worse than the baselines: %s" % (len(regressions), ", ".join(regressions)))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Compares the table driven CRC-16 with the bit by bit implementation used up to version 1.2.0.
+ * Run it with the same python that runs OctoPrint:
+ *
+ *    python benchmarks/crc16_benchmark.py
+ *
+ '''
+
+import os
+import sys
+import timeit
+
+# Runs from a checkout without installing the plugin: the repository root goes first on the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from octoprint_SafetyPrinter.Crc16 import crc16
+
+def legacy_crc16(data):
+    # Connection.crc16 up to version 1.2.0
+    data = data.encode()
+    crc = 0
+    for a in data:
+        crc ^= a
+        for _ in range(0, 8):
+            if (crc & 1):
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc = (crc >> 1)
+    return crc
+
+def r1_payload(sensors):
+    payload = "R1:F,F,F,F,F,F,"
+    for index in range(sensors):
+        payload += "#%d,T,F,%d,%d,5,F," % (index, 20 + index, 60 + index)
+    return payload
+
+def r2_payload(sensors):
+    payload = "R2:"
+    for index in range(sensors):
+        payload += "#%d,Sensor %d,%d,F,0,300," % (index, index, index % 2)
+    return payload
+
+PAYLOADS = [
+    ("sensor fields", "TF256051F"),
+    ("R1 8 sensors", r1_payload(8)),
+    ("R2 8 sensors", r2_payload(8)),
+    ("R1 64 sensors", r1_payload(64)),
+]
+
+def incremental(data, chunk=16):
+    # CRC fed as the serial reader receives the bytes
+    data = data.encode()
+    crc = 0
+    for pos in range(0, len(data), chunk):
+        crc = crc16(data[pos:pos + chunk], crc)
+    return crc
+
+def main():
+    print("%-16s %6s %12s %12s %12s %8s" % ("payload", "bytes", "legacy (us)", "table (us)", "incr. (us)", "speedup"))
+    for name, payload in PAYLOADS:
+        assert legacy_crc16(payload) == crc16(payload) == incremental(payload), name
+        number = 2000
+        legacy = min(timeit.repeat(lambda: legacy_crc16(payload), number=number, repeat=5)) / number * 1e6
+        table = min(timeit.repeat(lambda: crc16(payload), number=number, repeat=5)) / number * 1e6
+        incr = min(timeit.repeat(lambda: incremental(payload), number=number, repeat=5)) / number * 1e6
+        print("%-16s %6d %12.2f %12.2f %12.2f %7.1fx" % (name, len(payload), legacy, table, incr, legacy / table))
+
+if __name__ == "__main__":
+    main()
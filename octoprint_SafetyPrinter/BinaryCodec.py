@@ -0,0 +1,175 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+'''
+Binary framing of the Safety Printer MCU answers (feature "binary", see Protocol.py).
+
+After "<S2 on>" is answered (in ASCII), every MCU output is sent as binary frames:
+
+    COBS( type (uint8) | length (uint16) | payload (length bytes) | CRC-16 (uint16) ) 0x00
+
+All integers are little endian. The CRC (Crc16.py) covers type, length and payload. COBS (Consistent Overhead Byte
+Stuffing) removes the zeros from the frame, so 0x00 only appears as the frame delimiter and a receiver always finds
+the start of the next frame after an error.
+
+Frame types:
+
+TEXT (1):   payload is an ASCII answer, as sent without binary framing but without the $crc$ envelope.
+STATUS (2): <R1> answer with fixed width fields:
+            header flags (uint8, bit 0 = interlock ... bit 5 = voltWarning, same order as Protocol.StatusHeader),
+            number of sensors (uint16) and, per sensor:
+            index (uint16), flags (uint8, bit 0 = enabled, bit 1 = active, bit 2 = trigger),
+            actualValue (float32), SP (float32), timer (int32).
+TAGGED (3): answer to a command with a sequence number (feature "pipeline"): sequence number (uint8), then the
+            answer frame type, length and payload (without its own CRC).
+'''
+
+import struct
+from .Crc16 import crc16
+from .Protocol import ProtocolError, StatusHeader, StatusFrame, SensorStatus
+from .Pipeline import Tagged
+
+FRAME_TEXT = 1
+FRAME_STATUS = 2
+FRAME_TAGGED = 3
+
+DELIMITER = b"\x00"
+
+_FRAME_HEADER = struct.Struct("<BH")
+_CRC = struct.Struct("<H")
+_STATUS_HEADER = struct.Struct("<BH")
+_SENSOR = struct.Struct("<HBffi")
+
+_HEADER_FLAGS = StatusHeader.__slots__
+_SENSOR_FLAGS = ("enabled", "active", "trigger")
+
+def cobsEncode(data):
+    out = bytearray()
+    block = bytearray()
+    for byte in data:
+        if byte:
+            block.append(byte)
+            if len(block) == 254:
+                out.append(255)
+                out += block
+                block.clear()
+        else:
+            out.append(len(block) + 1)
+            out += block
+            block.clear()
+    out.append(len(block) + 1)
+    out += block
+    return bytes(out)
+
+def cobsDecode(data):
+    out = bytearray()
+    pos = 0
+    size = len(data)
+    while pos < size:
+        code = data[pos]
+        end = pos + code
+        if code == 0 or end > size:
+            raise ValueError("Invalid COBS block")
+        out += data[pos + 1:end]
+        pos = end
+        if code < 255 and pos < size:
+            out.append(0)
+    return bytes(out)
+
+def encodeFrame(frameType, payload):
+    # Returns the frame ready to be sent, delimiter included
+    body = _FRAME_HEADER.pack(frameType, len(payload)) + payload
+    return cobsEncode(body + _CRC.pack(crc16(body))) + DELIMITER
+
+def encodeTagged(seq, frame):
+    # Adds a sequence number to a frame made by encodeFrame/encodeText/encodeStatus
+    body = cobsDecode(frame[:-1])[:-_CRC.size]
+    return encodeFrame(FRAME_TAGGED, bytes((seq,)) + body)
+
+def encodeText(text):
+    return encodeFrame(FRAME_TEXT, text.encode())
+
+def encodeStatus(status):
+    # Protocol.StatusFrame to a STATUS frame
+    flags = 0
+    for bit, name in enumerate(_HEADER_FLAGS):
+        if getattr(status.header, name):
+            flags |= 1 << bit
+    payload = bytearray(_STATUS_HEADER.pack(flags, len(status.sensors)))
+    for sensor in status.sensors:
+        sensorFlags = 0
+        for bit, name in enumerate(_SENSOR_FLAGS):
+            if getattr(sensor, name):
+                sensorFlags |= 1 << bit
+        payload += _SENSOR.pack(sensor.index, sensorFlags, sensor.actualValue, sensor.SP, sensor.timer)
+    return encodeFrame(FRAME_STATUS, bytes(payload))
+
+def statusWireSize(sensors):
+    # Bytes of a STATUS frame on the wire, at most (COBS overhead: 1 byte per 254 + 1, delimiter). 256 sensors: 3865.
+    size = _FRAME_HEADER.size + _STATUS_HEADER.size + sensors * _SENSOR.size + _CRC.size
+    return size + size // 254 + 2
+
+def _number(value):
+    # float32 back to the value sent by the MCU (integers without decimals)
+    if value.is_integer():
+        return int(value)
+    return float("%.7g" % value)
+
+def _decodeStatus(frame, payload):
+    if len(payload) < _STATUS_HEADER.size:
+        raise ProtocolError(frame, 0, "Incomplete status header")
+    flags, count = _STATUS_HEADER.unpack_from(payload)
+    if len(payload) != _STATUS_HEADER.size + count * _SENSOR.size:
+        raise ProtocolError(frame, 1, "Status size doesn't match %d sensors" % count)
+    header = StatusHeader(*[bool(flags & (1 << bit)) for bit in range(len(_HEADER_FLAGS))])
+    sensors = []
+    for index, sensorFlags, actualValue, SP, timer in _SENSOR.iter_unpack(payload[_STATUS_HEADER.size:]):
+        sensors.append(SensorStatus(index, bool(sensorFlags & 1), bool(sensorFlags & 2), _number(actualValue), _number(SP), timer, bool(sensorFlags & 4)))
+    return StatusFrame(header, sensors)
+
+def decodeFrame(frame):
+    # Received frame (delimiter removed) to str (TEXT) or Protocol.StatusFrame (STATUS). Raises ProtocolError.
+    try:
+        body = cobsDecode(frame)
+    except ValueError as e:
+        raise ProtocolError(frame.hex(), 0, str(e))
+    if len(body) < _FRAME_HEADER.size + _CRC.size:
+        raise ProtocolError(frame.hex(), 0, "Frame too short")
+    frameType, length = _FRAME_HEADER.unpack_from(body)
+    if len(body) != _FRAME_HEADER.size + length + _CRC.size:
+        raise ProtocolError(frame.hex(), 1, "Frame length doesn't match")
+    if _CRC.unpack_from(body, len(body) - _CRC.size)[0] != crc16(body[:-_CRC.size]):
+        raise ProtocolError(frame.hex(), 2, "Bad CRC")
+    payload = body[_FRAME_HEADER.size:-_CRC.size]
+    if frameType == FRAME_TAGGED:
+        # Sequence number and the answer frame (type, length, payload)
+        if len(payload) < 1 + _FRAME_HEADER.size:
+            raise ProtocolError(frame.hex(), 3, "Tagged frame too short")
+        frameType, length = _FRAME_HEADER.unpack_from(payload, 1)
+        if len(payload) != 1 + _FRAME_HEADER.size + length:
+            raise ProtocolError(frame.hex(), 4, "Tagged frame length doesn't match")
+        return Tagged(payload[0], _decodePayload(frame, frameType, payload[1 + _FRAME_HEADER.size:]))
+    return _decodePayload(frame, frameType, payload)
+
+def _decodePayload(frame, frameType, payload):
+    if frameType == FRAME_TEXT:
+        return payload.decode(errors="replace").strip()
+    elif frameType == FRAME_STATUS:
+        return _decodeStatus(frame.hex(), payload)
+    raise ProtocolError(frame.hex(), 0, "Unknown frame type %d" % frameType)
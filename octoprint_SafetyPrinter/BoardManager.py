@@ -0,0 +1,222 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from octoprint.util import RepeatedTimer
+from . import Connection
+from .Outbox import BoardOutbox
+from .History import History
+
+PRIMARY_BOARD = "main" # Uses the serialport setting
+PUSH_WAIT = 1.0 # Time (s) waiting for status frames when all boards are in push mode
+
+class Board():
+    __slots__ = ("id", "port", "outbox", "history", "metrics", "conn")
+
+    def __init__(self, boardId, port, outbox, history, metrics):
+        self.id = boardId
+        self.port = port # None: serialport setting
+        self.outbox = outbox
+        self.history = history
+        self.metrics = metrics # Metrics.BoardMetrics, kept across reconnects
+        self.conn = None
+
+class BoardManager():
+    # Safety Printer boards managed by this plugin instance, keyed by board ID. The primary board ("main") uses the
+    # serialport setting. The others come from the "boards" setting: [{"id": "enclosure", "port": "/dev/ttyUSB1"}, ...]
+    # Each board has its own Connection, sensor history and board ID on its UI messages. Boards connect at the same time,
+    # each on a thread that ends with the connection attempt. All boards share the plugin outbox and one status timer
+    # (PollScheduler).
+
+    def __init__(self, plugin):
+        self._plugin = plugin
+        self._logger = plugin._console_logger
+        self._boards = OrderedDict()
+        self._lock = threading.Lock()
+        self._connecting = {} # Board ID: connect thread, while the connection is in progress
+        self._autoProbe = threading.Lock() # Boards on the AUTO port probe one at a time (never the same port twice)
+        self._timer = None
+        self.pushEvent = threading.Event() # Set by the boards in push mode when a status frame arrives
+        self.configure()
+
+    def historyPath(self, boardId):
+        if boardId == PRIMARY_BOARD:
+            name = "history.bin"
+        else:
+            name = "history-" + re.sub(r"[^A-Za-z0-9_-]", "_", boardId) + ".bin"
+        return os.path.join(self._plugin.get_plugin_data_folder(), name)
+
+    def configure(self):
+        # Reads the board list from the settings. Returns the IDs of the new boards. Removed boards are disconnected.
+        wanted = OrderedDict([(PRIMARY_BOARD, None)])
+        for entry in self._plugin.settingsCache.current.boards:
+            boardId = str(entry.get("id", "")).strip() if isinstance(entry, dict) else ""
+            port = str(entry.get("port", "")).strip() if isinstance(entry, dict) else ""
+            if (not boardId) or (not port) or (boardId in wanted):
+                self._logger.warning("Invalid Safety Printer board setting: %s", entry)
+                continue
+            wanted[boardId] = port
+
+        with self._lock:
+            removed = [board for boardId, board in self._boards.items() if boardId not in wanted]
+            added = []
+            boards = OrderedDict()
+            for boardId, port in wanted.items():
+                board = self._boards.get(boardId)
+                if board is None:
+                    board = Board(boardId, port, BoardOutbox(self._plugin.outbox, boardId), History(self.historyPath(boardId)),
+                                  self._plugin.linkMetrics.board(boardId))
+                    added.append(boardId)
+                board.port = port
+                boards[boardId] = board
+            self._boards = boards
+
+        for board in removed:
+            self._logger.info("Safety Printer board removed: %s", board.id)
+            self._close(board)
+            self._plugin.linkMetrics.removeBoard(board.id)
+        return added
+
+    def ids(self):
+        return list(self._boards)
+
+    def exists(self, boardId):
+        return boardId in self._boards
+
+    def board(self, boardId=None):
+        return self._boards.get(PRIMARY_BOARD if boardId is None else boardId)
+
+    def get(self, boardId=None):
+        # Connection of a board (None if unknown or never connected)
+        board = self.board(boardId)
+        return board.conn if board else None
+
+    def connections(self):
+        return [board.conn for board in self._boards.values() if board.conn is not None]
+
+    def claimedPorts(self, conn):
+        # Ports in use (or reserved in the settings) by the other boards. AUTO probing skips them.
+        ports = set()
+        for board in self._boards.values():
+            if board.conn is conn:
+                continue
+            if board.port and board.port != "AUTO":
+                ports.add(board.port)
+            if board.conn is not None and board.conn.is_connected():
+                ports.add(board.conn.connectedPort)
+        return ports
+
+    # *******************************  Connections
+
+    def connect(self, boardId=None, waitPrinter=False):
+        # Queues a board (re)connection. Progress is sent to the UI on connectionUpdate messages.
+        board = self.board(boardId)
+        if board is None:
+            return False
+        with self._lock:
+            if (board.id in self._connecting) or (board.conn is not None and board.conn.state in Connection.CONNECTING_STATES):
+                self._logger.info("Safety Printer MCU connection already in progress (board %s).", board.id)
+                return False
+            old = board.conn
+            conn = board.conn = Connection.Connection(self._plugin, board)
+            thread = threading.Thread(target=self._connect_board, args=(board.id, conn, waitPrinter), name="SafetyPrinterConnect")
+            thread.daemon = True
+            self._connecting[board.id] = thread
+        if old is not None and old.is_connected():
+            old.closeConnection()
+        self._logger.info("Attempting to connect to Safety Printer MCU (board %s) ...", board.id)
+        thread.start()
+        return True
+
+    def connectAll(self, waitPrinter):
+        for boardId in self.ids():
+            self.connect(boardId, waitPrinter)
+
+    def _connect_board(self, boardId, conn, waitPrinter):
+        try:
+            if conn.serialPort() == "AUTO":
+                # Waits for the other AUTO boards: their ports are claimed once connected
+                with self._autoProbe:
+                    if not conn.abortSerialConn:
+                        conn.connect(waitPrinter)
+            else:
+                conn.connect(waitPrinter)
+            if conn.is_connected():
+                self.startTimer()
+        finally:
+            with self._lock:
+                if self._connecting.get(boardId) is threading.current_thread():
+                    del self._connecting[boardId]
+
+    def close(self, boardId=None):
+        board = self.board(boardId)
+        if board is not None:
+            self._close(board)
+
+    def _close(self, board):
+        conn = board.conn
+        if conn is not None:
+            conn.abortSerialConn = True
+            if conn.prober is not None:
+                conn.prober.cancel()
+            conn.closeConnection()
+
+    def closeAll(self):
+        self.cancelTimer()
+        for board in list(self._boards.values()):
+            self._close(board)
+
+    # *******************************  Status timer
+
+    def startTimer(self):
+        # One timer updates all the boards. Interval is set by the poll scheduler.
+        with self._lock:
+            if self._timer is not None and self._timer.is_alive():
+                return
+            self._plugin.scheduler.reset()
+            self._timer = RepeatedTimer(self._plugin.scheduler.nextInterval, self.updateStatus, None, None, True)
+            self._timer.start()
+
+    def cancelTimer(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def updateStatus(self):
+        # Update UI status (connection, trip and sensors) of all boards
+        self._plugin.scheduler.pollStarted()
+        connections = self.connections()
+        connected = [conn for conn in connections if conn.is_connected()]
+        if connected and all(conn.pushMode for conn in connected):
+            # Nothing to poll: waits for a status frame from any board
+            self.pushEvent.wait(PUSH_WAIT)
+        self.pushEvent.clear()
+
+        for conn in connections:
+            # One batch per board: the messages of a board are sent as soon as it is updated, not after the slowest one
+            with conn.outbox.batch():
+                conn.update_ui_connection_status()
+                if conn.is_connected():
+                    conn.update_ui_status(0)
+        if not connected:
+            self.cancelTimer()
@@ -19,19 +19,48 @@
 
 import os
 import re
-import sys
 import glob
+import logging
+import queue
 import threading
 import serial
 import serial.tools.list_ports
 import time
-import threading
-
-if ((sys.platform == 'linux') or (sys.platform =='linux2')):
-    import termios
+from .SerialReader import MAX_FRAME_SIZE
+from .Crc16 import crc16
+from . import Protocol
+from . import Tracing
+from . import SensorConfig
+from . import BinaryCodec
+from . import Pipeline
+from .Lanes import CommandGate, LaneStats, commandLane, LANE_NAMES, LANE_SAFETY, SAFETY_DEADLINE
+from . import Retry
+from .SensorStore import SensorStore
+from . import PollScheduler
+from .PortProber import PortProber
+
+PROBE_TIMEOUT = 20.0 # Time (s) for the MCU to boot and answer
+FEATURE_QUERY_TIMEOUT = 0.5 # Time (s) waiting for the <R7> answer. Firmwares without the capability query may not answer.
+
+REJECTED = "Rejected" # check_answer: the MCU doesn't know the command
+RX_IDLE = 0.2 # An answer still arriving (bytes in the last RX_IDLE s) gets more time, up to the MAX_FRAME_SIZE transfer time
+
+# Connection states. Sent to the UI on connectionUpdate messages.
+STATE_DISCONNECTED = "Disconnected"
+STATE_WAITING_PRINTER = "Waiting printer"
+STATE_PROBING = "Probing ports"
+STATE_RECONNECTING_PRINTER = "Reconnecting printer"
+STATE_HANDSHAKING = "Handshaking"
+STATE_CONNECTED = "Connected"
+STATE_FAILED = "Failed"
+CONNECTING_STATES = (STATE_WAITING_PRINTER, STATE_PROBING, STATE_RECONNECTING_PRINTER, STATE_HANDSHAKING)
+
+# Log level of the terminal line types that only go to the terminal and the console log
+TERMINAL_LOG_LEVELS = {"debug": logging.DEBUG, "send": logging.DEBUG, "recv": logging.DEBUG, "info": logging.INFO}
 
 class Connection():
-    def __init__(self, plugin, waitPrinter):
+    # Connection to one Safety Printer board (see BoardManager.py)
+    def __init__(self, plugin, board):
 
         self.compatibleFirmwareCommProtocol = ["6"]
         self.reducedComm = False;
@@ -42,30 +71,41 @@ class Connection():
         self._connected = False
         self.lastConnected = False
         self.serialConn = None
+        self.reader = None
+        self.responseTimeout = 1.0 # MCU usually answers in a few ms. 
         self.connectedPort = ""
-        self.waitingResponse = threading.Lock()
+        self.baudRate = 0
+        self.lastFrameSize = 0
+        self.statusFrameSize = 0
+        self.pushMode = False # MCU sends status frames by itself
+        self.pushRequested = False
+        self.pushedFrames = queue.Queue() # (time received, frame)
+        self.frameRxTime = 0.0 # time.monotonic() when the last frame was received (trip tracing)
+        self.lastPushTime = 0
+        self.lastStatusFrame = ""
+        self.binaryMode = False # MCU answers in binary frames (BinaryCodec.py)
+        self.binaryRequested = False
+        self.waitingResponse = CommandGate() # Serial port access by priority lane (strict mode)
+        self.laneStats = [LaneStats() for _ in LANE_NAMES] # Each send_command call, by lane
+        self.safetyStats = LaneStats() # Safety commands, from the request to the MCU answer (retries included)
+        self.commandStats = {} # Retry.AttemptStats by command ID
+        self.writeLock = threading.Lock()
+        self.configLock = threading.Lock() # One sensor configuration batch at a time
+        self.pipeline = None # Pipeline.Pipeline when several commands may be in flight
         self.totalmsgs = 0
         self.badmsgs = 0
         self.connFail = False
         self.abortSerialConn = False
+        self.prober = None
+        self.state = STATE_DISCONNECTED
+        self.printerReconnect = None
 
         # Arrays for sensor status:
-        self.interlockStatus = "F"
-        self.resetInhibit = "F"
+        self.interlockStatus = False
+        self.resetInhibit = False
         self.tripReseted = False
         self.tripMsgcount = 0
-        self.sensorLabel = []
-        self.sensorEnabled = []
-        self.sensorActive = []
-        self.sensorActualValue = []
-        self.sensorType = []
-        self.sensorSP = []
-        self.sensorTimer = []
-        self.sensorForceDisable = []
-        self.sensorTrigger = []
-        self.sensorLowSP = []
-        self.sensorHighSP = []
-        self.sensorAlreadyNotifiedAlarm = []
+        self.sensors = SensorStore()
         
         self.totalSensorsInitial = 0
         self.totalSensors = 0
@@ -74,10 +114,10 @@ class Connection():
         self.settingsVisible = False
 
         # Board warnings
-        self.memWarning = "F"
-        self.execWarning = "F"
-        self.tempWarning = "F"
-        self.voltWarning = "F"
+        self.memWarning = False
+        self.execWarning = False
+        self.tempWarning = False
+        self.voltWarning = False
 
         # Plug-in shortcuts
         #self._console_logger = plugin._logger #Change logger to octoprit.log - for debug only
@@ -88,6 +128,19 @@ class Connection():
         self._plugin_manager = plugin._plugin_manager
         self._identifier = plugin._identifier
         self._settings = plugin._settings
+        self.settingsCache = plugin.settingsCache
+        self.portInventory = plugin.portInventory
+        self.terminalBuffer = plugin.terminalBuffer
+        self.boardManager = plugin.boards
+        self.serialMux = plugin.serialMux
+
+        # Board
+        self.boardId = board.id
+        self.boardPort = board.port # None: serialport setting
+        self.outbox = board.outbox # Adds the board ID to the messages
+        self.history = board.history
+        self.metrics = board.metrics # Link metrics of the board, served on /metrics
+        self.tracer = plugin.tracer # Trip and alarm reaction traces (/traces)
 
         #Firmware info
         self.FWVersion = ""
@@ -108,185 +161,237 @@ class Connection():
             self.push_notification_Printoid = helpers["fcm_notification"]
         '''
         
-        self.connect(waitPrinter)        
-
     # *******************************  Functions to deal with Serial connections
 
     def connect(self, waitPrinter):
-        # Connects to Safety Printer Arduino through serial port
+        # Connects to Safety Printer Arduino through serial port.
+        # State machine: each step returns the next state. Runs on its own thread (see SafetyPrinterPlugin.new_connection).
         self.connFail = False
         self.abortSerialConn = False
         self.terminal("Connecting...","Info")
 
-        if waitPrinter:
-            i = 0
-            while not self._printer.is_operational(): # Wait for printer
-                        i += 1                    
-                        time.sleep(1)
-                        self.terminal("Waiting Printer...","Info")
-                        if i > 30:
-                            self.terminal("Waiting printer time out.","Info")
-                            self.connFail = True
-                            self.update_ui_connection_status()
-                            return
-            self.terminal("Printer is operational, resuming...","Info")
-
-        if (self._settings.get(["serialport"]) != "AUTO"):
-            self.ports.append(self._settings.get(["serialport"]))
-            self.terminal("User selected port: %s" % self.ports,"Info")
+        steps = {
+            STATE_WAITING_PRINTER: self.wait_printer,
+            STATE_PROBING: self.probe_ports,
+            STATE_RECONNECTING_PRINTER: self.reconnect_printer,
+            STATE_HANDSHAKING: self.handshake,
+        }
+        state = STATE_WAITING_PRINTER if waitPrinter else STATE_PROBING
+        while state in steps:
+            if self.abortSerialConn:
+                state = STATE_FAILED
+                break
+            self.set_state(state)
+            state = steps[state]()
+        self.set_state(state)
+
+    def set_state(self, state):
+        # Reports connection progress to the UI
+        self.state = state
+        if state == STATE_CONNECTED:
+            self.metrics.linkUp()
+        if state == STATE_FAILED:
+            self.connFail = True
+            self.forceRenewConn = True
+            self.update_ui_connection_status()
+        else:
+            self.outbox.send(self.connection_message())
+
+    def wait_printer(self):
+        i = 0
+        while not self._printer.is_operational(): # Wait for printer
+            i += 1                    
+            time.sleep(1)
+            self.terminal("Waiting Printer...","Info")
+            if self.abortSerialConn:
+                return STATE_FAILED
+            if i > 30:
+                self.terminal("Waiting printer time out.","Info")
+                return STATE_FAILED
+        self.terminal("Printer is operational, resuming...","Info")
+        return STATE_PROBING
+
+    def serialPort(self):
+        # Port of this board: from the board list or, for the primary board, the serialport setting
+        return self.boardPort or self.settingsCache.current.serialport
+
+    def probe_ports(self):
+        settings = self.settingsCache.current
+        serialport = self.serialPort()
+        if (serialport != "AUTO"):
+            self.ports = [serialport]
+            self.terminal("User selected port: %s","Info",self.ports)
         else:
             if (self._printer.get_current_connection()[1] == None):
-                self.forceRenewConn = True
-                self.connFail = True
                 self.terminal("Can't connect on AUTO serial port if printer is not connected. Aborting Safety Printer MCU connection.","WARNING")
-                self.update_ui_connection_status()
-                return
+                return STATE_FAILED
             else:
-                self.ports = self.getAllPorts()
-                self.terminal("Potential ports: %s" % self.ports,"Info")
+                claimed = self.boardManager.claimedPorts(self)
+                self.ports = [port for port in self.getAllPorts() if port not in claimed]
+                self.terminal("Potential ports: %s","Info",self.ports)
 
-        reconnect = None
+        self.printerReconnect = None
         if self._printer.is_operational():
             # if an arduino nano or uno is used without the capacitor, it will reset upon connection, resseting the printer also.
             _, current_port, current_baudrate, current_profile = self._printer.get_current_connection()
-            reconnect = (current_port, current_baudrate, current_profile)
-            self.terminal("Printer is operational: port={}, baudrate={}, profile={}".format(current_port, current_baudrate, current_profile),"Info")
-
-        if len(self.ports) > 0:
-            for port in self.ports:
-                
-                if ((not self._connected) and ((self._settings.get(["serialport"]) == "AUTO") or (self._settings.get(["serialport"]) == port))):
-                    if self.isPrinterPort(port,True):
-                        #self._console_logger.info("Skipping Printer Port:" + port)
-                        self.terminal("Skipping Printer Port:" + port,"Info")
-                        if (self._settings.get(["serialport"]) == port):
-                            self.terminal("Selected port is Printer Port. Please change it in settings:" + port,"WARNING")
-                    else:
-                        try:
-                            self.terminal("Selected BAUD Rate:" + self._settings.get(["BAUDRate"]),"Info")
-                            self.serialConn = serial.Serial(port, self._settings.get(["BAUDRate"]), timeout=0.5) #115200, timeout=0.5)
-                            self._connected = True
-                            self.connectedPort = port
-                            self.terminal("Connected to: " + port,"Info")
-                        except serial.SerialException as e:
-                            self.forceRenewConn = True
-                            self.connFail = True
-                            self.terminal("Safety Printer MCU connection error: " + str(e),"ERROR")
-                            self.update_ui_connection_status()
-                        except TypeError:
-                            self.forceRenewConn = True
-                            self.connFail = True
-                            self._connected = False
-                            self.connectedPort = ""
-                            self.terminal("Safety Printer MCU connection error: Invalid selected port.","ERROR")
-                            self.update_ui_connection_status()
-
-
-            if not self._connected:
-                self.forceRenewConn = True
-                self.connFail = True
-                self.terminal("Couldn't connect on any port.","WARNING")
-                self.update_ui_connection_status()
-            else:
-                responseStr = "" #self.serialConn.readline().decode()
-                i = 0
+            self.printerReconnect = (current_port, current_baudrate, current_profile)
+            self.terminal("Printer is operational: port=%s, baudrate=%s, profile=%s","Info",current_port, current_baudrate, current_profile)
 
-                self.serialConn.flush()
-                self.serialConn.write("<R6>".encode())
+        if len(self.ports) == 0:
+            self.terminal("No serial ports found.","WARNING")
+            return STATE_FAILED
 
-                try:
-                    while responseStr.find("R6: Safety Printer MCU") == -1: # Wait for arduino boot and answer
-                        i += 1                    
-                        time.sleep(0.50)
-                        self.terminal("Waiting Safety Printer MCU answer...","Info")
-                        responseStr = self.serialConn.readline().decode() 
-                        if responseStr:
-                            self.terminal(responseStr,"Info")   
-                        if i > 40:
-                            self.forceRenewConn = True
-                            self.connFail = True
-                            self.terminal("Safety Printer MCU connection error: No answer.","ERROR")
-                            self.closeConnection()
-                            return
-                except UnicodeDecodeError as e: #serial.SerialTimeoutException as e:
-                    self.forceRenewConn = True
-                    self.connFail = True
-                    self.terminal("Safety Printer MCU connection error: " + str(e),"ERROR")
-                    self.closeConnection()
-
-                finally:
-                    if (reconnect is not None) and (not self._printer.is_operational()):
-                        # if printer was connected and now isn't (due to arduino reboot), reconnect
-                        self.terminal("Waiting for printer boot (10s).","Info")
-                        time.sleep(10.00)
-                        port, baudrate, profile = reconnect
-                        self.terminal("Reconnecting to printer: port={}, baudrate={}, profile={}".format(port, baudrate, profile),"Info")
-                        self._printer.connect(port=port, baudrate=baudrate, profile=profile)
-
-                self.terminal("Safety Printer MCU connected.","Info")
-                self.totalmsgs = 0
-                self.badmsgs = 0
-
-                responseStr = self.newSerialCommand("<R4>",10, False)
-                if ((responseStr) and (responseStr != "Error")):
-                    vpos1 = responseStr.find(':',0)
-                    vpos2 = responseStr.find(',',vpos1)
-                    self.FWVersion = responseStr[vpos1+1:vpos2]
-                    vpos1 = vpos2 + 1
-                    vpos2 = responseStr.find(',',vpos1)
-                    self.FWReleaseDate = responseStr[vpos1:vpos2]
-                    vpos1 = vpos2 + 1
-                    vpos2 = responseStr.find(',',vpos1)
-                    self.FWEEPROM = responseStr[vpos1:vpos2]
-                    vpos1 = vpos2 + 1
-                    vpos2 = responseStr.find(',',vpos1)
-                    self.FWCommProtocol = responseStr[vpos1:vpos2]
-                    vpos1 = vpos2 + 1
-                    vpos2 = responseStr.find(',',vpos1)
-                    self.FWBoardType = responseStr[vpos1:vpos2]
-
-
-                    self.FWValidVersion = False
-                    for version in self.compatibleFirmwareCommProtocol:
-                        if version == self.FWCommProtocol:
-                            self.FWValidVersion = True
-
-                    if self.FWValidVersion:
-                        self.forceRenewConn = True
-                        if self._settings.get_boolean(["forceRedComm"]):
-                            self.reducedComm = True
-                        else:
-                            self.reducedComm = False
-                        self.update_ui_connection_status()
-                    else:
-                        self.forceRenewConn = True
-                        self.terminal("Invalid firmware comunication protocol version: " + self.FWCommProtocol + ". Communication will be reduced to essentials and no configuration is allowed. It's highly recommended to update this plugin and/or safety printer MCU firmware.","WARNING")
-                        self.reducedComm = True
+        candidates = []
+        snapshot = self.portInventory.snapshot()
+        for port in self.ports:
+            if ((serialport == "AUTO") or (serialport == port)):
+                if self.isPrinterPort(port,True,snapshot):
+                    #self._console_logger.info("Skipping Printer Port:" + port)
+                    self.terminal("Skipping Printer Port:%s","Info",port)
+                    if (serialport == port):
+                        self.terminal("Selected port is Printer Port. Please change it in settings:" + port,"WARNING")
                 else:
-                    self.forceRenewConn = True
-                    self.connFail = True
-                    self.terminal("Connected but no valid response.","ERROR")
-                    self.closeConnection()
+                    candidates.append(port)
+
+        if candidates:
+            # All candidate ports are probed at the same time. The first one to answer the MCU banner wins.
+            self.terminal("Selected BAUD Rate:%s","Info",settings.BAUDRate)
+            self.terminal("Probing port(s): %s","Info",candidates)
+            self.prober = PortProber(candidates, settings.BAUDRate, PROBE_TIMEOUT, self.terminal, self.serialMux)
+            found = self.prober.run()
+            self.prober = None
+            if found and not self.abortSerialConn:
+                self.connectedPort, self.serialConn, self.reader = found
+                self.baudRate = self.serialConn.baudrate
+                self.reader.onError = self.on_reader_error
+                self.reader.onFrame = self.on_frame
+                self._connected = True
+                self.terminal("Connected to: %s","Info",self.connectedPort)
+            elif found:
+                _, serialConn, reader = found
+                reader.stop()
+                serialConn.close()
+                reader.wait()
+
+        if (self.printerReconnect is not None) and (not self._printer.is_operational()):
+            return STATE_RECONNECTING_PRINTER
+        return self.after_probe()
+
+    def after_probe(self):
+        if not self._connected:
+            self.terminal("Couldn't connect on any port.","WARNING")
+            return STATE_FAILED
+        return STATE_HANDSHAKING
+
+    def reconnect_printer(self):
+        # if printer was connected and now isn't (due to arduino reboot), reconnect
+        self.terminal("Waiting for printer boot (10s).","Info")
+        for i in range(10):
+            time.sleep(1)
+            if self.abortSerialConn:
+                return STATE_FAILED
+        port, baudrate, profile = self.printerReconnect
+        self.terminal("Reconnecting to printer: port=%s, baudrate=%s, profile=%s","Info",port, baudrate, profile)
+        self._printer.connect(port=port, baudrate=baudrate, profile=profile)
+        return self.after_probe()
+
+    def handshake(self):
+        self.terminal("Safety Printer MCU connected.","Info")
+        self.totalmsgs = 0
+        self.badmsgs = 0
+
+        firmwareInfo = None
+        responseStr = self.newSerialCommand("<R4>",10, False)
+        if ((responseStr) and (responseStr != "Error")):
+            try:
+                firmwareInfo = Protocol.parseFirmwareInfo(responseStr)
+            except Protocol.ProtocolError as e:
+                self.terminal("connect:%s","DEBUG",e)
+
+        if not firmwareInfo:
+            self.terminal("Connected but no valid response.","ERROR")
+            self.closeConnection()
+            return STATE_FAILED
 
+        self.FWVersion = firmwareInfo.version
+        self.FWReleaseDate = firmwareInfo.releaseDate
+        self.FWEEPROM = firmwareInfo.EEPROM
+        self.FWCommProtocol = firmwareInfo.commProtocol
+        self.FWBoardType = firmwareInfo.boardType
+
+        self.FWValidVersion = False
+        for version in self.compatibleFirmwareCommProtocol:
+            if version == self.FWCommProtocol:
+                self.FWValidVersion = True
+
+        self.forceRenewConn = True
+        if self.FWValidVersion:
+            if self.settingsCache.current.forceRedComm:
+                self.reducedComm = True
+            else:
+                self.reducedComm = False
+                features = self.query_features()
+                if "binary" in features:
+                    self.enable_binary()
+                if "pipeline" in features:
+                    self.enable_pipeline()
+                if "push" in features:
+                    self.enable_push()
         else:
-            self.forceRenewConn = True
-            self.connFail = True
-            self.terminal("No serial ports found.","WARNING")
-            self.update_ui_connection_status()
+            self.terminal("Invalid firmware comunication protocol version: " + self.FWCommProtocol + ". Communication will be reduced to essentials and no configuration is allowed. It's highly recommended to update this plugin and/or safety printer MCU firmware.","WARNING")
+            self.reducedComm = True
+        self.update_ui_connection_status()
+        return STATE_CONNECTED
 
     def closeConnection(self):
         # Disconnects Safety Printer Arduino
+        if self.prober:
+            self.prober.cancel()
         if self._connected:
+            self.revert_modes()
+            self._connected = False
+            self.pushMode = False
+            self.metrics.linkDown()
+            self.binaryMode = False
+            if self.pipeline:
+                self.pipeline.cancelAll()
+                self.pipeline = None
+            if self.reader:
+                self.reader.stop()
             self.serialConn.close()
             self.serialConn.__del__()
-            self._connected = False
+            if self.reader:
+                self.reader.wait()
+                self.reader = None # Frames nobody read go with it
+            self.pushedFrames = queue.Queue()
             self.terminal("Safety Printer MCU connection closed.","Info")
+            if self.state == STATE_CONNECTED:
+                self.state = STATE_DISCONNECTED
             self.update_ui_connection_status()
         else :
             self._connected = False
             self.terminal("Safety Printer MCU not connected.","Info")
             self.update_ui_connection_status()
 
+    def revert_modes(self):
+        # Turns the negotiated modes off, so the next connection starts with text frames and polling. The answers aren't
+        # waited for. If the port already failed, the MCU resets the modes when DTR drops (see Protocol.py).
+        commands = []
+        if self.pushMode:
+            commands.append("<S1 off>")
+        if self.pipeline:
+            commands.append("<S3 off>")
+        if self.binaryMode:
+            commands.append("<S2 off>")
+        if commands:
+            try:
+                with self.writeLock:
+                    self.terminal("".join(commands), "Send")
+                    self.serialConn.write("".join(commands).encode())
+                    self.serialConn.flush()
+            except (serial.SerialException, OSError, AttributeError):
+                pass
+
     # below code "stolen" from https://gitlab.com/mosaic-mfg/palette-2-plugin/blob/master/octoprint_palette2/Omega.py
     #| Chip                | VID  | PID                      | Board                           | Link                                                                     | Note  
     #| Atmel ATMEGA16U2    | 2341 | 003D,003F,0042,0043,0044 | UNO, MEGA2560, ADK, DUE, clones | Included in Arduino software under drivers                               |  
@@ -298,87 +403,58 @@ class Connection():
     # Source: https://forum.arduino.cc/t/help-me-confirm-some-vid-pid-and-comments-for-an-intall-tutorial/339586
 
     def getAllPorts(self):
-        baselist = []
-        
-        arduinoVIDPID = ['.*2341:003D.*','.*2341:003F.*','.*2341:0042.*','.*2341:0043.*','.*2341:0044.*','.*0403:6001.*','.*0403:6015.*','.*1A86:5523.*','.*1A86:7523.*','.*2341:8036.*']
-
-        '''
-        if 'win32' in sys.platform:
-            # use windows com stuff
-            self._console_logger.info("Using a Windows machine") 
-
-            for arduino in arduinoVIDPID:
-                for port in serial.tools.list_ports.grep(arduino):
-                    self._console_logger.info("got port %s" % port.device)
-                    baselist.append(port.device)
-        else:
-            baselist = baselist + glob.glob('/dev/serial/by-id/*FTDI*') + glob.glob('/dev/*usbserial*') + glob.glob(
-                '/dev/*usbmodem*') + glob.glob('/dev/serial/by-id/*USB_Serial*') + glob.glob('/dev/serial/by-id/usb-*')
-            baselist = self.getRealPaths(baselist)
-
-            for arduino in arduinoVIDPID:
-                for port in baselist:
-                    if port == serial.tools.list_ports.ListPortInfo
-                    baselistfiltered.append(port)'''
-        
-        #Works for linux and windows:
-        for arduino in arduinoVIDPID:
-            for port in serial.tools.list_ports.grep(arduino):
-                self._console_logger.info("Arduino port: %s" % port.device)
-                baselist.append(port.device)
-
-        # get unique values only
-        baselist = list(set(baselist))  
-        return baselist
+        # Arduino ports (see PortInventory.ARDUINO_VIDPID). Cached until a device is plugged or unplugged.
+        return list(self.portInventory.snapshot().arduinoPorts)
 
     def getRealPaths(self, ports):
-        self._console_logger.info("Paths: %s" % ports)
+        self._console_logger.info("Paths: %s", ports)
         for index, port in enumerate(ports):
             port = os.path.realpath(port)
             ports[index] = port
         return ports
 
-    def isPrinterPort(self, selected_port, loggin):
-        try:             
-            selected_port = os.path.realpath(selected_port)
-        except TypeError:
+    def isPrinterPort(self, selected_port, loggin, snapshot=None):
+        if snapshot is None:
+            snapshot = self.portInventory.snapshot()
+        selected_path = snapshot.realpath(selected_port)
+        if selected_path is None:
             self._console_logger.info("Selected port does not exists.")
             return False
 
-        #printer_port = self._printer.get_current_connection()[1]
-        if loggin:
-            self._console_logger.info("Printer Connection Status: %s" %self._printer.get_current_connection()[0])
-
-        if self._printer.get_current_connection()[0] == "Closed" or not self._printer.is_operational():
+        if snapshot.printerPort is None:
             if loggin:
                 self._console_logger.info("No printer connected.")
             return False
 
-        printer_port = os.path.realpath(self._printer.get_current_connection()[1])
-                
         if loggin:
-            self._console_logger.info("Trying port: %s" % selected_port)
-            self._console_logger.info("Printer port: %s" % self._printer.get_current_connection()[1])
-            self._console_logger.info("Printer port path: %s" % printer_port)
-        # because ports usually have a second available one (.tty or .cu)
-        printer_port_alt = ""
-        if printer_port is None:
-            return False
-        else:
-            if "tty." in printer_port:
-                printer_port_alt = printer_port.replace("tty.", "cu.", 1)
-            elif "cu." in printer_port:
-                printer_port_alt = printer_port.replace("cu.", "tty.", 1)
-            if loggin:
-                self._console_logger.info("Printer port alt: %s" % printer_port_alt)
-            if selected_port == printer_port or selected_port == printer_port_alt:
-                return True
-            else:
-                return False
+            self._console_logger.info("Trying port: %s", selected_path)
+            self._console_logger.info("Printer port: %s", snapshot.printerPort)
+            self._console_logger.info("Printer port path: %s", sorted(snapshot.printerPaths))
+        return snapshot.isPrinterPort(selected_port)
 
     def is_connected(self):
         return self._connected
 
+    def alarmActive(self):
+        # True if the interlock is tripped or any sensor is in alarm
+        return self.interlockStatus or self.sensors.anyActive()
+
+    def statusWireTime(self):
+        # Time (s) to transfer one <R1> command and its answer at the current BAUD rate
+        if not self.baudRate:
+            return 0
+        return (len("<R1>") + self.statusFrameSize) * PollScheduler.BITS_PER_BYTE / self.baudRate
+
+    def maxFrameTime(self):
+        # Time (s) to transfer the biggest frame at the current BAUD rate
+        if not self.baudRate:
+            return 0
+        return MAX_FRAME_SIZE * PollScheduler.BITS_PER_BYTE / self.baudRate
+
+    def receiving(self):
+        reader = self.reader
+        return (reader is not None) and (time.monotonic() - reader.lastRxTime < RX_IDLE)
+
     def resetTrip(self):
         self.tripReseted = True
         self.tripMsgcount = 0
@@ -386,141 +462,354 @@ class Connection():
     # *******************************  Functions to update info on knockout interface
 
     def update_ui_ports(self):
-        # Send one message for each serial port detected
-        self.ports = self.getAllPorts()
-        for port in self.ports:
-            if not self.isPrinterPort(port,True):
-                self._plugin_manager.send_plugin_message(self._identifier, {"type": "serialPortsUI", "port": port})
+        # Send one message for each serial port detected (delivered together in one batch)
+        snapshot = self.portInventory.snapshot()
+        self.ports = list(snapshot.arduinoPorts)
+        with self.outbox.batch():
+            for port in self.ports:
+                if not snapshot.isPrinterPort(port):
+                    self.outbox.send({"type": "serialPortsUI", "port": port})
 
-    def update_ui_status(self):
+    def update_ui_status(self, pushWait=1.0):
         # Send one message for each sensor with all status
+        # pushWait: time (s) waiting for status frames in push mode (BoardManager waits for all the boards at once)
         if self._connected and not self.reducedComm:            
             
-            if (len(self.sensorLabel) == 0):
+            if (self.sensors.size == 0):
                 self.update_ui_sensor_labels()
+
+            if self.pushMode:
+                self.receive_pushed_status(pushWait)
+                return
             
             responseStr = self.send_command("<R1>",10) 
+            checked = time.monotonic()
 
-            if ((responseStr == "Error") or (not(isinstance(responseStr, str)))):
+            if ((responseStr == "Error") or (not(isinstance(responseStr, (str, Protocol.StatusFrame))))):
                 return
 
-            numhash = responseStr.count('#')
-            totalSensors = int(numhash)
+            self.statusFrameSize = self.lastFrameSize
+            self.update_status(responseStr, [(Tracing.STAGE_RECEIVED, min(self.frameRxTime, checked)), (Tracing.STAGE_CHECKED, checked)])
+        else :
+            self.update_ui_connection_status()
 
-            if totalSensors != self.totalSensorsInitial:
-                self.sensorLabel = []
+    def update_status(self, responseStr, stages=None):
+        # Updates local status from a <R1> answer (polled or pushed, text or already decoded binary frame) and sends the changes to the UI
+        # stages: frame timestamps for the trip and alarm traces (see Tracing.py)
+        if isinstance(responseStr, Protocol.StatusFrame):
+            status = responseStr
+        else:
+            try:
+                status = Protocol.parseStatus(responseStr)
+            except Protocol.ProtocolError as e:
+                self.terminal("update_ui_status:%s","DEBUG",e)
                 return
+        stages = list(stages or ())
+        stages.append((Tracing.STAGE_PARSED, time.monotonic()))
+
+        totalSensors = len(status.sensors)
+
+        if totalSensors != self.totalSensorsInitial:
+            # Sensor list changed. Reload it on next update.
+            self.sensors.resize(0)
+            return
 
-            vpos1 = 3
-            buffer = self.interlockStatus
-            self.interlockStatus = responseStr[vpos1] 
-            if self.tripReseted:
-                #wait 5 msgs after trip reset to consider a new trip if there is no change (user reseted with an alarm)
-                self.tripMsgcount += 1
-
-            # Prevent tripMsgCount overflow 
-            if self.tripMsgcount > 10:
-                self.tripMsgcount = 5 
-
-            if ((self.interlockStatus != buffer) or (self.forceRenew) or (self.tripMsgcount > 5)):
-                self.tripReseted = False
-                self.tripMsgcount = 0
-                if (self.interlockStatus == "T"):
-                    self.terminal("New INTERLOCK detected.","TRIP")
-                self._plugin_manager.send_plugin_message(self._identifier, {"type": "interlockUpdate", "interlockStatus": self.interlockStatus})
-
-            buffer = self.resetInhibit
-            vpos1 = vpos1 + 2
-            self.resetInhibit = responseStr[vpos1] 
-            if ((self.resetInhibit != buffer) or (self.forceRenew)) and (self.resetInhibit == "T"):
-                self.terminal("Reset button inhibited due to continous operation. Check wiring.","WARNING")
-
-            buffer = self.memWarning
-            vpos1 = vpos1 + 2
-            self.memWarning = responseStr[vpos1] 
-            if ((self.memWarning != buffer) or (self.forceRenew)) and (self.memWarning == "T"):
-                self.terminal("SafetyPrinter MCU low memory.","WARNING")
-
-            buffer = self.execWarning
-            vpos1 = vpos1 + 2
-            self.execWarning = responseStr[vpos1] 
-            if ((self.execWarning != buffer) or (self.forceRenew)) and (self.execWarning == "T"):
-                self.terminal("SafetyPrinter MCU high update cycle time.","WARNING")
-
-            buffer = self.tempWarning
-            vpos1 = vpos1 + 2
-            self.tempWarning = responseStr[vpos1]            
-            if ((self.tempWarning != buffer) or (self.forceRenew)) and (self.tempWarning == "T"):
-                if self._settings.get_boolean(["notifyVoltageTemp"]):
-                    self.terminal("SafetyPrinter MCU board temperature out of safe limits.","WARNING")
-
-            buffer = self.voltWarning
-            vpos1 = vpos1 + 2
-            self.voltWarning = responseStr[vpos1]           
-            if ((self.voltWarning != buffer) or (self.forceRenew)) and (self.voltWarning == "T"):
-                if self._settings.get_boolean(["notifyVoltageTemp"]):
-                    self.terminal("SafetyPrinter MCU board suply voltage out of safe limits.","WARNING")
-
-            lastWarningStatus = self.warningStatus
+        header = status.header
+        try:
+            self.history.append(time.time(), header, status.sensors)
+        except (OSError, ValueError) as e:
+            self.terminal("Sensor history not recorded: %s","DEBUG",e)
+
+        buffer = self.interlockStatus
+        self.interlockStatus = header.interlock
+        if self.tripReseted:
+            #wait 5 msgs after trip reset to consider a new trip if there is no change (user reseted with an alarm)
+            self.tripMsgcount += 1
+
+        # Prevent tripMsgCount overflow 
+        if self.tripMsgcount > 10:
+            self.tripMsgcount = 5 
+
+        if ((self.interlockStatus != buffer) or (self.forceRenew) or (self.tripMsgcount > 5)):
+            tripTrace = None
+            if self.interlockStatus and ((self.interlockStatus != buffer) or (self.tripMsgcount > 5)):
+                tripTrace = self.tracer.start("trip", self.boardId, "", stages)
+            self.tripReseted = False
+            self.tripMsgcount = 0
+            if (self.interlockStatus):
+                self.terminal("New INTERLOCK detected.","TRIP")
+            self.outbox.send({"type": "interlockUpdate", "interlockStatus": self.interlockStatus})
+            if tripTrace is not None:
+                tripTrace.mark(Tracing.STAGE_NOTIFIED)
+                self.outbox.afterSend(lambda trace=tripTrace: self.tracer.finish(trace))
+
+        buffer = self.resetInhibit
+        self.resetInhibit = header.resetInhibit
+        if ((self.resetInhibit != buffer) or (self.forceRenew)) and (self.resetInhibit):
+            self.terminal("Reset button inhibited due to continous operation. Check wiring.","WARNING")
+
+        buffer = self.memWarning
+        self.memWarning = header.memWarning
+        if ((self.memWarning != buffer) or (self.forceRenew)) and (self.memWarning):
+            self.terminal("SafetyPrinter MCU low memory.","WARNING")
+
+        buffer = self.execWarning
+        self.execWarning = header.execWarning
+        if ((self.execWarning != buffer) or (self.forceRenew)) and (self.execWarning):
+            self.terminal("SafetyPrinter MCU high update cycle time.","WARNING")
+
+        buffer = self.tempWarning
+        self.tempWarning = header.tempWarning
+        if ((self.tempWarning != buffer) or (self.forceRenew)) and (self.tempWarning):
+            if self.settingsCache.current.notifyVoltageTemp:
+                self.terminal("SafetyPrinter MCU board temperature out of safe limits.","WARNING")
+
+        buffer = self.voltWarning
+        self.voltWarning = header.voltWarning
+        if ((self.voltWarning != buffer) or (self.forceRenew)) and (self.voltWarning):
+            if self.settingsCache.current.notifyVoltageTemp:
+                self.terminal("SafetyPrinter MCU board suply voltage out of safe limits.","WARNING")
+
+        lastWarningStatus = self.warningStatus
+        self.warningStatus = False
+        if ((self.resetInhibit) or (self.memWarning) or (self.execWarning) or (self.settingsCache.current.notifyVoltageTemp and ((self.tempWarning) or (self.voltWarning)))):
+            self.warningStatus = True
+
+        if ((not self.warningStatus) and (lastWarningStatus)):
             self.warningStatus = False
-            if ((self.resetInhibit == "T") or (self.memWarning == "T") or (self.execWarning == "T") or (self._settings.get_boolean(["notifyVoltageTemp"]) and ((self.tempWarning == "T") or (self.voltWarning == "T")))):
-                self.warningStatus = True
+            self.outbox.send({"type": "warningClear"})
+
+        sensors = self.sensors
+        if self.forceRenew:
+            sensors.markAllDirty()
+
+        for sensor in status.sensors:
+            index = sensor.index
+            if (index >= 0 and index < totalSensors):
+                sensors.setStatus(index, sensor)
+
+        for index in sensors.dirtySensors():   #avoid sending multiple msgs
+            changes = sensors.popChanges(index)
+            message = {"type": "statusUpdate", "sensorIndex": index, "totalSensors": totalSensors}
+            for name, value in changes.items():
+                message["sensor" + name[0].upper() + name[1:]] = value
+            self.outbox.send(message)
+
+            active = sensors.get("active", index)
+            if (active and not sensors.alarmNotified[index]):
+                sensors.alarmNotified[index] = True
+                if (sensors.get("enabled", index)):
+                    alarmTrace = self.tracer.start("alarm", self.boardId, sensors.get("label", index), stages)
+                    self.terminal("New Alarm detected: "+ sensors.get("label", index) + " (" + str(sensors.get("actualValue", index))+ ")","ALARM")
+                    alarmTrace.mark(Tracing.STAGE_NOTIFIED)
+                    self.outbox.afterSend(lambda trace=alarmTrace: self.tracer.finish(trace))
+                else :
+                    self.terminal("New Alarm detected (disabled sensor): %s (%s)","INFO",sensors.get("label", index),sensors.get("actualValue", index))                        
+            elif (not active):
+                sensors.alarmNotified[index] = False
+
+        if (self.forceRenew): # send all msgs again to update UI
+            self.forceRenew = False
+
+    # *******************************  Batch sensor configuration
+
+    def configure_sensors(self, changes, save=True):
+        # Applies a batch of sensor changes (see SensorConfig.py) as one sequence and saves them with a single <C5>.
+        # Nothing is sent if a change is invalid. If the MCU doesn't answer, or CONFIG_DEADLINE expires, the next changes
+        # are skipped and nothing is saved: the EEPROM keeps the previous configuration. Raises ValueError if changes isn't
+        # a list of objects.
+        items, valid = SensorConfig.parseChanges(changes, self.sensors)
+        failed = not valid
+        saved = False
+        error = None
+        saveError = None
+        with self.configLock:
+            deadline = time.monotonic() + SensorConfig.CONFIG_DEADLINE
+            for item in items:
+                if item.status is not None:
+                    continue
+                if failed:
+                    item.fail(SensorConfig.STATUS_SKIPPED, error)
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    error = SensorConfig.DEADLINE_EXPIRED
+                    item.fail(SensorConfig.STATUS_SKIPPED, error)
+                    failed = True
+                    continue
+                responseStr = self.newSerialCommand(item.command(), remaining, False)
+                if ((responseStr) and (responseStr != "Error")):
+                    item.status = SensorConfig.STATUS_OK
+                else:
+                    item.fail(SensorConfig.STATUS_FAILED, "Not answered by the Safety Printer MCU.")
+                    failed = True
+
+            changed = any(item.status == SensorConfig.STATUS_OK for item in items)
+            if save and changed and not failed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    error = SensorConfig.DEADLINE_EXPIRED
+                    saveError = "Not saved (<C5> skipped): " + error
+                    failed = True
+                else:
+                    responseStr = self.newSerialCommand("<C5>", remaining, False)
+                    saved = bool((responseStr) and (responseStr != "Error"))
+                    failed = not saved
+
+        if valid:
+            applied = sum(item.status == SensorConfig.STATUS_OK for item in items)
+            if error:
+                self.terminal("Sensor configuration not saved: %d change(s) applied before the deadline expired." % applied, "WARNING")
+            elif failed:
+                self.terminal("Sensor configuration not saved: %d change(s) applied before the MCU stopped answering." % applied, "WARNING")
+            else:
+                self.terminal("Sensor configuration: %d change(s) applied%s.", "Info", applied, " and saved" if saved else "")
+        result = {"valid": valid, "ok": not failed, "saved": saved, "items": [item.asDict() for item in items]}
+        if saveError:
+            result["error"] = saveError
+        return result
+
+    # *******************************  Optional features
+
+    def query_features(self):
+        # Optional features reported by the MCU (<R7> capability query). Empty if the firmware doesn't know the query.
+        responseStr = self.send_command("<R7>", 10, answerTimeout=FEATURE_QUERY_TIMEOUT)
+        if ((responseStr) and (responseStr != "Error")):
+            try:
+                features = Protocol.parseFeatures(responseStr)
+                self.terminal("Safety Printer MCU features: %s.","Info",", ".join(features) if features else "none")
+                return features
+            except Protocol.ProtocolError as e:
+                self.terminal("query_features:%s","DEBUG",e)
+        self.terminal("Safety Printer MCU doesn't report optional features. Polling status with text frames.","Info")
+        return ()
+
+    # *******************************  Binary framing
+
+    def enable_binary(self):
+        # Asks the MCU to answer in binary frames. The reader switches as soon as the (ASCII) answer arrives (see on_frame).
+        self.binaryRequested = True
+        responseStr = self.send_command("<S2 on>",10)
+        self.binaryRequested = False
+        if ((responseStr) and (responseStr != "Error") and self.binaryMode):
+            self.terminal("Binary framing enabled.","Info")
+        else:
+            self.binaryMode = False
+            if self.reader:
+                self.reader.decoder = None
+            self.terminal("Safety Printer MCU refused binary framing. Using text frames.","Info")
 
-            if ((not self.warningStatus) and (lastWarningStatus)):
-                self.warningStatus = False
-                self._plugin_manager.send_plugin_message(self._identifier, {"type": "warningClear"})
+    def decode_binary(self, frame):
+        # Called by the serial reader thread for every binary frame. Returns str, Protocol.StatusFrame or None (bad frame).
+        self.totalmsgs += 1
+        try:
+            decoded = BinaryCodec.decodeFrame(frame)
+            self.metrics.frame(True)
+            return decoded
+        except Protocol.ProtocolError as e:
+            self.badmsgs += 1
+            self.metrics.frame(False)
+            self.terminal("decode_binary:%s","DEBUG",e)
+            return None
+
+    # *******************************  Pipelined commands
+
+    def enable_pipeline(self):
+        # Asks the MCU to accept several commands in flight, answered with their sequence numbers.
+        responseStr = self.send_command("<S3 on>",10)
+        if isinstance(responseStr, str) and Protocol.isModeOn(responseStr, "S3"):
+            self.pipeline = Pipeline.Pipeline()
+            self.terminal("Pipelined commands enabled (up to %d in flight).","Info",self.pipeline.window)
+        else:
+            self.terminal("Safety Printer MCU refused pipelined commands. One command at a time.","Info")
+
+    # *******************************  Status push mode
+
+    def enable_push(self):
+        # Asks the MCU to send status frames by itself. Keeps polling if the MCU doesn't agree.
+        # The first status is pushed right after the answer: it's queued even before the answer is handled.
+        self.pushMode = False
+        self.pushedFrames = queue.Queue()
+        self.pushRequested = True
+        responseStr = self.send_command("<S1 on>",10)
+        self.pushRequested = False
+        if isinstance(responseStr, str) and Protocol.isModeOn(responseStr, "S1"):
+            self.lastPushTime = time.monotonic()
+            self.pushMode = True
+            self.terminal("Status push mode enabled.","Info")
+        else:
+            self.pushedFrames = queue.Queue()
+            self.terminal("Safety Printer MCU refused status push mode. Polling status.","Info")
+
+    def on_frame(self, frame):
+        # Called by the serial reader thread for every frame. Pushed status frames go to their own queue.
+        self.frameRxTime = time.monotonic()
+        pipeline = self.pipeline
+        if pipeline:
+            seq, answer = Pipeline.untag(frame)
+            if seq is not None:
+                if not pipeline.deliver(seq, answer):
+                    self.terminal("on_frame:Late answer dropped: %s", "DEBUG", answer)
+                return True
+        pushing = self.pushMode or self.pushRequested
+        if isinstance(frame, Protocol.StatusFrame):
+            if pushing:
+                self.pushedFrames.put((self.frameRxTime, frame))
+                self.boardManager.pushEvent.set()
+                return True
+        elif pushing and Protocol.isStatusFrame(frame):
+            self.pushedFrames.put((self.frameRxTime, frame))
+            self.boardManager.pushEvent.set()
+            return True
+        elif self.binaryRequested and Protocol.isModeOn(frame, "S2"):
+            # Last ASCII answer: the next frames are binary
+            self.binaryMode = True
+            self.reader.decoder = self.decode_binary
+        if pipeline:
+            # Answers are tagged: nobody waits for this one (ex.: MCU boot message, status out of push mode).
+            # Dropped, or the reader queue would grow for the whole connection.
+            self.terminal("on_frame:Unexpected data: %s", "DEBUG", frame)
+            return True
+        return False
+
+    def receive_pushed_status(self, wait=1.0):
+        # Waits (up to wait s) for status frames sent by the MCU and processes them in arrival order
+        if self.forceRenew and self.lastStatusFrame and self.pushedFrames.empty():
+            self.update_status(self.lastStatusFrame)
+            return
 
-            vpos1 = vpos1 + 1
+        try:
+            received, frame = self.pushedFrames.get(wait > 0, wait if wait > 0 else None)
+        except queue.Empty:
+            if time.monotonic() - self.lastPushTime > 3 * Protocol.PUSH_KEEPALIVE:
+                self.pushMode = False
+                self.terminal("No status received from Safety Printer MCU in push mode. Back to polling.","WARNING")
+                self.send_command("<S1 off>",10)
+            return
 
-            for x in range(totalSensors):
-                vpos1 = responseStr.find('#',vpos1)
-                vpos2 = responseStr.find(',',vpos1)
-                
-                if responseStr[vpos1+1:vpos2].isdigit():
-                    index = int(responseStr[vpos1+1:vpos2])
-                else :
-                    return
-                
-                if (index >= 0 and index < totalSensors):
-
-                    originalCRC = self.crc16(self.sensorEnabled[index] + self.sensorActive[index] + self.sensorActualValue[index] + self.sensorSP[index] + self.sensorTimer[index] + self.sensorTrigger[index])
-
-                    vpos1 = vpos2 + 1
-                    vpos2 = responseStr.find(',',vpos1)
-                    self.sensorEnabled[index] = responseStr[vpos1:vpos2]
-                    vpos1 = vpos2 + 1
-                    vpos2 = responseStr.find(',',vpos1)
-                    self.sensorActive[index] = responseStr[vpos1:vpos2]
-                    vpos1 = vpos2 + 1
-                    vpos2 = responseStr.find(',',vpos1)
-                    self.sensorActualValue[index] = responseStr[vpos1:vpos2]
-                    vpos1 = vpos2 + 1
-                    vpos2 = responseStr.find(',',vpos1)
-                    self.sensorSP[index] = responseStr[vpos1:vpos2]
-                    vpos1 = vpos2 + 1
-                    vpos2 = responseStr.find(',',vpos1)
-                    self.sensorTimer[index] = responseStr[vpos1:vpos2]
-                    vpos1 = vpos2 + 1
-                    vpos2 = responseStr.find(',',vpos1)
-                    self.sensorTrigger[index] = responseStr[vpos1:vpos2]
-
-                    newCRC = self.crc16(self.sensorEnabled[index] + self.sensorActive[index] + self.sensorActualValue[index] + self.sensorSP[index] + self.sensorTimer[index] + self.sensorTrigger[index])
-
-                    if ((originalCRC != newCRC) or (self.forceRenew)):   #avoid sending multiple msgs
-                        self._plugin_manager.send_plugin_message(self._identifier, {"type": "statusUpdate", "sensorIndex": index, "totalSensors": totalSensors, "sensorLabel": self.sensorLabel[index], "sensorEnabled": self.sensorEnabled[index], "sensorActive": self.sensorActive[index], "sensorActualValue": self.sensorActualValue[index], "sensorType": self.sensorType[index], "sensorSP": self.sensorSP[index], "sensorTimer": self.sensorTimer[index], "sensorForceDisable": self.sensorForceDisable[index], "sensorTrigger": self.sensorTrigger[index], "sensorLowSP": self.sensorLowSP[index], "sensorHighSP": self.sensorHighSP[index]})
-                        if (self.sensorActive[index] == "T" and not self.sensorAlreadyNotifiedAlarm[index]):
-                            self.sensorAlreadyNotifiedAlarm[index] = True
-                            if (self.sensorEnabled[index] == "T"):
-                                self.terminal("New Alarm detected: "+ str(self.sensorLabel[index]) + " (" + str(self.sensorActualValue[index])+ ")","ALARM")
-                            else :
-                                self.terminal("New Alarm detected (disabled sensor): "+ str(self.sensorLabel[index]) + " (" + str(self.sensorActualValue[index])+ ")","INFO")                        
-                        elif (self.sensorActive[index] == "F"):
-                            self.sensorAlreadyNotifiedAlarm[index] = False
-
-            if (self.forceRenew): # send all msgs again to update UI
-                self.forceRenew = False
-        else :
-            self.update_ui_connection_status()
+        while frame:
+            self.lastPushTime = time.monotonic()
+            if isinstance(frame, Protocol.StatusFrame):
+                # Binary frame, already checked by the reader
+                self.statusFrameSize = BinaryCodec.statusWireSize(len(frame.sensors))
+                data = frame
+                if self.terminal_wanted("Recv"):
+                    self.terminal(Protocol.formatStatus(data), "Recv")
+            else:
+                self.statusFrameSize = len(frame) + 2
+                data = self.crcCheck(frame)
+                if data:
+                    self.terminal(data, "Recv")
+            if data:
+                self.lastStatusFrame = data
+                self.update_status(data, [(Tracing.STAGE_RECEIVED, received), (Tracing.STAGE_CHECKED, time.monotonic())])
+            received, frame = self.next_pushed_frame()
+
+    def next_pushed_frame(self):
+        try:
+            return self.pushedFrames.get_nowait()
+        except queue.Empty:
+            return None, None
 
     def update_ui_sensor_labels(self):
         # Update local arrays with sensor labels and type. create items for all the other properties. Should run just after connection, only one time or when the number of sensor status sended by arduino changes
@@ -528,156 +817,111 @@ class Connection():
         
         if ((responseStr == "Error") or (not(isinstance(responseStr, str)))):
                 return
-        
-        numhash = responseStr.count('#')
-        vpos1 = 0
-        vpos2 = 0
-        self.totalSensorsInitial = int(numhash)
-        
-        for x in range(self.totalSensorsInitial):
-            vpos1 = responseStr.find('#',vpos1)
-            vpos2 = responseStr.find(',',vpos1)
-        
-            if responseStr[vpos1+1:vpos2].isdigit():
-                index = int(responseStr[vpos1+1:vpos2])
-            else :
-                return
-        
-            vpos1 = vpos2 + 1
-            vpos2 = responseStr.find(',',vpos1)
-        
-            if index >= len(self.sensorLabel) :
-                self.sensorLabel.append(responseStr[vpos1:vpos2])
-                vpos1 = vpos2 + 1
-                vpos2 = responseStr.find(',',vpos1)
-                self.sensorType.append(responseStr[vpos1:vpos2])
-                vpos1 = vpos2 + 1
-                vpos2 = responseStr.find(',',vpos1)
-                self.sensorForceDisable.append(responseStr[vpos1:vpos2])
-                vpos1 = vpos2 + 1
-                vpos2 = responseStr.find(',',vpos1)
-                self.sensorLowSP.append(responseStr[vpos1:vpos2])
-                vpos1 = vpos2 + 1
-                vpos2 = responseStr.find(',',vpos1)
-                self.sensorHighSP.append(responseStr[vpos1:vpos2])
-
-                
-                self.sensorTrigger.append("F")
-                self.sensorEnabled.append("")
-                self.sensorActive.append("")
-                self.sensorActualValue.append("")
-                self.sensorSP.append("")
-                self.sensorTimer.append("")
-                self.sensorAlreadyNotifiedAlarm.append(False)
-
-            else :
-                self.sensorLabel[index] = responseStr[vpos1:vpos2]
-                vpos1 = vpos2 + 1
-                vpos2 = responseStr.find(',',vpos1)
-                self.sensorType[index] = responseStr[vpos1:vpos2]
-                vpos1 = vpos2 + 1
-                vpos2 = responseStr.find(',',vpos1)
-                self.sensorForceDisable[index] = responseStr[vpos1:vpos2]
-                vpos1 = vpos2 + 1
-                vpos2 = responseStr.find(',',vpos1)
-                self.sensorLowSP[index] = responseStr[vpos1:vpos2]
-                vpos1 = vpos2 + 1
-                vpos2 = responseStr.find(',',vpos1)
-                self.sensorHighSP[index] = responseStr[vpos1:vpos2]
-
-                self.sensorTrigger[index] = "F"
-                self.sensorEnabled[index] = ""
-                self.sensorActive[index] = ""
-                self.sensorActualValue[index] = ""
-                self.sensorSP[index] = ""
-                self.sensorTimer[index] = ""
-                self.sensorAlreadyNotifiedAlarm[index] = False
+
+        try:
+            sensors = Protocol.parseSensorInfo(responseStr)
+        except Protocol.ProtocolError as e:
+            self.terminal("update_ui_sensor_labels:%s","DEBUG",e)
+            return
+
+        self.totalSensorsInitial = len(sensors)
+        self.sensors.resize(self.totalSensorsInitial)
+
+        for sensor in sensors:
+            if sensor.index < self.sensors.size:
+                self.sensors.setInfo(sensor.index, sensor)
+
+    def connection_message(self):
+        return {"type": "connectionUpdate", "connectionStatus": self._connected, "state": self.state, "port": self.connectedPort, "totalmsgs": self.totalmsgs, "badmsgs": self.badmsgs, "failure" : self.connFail, "reduced" : self.reducedComm}
 
     def update_ui_connection_status(self):
         # Updates knockout connection status
         
         if ((self.settingsVisible) or (self.forceRenewConn)):
             #self._console_logger.info("connectionStatus:" + str(self._connected) + ", port:" + str(self.connectedPort) + ", totalmsgs:" + str(self.totalmsgs) + ", badmsgs: " + str(self.badmsgs) + ", failure: " + str(self.connFail) + ", reduced: " + str(self.reducedComm))    
-            self._plugin_manager.send_plugin_message(self._identifier, {"type": "connectionUpdate", "connectionStatus": self._connected, "port": self.connectedPort, "totalmsgs": self.totalmsgs, "badmsgs": self.badmsgs, "failure" : self.connFail, "reduced" : self.reducedComm})    
+            self.outbox.send(self.connection_message())
             if (self.forceRenewConn):
                 self.forceRenewConn = False
-                self._plugin_manager.send_plugin_message(self._identifier, {"type": "firmwareInfo", "version": self.FWVersion, "releaseDate": self.FWReleaseDate, "EEPROM": self.FWEEPROM, "CommProtocol":self.FWCommProtocol, "ValidVersion": self.FWValidVersion, "BoardType": self.FWBoardType})
+                self.outbox.send({"type": "firmwareInfo", "version": self.FWVersion, "releaseDate": self.FWReleaseDate, "EEPROM": self.FWEEPROM, "CommProtocol":self.FWCommProtocol, "ValidVersion": self.FWValidVersion, "BoardType": self.FWBoardType})
         else:
             if self.lastConnected != self._connected:
                 self.lastConnected = self._connected
-                self._plugin_manager.send_plugin_message(self._identifier, {"type": "connectionUpdate", "connectionStatus": self._connected, "port": self.connectedPort, "totalmsgs": self.totalmsgs, "badmsgs": self.badmsgs, "failure" : self.connFail, "reduced" : self.reducedComm})    
+                self.outbox.send(self.connection_message())
 
     def update_MCU_Stats(self):
         # Update local vars with MCU status. Send data to update Settings Tab
         if not self.reducedComm:
             responseStr = self.newSerialCommand("<R5>",10, False)
             if ((responseStr) and (responseStr != "Error")):
-                vpos1 = responseStr.find(':',0)
-                vpos2 = responseStr.find(',',vpos1)
-                MCUSRAM = responseStr[vpos1+1:vpos2]
-                vpos1 = vpos2 + 1
-                vpos2 = responseStr.find(',',vpos1)
-                MCUTemp = responseStr[vpos1:vpos2]
-                vpos1 = vpos2 + 1
-                vpos2 = responseStr.find(',',vpos1)
-                MCUVolts = responseStr[vpos1:vpos2]
-                vpos1 = vpos2 + 1
-                vpos2 = responseStr.find(',',vpos1)
-                MCUMaxTime = responseStr[vpos1:vpos2]
-                vpos1 = vpos2 + 1
-                vpos2 = responseStr.find(',',vpos1)
-                MCUAvgTime = responseStr[vpos1:vpos2]
-
-                self._plugin_manager.send_plugin_message(self._identifier, {"type": "MCUInfo", "volts": MCUVolts, "temp": MCUTemp, "ram": MCUSRAM, "maxTime": MCUMaxTime, "avgTime": MCUAvgTime})  
-
-
-    def terminal(self,msg,ttype):
-        if self._settings.get_boolean(["showTerminal"]):
-            self._plugin_manager.send_plugin_message(self._identifier, {"type": "terminalUpdate", "line": msg, "terminalType": ttype})
+                try:
+                    stats = Protocol.parseMCUStats(responseStr)
+                except Protocol.ProtocolError as e:
+                    self.terminal("update_MCU_Stats:%s","DEBUG",e)
+                    return
+
+                self.outbox.send({"type": "MCUInfo", "volts": stats.volts, "temp": stats.temp, "ram": stats.SRAM, "maxTime": stats.maxTime, "avgTime": stats.avgTime})  
+
+
+    def terminal_wanted(self, ttype):
+        # False if a terminal line of this type would be dropped: terminal hidden and log level off.
+        # Lines that pop up (trip, alarm, warning, error) are always wanted.
+        level = TERMINAL_LOG_LEVELS.get(ttype.lower())
+        return (level is None) or self.settingsCache.current.showTerminal or self._console_logger.isEnabledFor(level)
+
+    def terminal(self,msg,ttype,*args):
+        # msg: text, or %-format of args. Formatted only for the terminal and popups: the console log formats it on
+        # its own thread (see ConsoleLog.py), and a line nobody reads isn't formatted at all.
+        if not self.terminal_wanted(ttype):
+            return
+        showTerminal = self.settingsCache.current.showTerminal
+        text = (msg % args) if (args and (showTerminal or ttype.lower() not in TERMINAL_LOG_LEVELS)) else msg
+        if showTerminal:
+            seq = self.terminalBuffer.append(text, ttype, self.boardId)
+            self.outbox.send({"type": "terminalUpdate", "seq": seq, "line": text, "terminalType": ttype})
 
         ttype = ttype.lower()
 
         # Pops up the error msg to user.
         if (ttype == "debug") or (ttype == "send") or (ttype == "recv"):
-            self._console_logger.debug(msg)
+            self._console_logger.debug(msg, *args)
 
         elif ttype == "info":
-            self._console_logger.info(msg)
+            self._console_logger.info(msg, *args)
 
         elif ttype == "trip":
-            self._console_logger.info(msg)
-            popup = "\U0001F6D1 " "SafetyPrinter " + msg
+            self._console_logger.info(msg, *args)
+            popup = "\U0001F6D1 " "SafetyPrinter " + text
             self.app_notification(popup)
 
         elif ttype == "alarm":
-            self._console_logger.info(msg)
-            popup = "\U0001F514 " "SafetyPrinter " + msg
+            self._console_logger.info(msg, *args)
+            popup = "\U0001F514 " "SafetyPrinter " + text
             self.app_notification(popup)            
 
         elif ttype == "warning":
-            self._console_logger.warning(msg)
-            popup = "WARNING: " + msg
+            self._console_logger.warning(msg, *args)
+            popup = "WARNING: " + text
             
-            if self._settings.get_boolean(["notifyWarnings"]):
-                self._plugin_manager.send_plugin_message(self._identifier, {"type": "warning", "warningMsg": popup, "popup" : True})
+            if self.settingsCache.current.notifyWarnings:
+                self.outbox.send({"type": "warning", "warningMsg": popup, "popup" : True})
                 popup = "\U000026A0 " "SafetyPrinter " + popup
                 self.app_notification(popup)
             else:
-                self._plugin_manager.send_plugin_message(self._identifier, {"type": "warning", "warningMsg": popup, "popup" : True})
+                self.outbox.send({"type": "warning", "warningMsg": popup, "popup" : True})
 
 
         elif  ttype == "error":
-            self._console_logger.error(msg)
-            popup = "ERROR: " + msg
-            self._plugin_manager.send_plugin_message(self._identifier, {"type": "error", "errorMsg": popup})
+            self._console_logger.error(msg, *args)
+            popup = "ERROR: " + text
+            self.outbox.send({"type": "error", "errorMsg": popup})
             popup = "\U000026A0 " + "SafetyPrinter " + popup
             self.app_notification(popup)
 
 
         elif ttype == "critical":
-            self._console_logger.critical(msg) 
-            popup = popup + "CRITICAL ERROR: " + msg
-            self._plugin_manager.send_plugin_message(self._identifier, {"type": "error", "errorMsg": popup})
+            self._console_logger.critical(msg, *args) 
+            popup = popup + "CRITICAL ERROR: " + text
+            self.outbox.send({"type": "error", "errorMsg": popup})
             popup = "\U000026A0 " + popup
             self.app_notification(popup)
 
@@ -685,60 +929,63 @@ class Connection():
 
     def newSerialCommand(self,serialCommand, timeout, force): 
         # Used for 1 time only commands. Keeps tring if no arduino response until timeout (s) expires.
-        i = 0
         if self.reducedComm and not force:
             self.terminal("Serial command (" + serialCommand + ") blocked due to a invalid firmware communication protocoll.","WARNING")
             return
         vpos1 = serialCommand.find('<',0)
         vpos2 = serialCommand.find('>',0)
         if ((vpos1 > -1) and  (vpos2 > -1) and (vpos2 - vpos1 > 1)):            
-            responseStr = self.send_command(serialCommand,10)
-            while ((responseStr == "Error") or (not responseStr)) and (not self.abortSerialConn):
-                time.sleep(0.5)
-                i += 1            
-                if i > 0:
-                    self.terminal("newSerialCommand:Serial port is busy or bad answer. Retring command:" + serialCommand + " x" + str(i),"DEBUG")
-                if i >= 10:
-                    self.closeConnection()
-                    break
-                responseStr = self.send_command(serialCommand,timeout)
-            return responseStr
+            commandId = self.command_id(serialCommand)
+            lane = commandLane(commandId)
+            return self.send_with_retry(serialCommand, commandId, lane, Retry.commandPolicy(commandId, lane, timeout))
         else:
             self.terminal("'" + serialCommand + "' is not a valid command.","WARNING")
 
+    def send_with_retry(self, serialCommand, commandId, lane, policy):
+        # Sends the command until it is answered, a fatal error happens or the policy deadline expires.
+        # A command that isn't answered doesn't close the connection: only port errors do (see write_command).
+        start = time.monotonic()
+        deadline = start + policy.deadline
+        responseStr = "Error"
+        error = None
+        attempts = 0
+        while not self.abortSerialConn:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            attempts += 1
+            responseStr, error = self.transact(serialCommand, remaining, lane, min(self.responseTimeout, remaining))
+            if error is None or not policy.canRetry(error):
+                break
+            pause = min(policy.delay(attempts), deadline - time.monotonic())
+            self.terminal("newSerialCommand:%s. Retring command: %s x%d in %.0f ms","DEBUG",error, serialCommand, attempts, pause * 1000)
+            if pause > 0:
+                time.sleep(pause)
+
+        latency = time.monotonic() - start
+        if error is None and responseStr == "Error":
+            error = Retry.ERROR_DISCONNECTED
+        stats = self.commandStats.get(commandId)
+        if stats is None:
+            stats = self.commandStats[commandId] = Retry.AttemptStats()
+        stats.record(attempts, error)
+        self.metrics.request(commandId, attempts, error)
+
+        if lane == LANE_SAFETY:
+            # Safety commands (Lanes.SAFETY_COMMANDS) go before any queued command. The time from the request to
+            # the MCU answer is measured.
+            self.safetyStats.record(latency, 0.0, error is None, SAFETY_DEADLINE)
+            if error is None:
+                self.terminal("Safety command %s answered in %.1f ms.","Info",serialCommand, latency * 1000)
+            elif not self.abortSerialConn:
+                self.terminal("Safety command %s not answered by the Safety Printer MCU in %.1f s (%s)." % (serialCommand, latency, error),"ERROR")
+        elif error is not None and not self.abortSerialConn:
+            self.terminal("Command %s failed after %d attempt(s) in %.1f s: %s." % (serialCommand, attempts, latency, error),"WARNING")
+        return responseStr
 
     def crc16(self, data: str):
-        '''
-        CRC-16 Algorithm
-        Adapted from:
-        https://forum.arduino.cc/t/simple-checksum-that-a-noob-can-use/300443
-
-        uint16_t _crc16_update(uint16_t crc, uint8_t a)
-        {
-          int i;
-          crc ^= a;
-          for (i = 0; i < 8; ++i)
-          {
-            if (crc & 1)
-            crc = (crc >> 1) ^ 0xA001;
-            else
-            crc = (crc >> 1);
-          }
-          return crc;
-        }
-
-        '''
-        data = data.encode() 
-        #data = bytearray(data)
-        crc = 0
-        for a in data:
-            crc ^= a
-            for _ in range(0, 8):
-                if (crc & 1): 
-                    crc = (crc >> 1) ^ 0xA001
-                else:
-                    crc = (crc >> 1)
-        return crc
+        # CRC-16 with the same result as the firmware (table driven, see Crc16.py)
+        return crc16(data)
 
     def crcCheck(self, data: str):
         # Checks CRC from received msg
@@ -749,86 +996,190 @@ class Connection():
         arduinoCRC = int(data[vpos1+1:vpos2])
         payload = data[vpos2+1:len(data)]
         calculatedCRC = self.crc16(payload)
+        self.metrics.frame(arduinoCRC == calculatedCRC)
         if arduinoCRC == calculatedCRC:  
             return data[0:vpos1] + payload
         else:
-            self.terminal("crcCheck:BAD CRC: arduinoCRC:" + str(arduinoCRC) + " calculatedCRC:" + str(calculatedCRC) + " payload:" + payload,"DEBUG")
+            self.terminal("crcCheck:BAD CRC: arduinoCRC:%s calculatedCRC:%s payload:%s","DEBUG",arduinoCRC,calculatedCRC,payload)
             self.badmsgs += 1
             return False
 
 
-    def send_command(self, command, timeout=-1):
-        # send serial commands to arduino and receives the answer
+    def command_id(self, command):
+        # "<C3 1 50>" -> "C3"
+        vpos1 = command.find('<',0)
+        vpos2 = command.find('>',0)
+        vpos3 = command.find(' ',0)
+        if vpos3 > -1:
+            return command[vpos1+1:vpos3]
+        return command[vpos1+1:vpos2]
+
+    def check_answer(self, command, sendedCmd, data):
+        # Checks an answer frame. Returns the answer, "Error" (bad answer) or None (not an answer to this command).
+        if isinstance(data, Protocol.StatusFrame):
+            # Binary status, already checked by the reader
+            self.lastFrameSize = BinaryCodec.statusWireSize(len(data.sensors))
+            if self.terminal_wanted("Recv"):
+                self.terminal(Protocol.formatStatus(data), "Recv")
+            if sendedCmd == "R1":
+                return data
+            self.terminal("send_command:Answer (R1) doesn't contains command ID:%s", "DEBUG", sendedCmd)
+            return None
+
+        self.lastFrameSize = len(data) + 2 # + line terminator
+
+        if self.binaryMode:
+            pass # Text frame, CRC already checked by the reader
+        elif data.startswith("$"):
+            data = self.crcCheck(data)
+            if not data:
+                self.terminal("send_command:[%s] Bad CRC.", "DEBUG", command)
+                return "Error"
+        elif sendedCmd.lower() in ("r1", "r2", "r4", "r5", "r7") and not Protocol.isRejection(data, sendedCmd):
+            self.terminal("send_command:[%s] Answer without CRC: %s", "DEBUG", command, data)
+            return None
+
+        self.terminal(data, "Recv")
 
-        if not self.waitingResponse.acquire(True, timeout):
-            return "Error"
+        if Protocol.isRejection(data, sendedCmd):
+            return REJECTED
 
-        if self.is_connected() and not self.abortSerialConn:
-            try:
-                self.serialConn.flush()
+        vpos1 = data.find(':',0)
+        receivedCmd = data[0:vpos1]
+
+        if receivedCmd == sendedCmd:
+            return str(data)
+        else:
+            # Unsolicited message (ex.: MCU reboot). Keeps waiting for the right answer.
+            self.terminal("send_command:Answer (%s) doesn't contains command ID:%s", "DEBUG", receivedCmd, sendedCmd)
+            return None
+
+    def write_command(self, command):
+        # Returns False (and closes the connection) if the port fails
+        try:
+            with self.writeLock:
                 self.terminal(command.strip(), "Send")
                 self.serialConn.write(command.encode())
-                data = ""
-                keepReading = True
-
-                while keepReading:
-                    time.sleep(0.05)
-                    if self.is_connected():
-                        newline = self.serialConn.readline()
-                        if not newline.strip():
-                            keepReading = False
-                        else:
-                            data += newline.decode()
-                
-                if data: 
-                    data = data.strip()
-                    if ((command.lower() == "<r1>") or (command.lower() == "<r2>") or (command.lower() == "<r4>") or (command.lower() == "<r5>")):
-                        data = self.crcCheck(data)
-                        if not data:
-                            self.waitingResponse.release()
-                            self.terminal("send_command:["+ command +"] Bad CRC.", "DEBUG")
-                            return "Error"
+            return True
+        except (serial.SerialException, OSError, AttributeError):
+            if (not self.abortSerialConn) :
+                self.terminal("Safety Printer communication error.", "ERROR")
+                self.closeConnection()
+            return False
 
-                    self.terminal(data, "Recv")
+    def send_command(self, command, timeout=-1, lane=None, answerTimeout=None):
+        # send serial commands to arduino and waits for the answer frame from the serial reader thread
+        # timeout: time (s) waiting for the port (or a pipeline slot). answerTimeout: time waiting for the answer.
+        return self.transact(command, timeout, lane, answerTimeout)[0]
+
+    def transact(self, command, timeout=-1, lane=None, answerTimeout=None):
+        # Same as send_command. Returns (answer, None) or ("Error", Retry.ERROR_*)
+        commandId = self.command_id(command)
+        if lane is None:
+            lane = commandLane(commandId)
+        if answerTimeout is None:
+            answerTimeout = self.responseTimeout
+        start = time.monotonic()
+        pipeline = self.pipeline
+        if pipeline:
+            answer, error, wait = self.send_pipelined(pipeline, command, timeout, lane, answerTimeout, start)
+        else:
+            answer, error, wait = self.send_strict(command, timeout, lane, answerTimeout, start)
+        latency = time.monotonic() - start
+        self.laneStats[lane].record(latency, wait, error is None)
+        self.metrics.command(commandId, LANE_NAMES[lane], latency - wait, wait, error)
+        return answer, error
 
-                    vpos1 = command.find('<',0)
-                    vpos2 = command.find('>',0)
-                    vpos3 = command.find(' ',0)
-                    if vpos3 > -1:
-                        sendedCmd = command[vpos1+1:vpos3]
-                    else:
-                        sendedCmd = command[vpos1+1:vpos2]
-
-                    vpos1 = data.find(':',0)
-                    receivedCmd = data[0:vpos1]
-                    
-                    if receivedCmd == sendedCmd:
-                        self.waitingResponse.release()
-                        return str(data)
-                    else:
-                        self.terminal("send_command:Answer ("+ receivedCmd +") doesn't contains command ID:" + sendedCmd, "DEBUG")
-                        self.waitingResponse.release()
-                        return "Error"
-                else:
-                    self.terminal("send_command:["+ command +"] Received no data", "DEBUG")
-                    return "Error"  
-            
-            except (serial.SerialException, termios.error): #, termios.error):
-                self.waitingResponse.release()
-                if (not self.abortSerialConn) :
-                    self.terminal("Safety Printer communication error.", "ERROR")
-                    self.closeConnection()
-                return "Error"
+    def send_strict(self, command, timeout, lane, answerTimeout, start):
+        # One command at a time. Returns (answer, error, time waiting for the port)
+        if not self.waitingResponse.acquire(lane, timeout):
+            return "Error", Retry.ERROR_BUSY, time.monotonic() - start
 
-        else:
+        try:
+            wait = time.monotonic() - start
+            if not self.is_connected() or self.abortSerialConn:
+                return "Error", Retry.ERROR_DISCONNECTED, wait
+
+            sendedCmd = self.command_id(command)
+
+            # Late answers from a previous command must not be taken as this command answer.
+            for frame in self.reader.clear():
+                self.terminal("send_command:Discarding unexpected data: %s", "DEBUG", frame)
+            if not self.write_command(command):
+                return "Error", Retry.ERROR_DISCONNECTED, wait
+
+            deadline = time.monotonic() + answerTimeout
+            limit = deadline + self.maxFrameTime()
+            while True:
+                now = time.monotonic()
+                remaining = deadline - now
+                if not self.is_connected():
+                    return "Error", Retry.ERROR_DISCONNECTED, wait
+                if remaining <= 0 and self.receiving() and now < limit:
+                    # Long answer at a low BAUD rate (ex.: many sensors)
+                    deadline = min(limit, now + RX_IDLE)
+                    continue
+                if remaining <= 0:
+                    self.terminal("send_command:[%s] Received no data", "DEBUG", command)
+                    return "Error", Retry.ERROR_NO_ANSWER, wait
+                try:
+                    data = self.reader.get(remaining)
+                except queue.Empty:
+                    continue
+                answer = self.check_answer(command, sendedCmd, data)
+                if answer == "Error":
+                    return answer, Retry.ERROR_BAD_CRC, wait
+                elif answer is REJECTED:
+                    return "Error", Retry.ERROR_REJECTED, wait
+                elif answer is not None:
+                    return answer, None, wait
+        finally:
             self.waitingResponse.release()
-            return "Error"
 
-        self.waitingResponse.release()
+    def send_pipelined(self, pipeline, command, timeout, lane, answerTimeout, start):
+        # Sends a command with a sequence number and waits for its answer. Other commands may be in flight.
+        # Returns (answer, error, time waiting for a window slot)
+        pending = pipeline.acquire(command, timeout, lane)
+        if pending is None:
+            self.terminal("send_command:[%s] Too many commands in flight.", "DEBUG", command)
+            return "Error", Retry.ERROR_BUSY, time.monotonic() - start
+        try:
+            wait = time.monotonic() - start
+            if not self.is_connected() or self.abortSerialConn:
+                return "Error", Retry.ERROR_DISCONNECTED, wait
+            if not self.write_command(Pipeline.tag(command, pending.seq)):
+                return "Error", Retry.ERROR_DISCONNECTED, wait
+            data = pending.wait(answerTimeout)
+            limit = time.monotonic() + self.maxFrameTime()
+            while (data is None) and self.receiving() and (time.monotonic() < limit):
+                data = pending.wait(RX_IDLE)
+            if data is None:
+                if not self.is_connected():
+                    return "Error", Retry.ERROR_DISCONNECTED, wait
+                self.terminal("send_command:[%s] Received no data", "DEBUG", command)
+                return "Error", Retry.ERROR_NO_ANSWER, wait
+            answer = self.check_answer(command, self.command_id(command), data)
+            if answer is None:
+                return "Error", Retry.ERROR_BAD_ANSWER, wait
+            elif answer == "Error":
+                return answer, Retry.ERROR_BAD_CRC, wait
+            elif answer is REJECTED:
+                return "Error", Retry.ERROR_REJECTED, wait
+            return answer, None, wait
+        finally:
+            pipeline.release(pending)
+
+    def on_reader_error(self, error):
+        # Called by the serial reader thread when the port fails (ex.: USB cable unplugged)
+        if (not self.abortSerialConn) and self._connected:
+            self.terminal("Safety Printer communication error: " + str(error), "ERROR")
+            self.closeConnection()
 
     # ****************************************** Extra Functions
 
     def app_notification(self, msg):
+        if len(self.boardManager.ids()) > 1:
+            msg = msg + " (" + self.boardId + ")"
         #Octopod notification
         try:
             self.push_notification_Octopod(msg)
@@ -0,0 +1,65 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import atexit
+import logging
+import logging.handlers
+import queue
+
+LOG_QUEUE_SIZE = 1000 # Records waiting to be written. Above it, new records are dropped (and counted).
+
+class AsyncLogHandler(logging.handlers.QueueHandler):
+    # Console log handler that never blocks the caller (the serial and status poll threads).
+    # Records go to a bounded queue and are written by a background thread to the wrapped handler (the log file),
+    # so a slow SD card write or a file rotation doesn't delay the serial communication.
+    # Records are formatted on the writer thread. When the queue is full they are dropped, and a warning with the
+    # number of dropped records is written as soon as there is room again.
+
+    def __init__(self, handler, maxsize=LOG_QUEUE_SIZE):
+        logging.handlers.QueueHandler.__init__(self, queue.Queue(maxsize))
+        self.dropped = 0
+        self._pendingDrops = 0
+        self.listener = logging.handlers.QueueListener(self.queue, handler, respect_handler_level=True)
+
+    def start(self):
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        # Writes the queued records and stops the writer thread
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def prepare(self, record):
+        # Same process: no need to format and copy the record here.
+        return record
+
+    def enqueue(self, record):
+        # Called with the handler lock held
+        try:
+            if self._pendingDrops:
+                self.queue.put_nowait(self._droppedRecord(record.name, self._pendingDrops))
+                self._pendingDrops = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._pendingDrops += 1
+
+    def _droppedRecord(self, name, count):
+        return logging.LogRecord(name, logging.WARNING, __file__, 0, "%d console log record(s) dropped: log writer too slow.", (count,), None)
@@ -0,0 +1,65 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+'''
+CRC-16 Algorithm
+Adapted from:
+https://forum.arduino.cc/t/simple-checksum-that-a-noob-can-use/300443
+
+Same result as the firmware:
+
+uint16_t _crc16_update(uint16_t crc, uint8_t a)
+{
+  int i;
+  crc ^= a;
+  for (i = 0; i < 8; ++i)
+  {
+    if (crc & 1)
+    crc = (crc >> 1) ^ 0xA001;
+    else
+    crc = (crc >> 1);
+  }
+  return crc;
+}
+
+The 8 shifts of each byte are precomputed in a 256 entries table, so each byte costs one lookup.
+'''
+
+def _buildTable():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(0, 8):
+            if (crc & 1):
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc = (crc >> 1)
+        table.append(crc)
+    return tuple(table)
+
+CRC16_TABLE = _buildTable()
+
+def crc16(data, crc=0):
+    # Returns the CRC of data (str or bytes). Pass the previous result as crc to continue a calculation.
+    if isinstance(data, str):
+        data = data.encode()
+    table = CRC16_TABLE
+    for a in data:
+        crc = (crc >> 8) ^ table[(crc ^ a) & 0xFF]
+    return crc
@@ -0,0 +1,417 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+# Sensor readings history, in a memory mapped circular file.
+#
+# Each record has a fixed size: time (uint32, s), header flags (uint8) and the actual value of each sensor (int16,
+# x VALUE_SCALE). Records are stored by column (all times, then all flags, then each sensor values), so a time range of
+# one field is a contiguous slice that can be reduced in C.
+# A second, per minute, circular tier keeps min/max/sum of each value. Long ranges are reduced from it.
+# Setpoints rarely change, so they are stored as sparse events (time, sensor, setpoint) in a third circular tier.
+# With the default capacity (one week at 1 Hz), times and flags take 3 MB, each sensor 1.3 MB (values and their per
+# minute min/max/sum), and the setpoint events and per minute times 0.2 MB: the file is 8.4 MB with 4 sensors and
+# 13.5 MB with 8 (History._size).
+# Record times never go back: when the wall clock steps backwards (NTP), records keep the time of the last one until the
+# clock catches up, so the time columns stay sorted for bisect. Only flag changes are recorded meanwhile.
+# The file is written (preallocated) on a background thread when the sensor count changes. Records are skipped until
+# it's ready.
+
+HISTORY_PERIOD = 1.0                # Minimum time (s) between records. Flag changes are always recorded.
+HISTORY_RECORDS = 7 * 24 * 3600     # One week at 1 Hz
+ROLLUP_PERIOD = 60                  # s per record of the per minute tier
+SETPOINT_EVENTS = 16384             # Setpoint changes kept (one per sensor is also recorded when the file is opened)
+HISTORY_POINTS = 300                # Default number of points returned by query()
+HISTORY_MAX_POINTS = 2000
+HISTORY_RETRY = 60.0                # Time (s) before creating the file again after an error
+VALUE_SCALE = 10                    # Values and setpoints are stored with one decimal
+VALUE_MIN = -32768
+VALUE_MAX = 32767
+
+FLAG_NAMES = ("interlock", "resetInhibit", "memWarning", "execWarning", "tempWarning", "voltWarning")
+FIELDS = ("value", "SP")
+
+_HEADER = struct.Struct("<4sHHIIIIIII") # magic, version, sensors, capacity, next slot, records, rollup next slot, rollup records, setpoint next slot, setpoint events
+_STATE = struct.Struct("<IIIIII")       # next slot, records, rollup next slot, rollup records, setpoint next slot, setpoint events
+_STATE_OFFSET = 12
+_HEADER_SIZE = 64
+_MAGIC = b"SPHI"
+_VERSION = 2
+
+def _scaled(value):
+    return max(VALUE_MIN, min(VALUE_MAX, int(round(value * VALUE_SCALE))))
+
+class _LogicalTimes():
+    # Record times of a tier, oldest first, for bisect
+    def __init__(self, times, first, count, capacity):
+        self.times = times
+        self.first = first
+        self.count = count
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        return self.times[(self.first + i) % self.capacity]
+
+def _segments(first, capacity, start, end):
+    # Physical slices of the logical records [start, end) of a circular column
+    a = (first + start) % capacity
+    b = a + (end - start)
+    if b <= capacity:
+        return [(a, b)]
+    return [(a, capacity), (0, b - capacity)]
+
+def _copy(column, first, capacity, start, end):
+    # Logical records [start, end) of a circular column, in a new array
+    records = array(column.format)
+    for a, b in _segments(first, capacity, start, end):
+        records.frombytes(column[a:b].tobytes())
+    return records
+
+def _setpointStats(times, values, start, end):
+    # (min, max, time weighted mean) of a setpoint between start and end, from its change events. None if unknown.
+    i = bisect.bisect_right(times, start)
+    steps = [(start, values[i - 1])] if i else []
+    while (i < len(times)) and (times[i] < end):
+        steps.append((times[i], values[i]))
+        i += 1
+    if not steps:
+        return None
+    setpoints = [setpoint for _, setpoint in steps]
+    span = end - steps[0][0]
+    if span <= 0:
+        return setpoints[-1], setpoints[-1], setpoints[-1]
+    total = sum(setpoint * (until - since) for (since, setpoint), until in zip(steps, [since for since, _ in steps[1:]] + [end]))
+    return min(setpoints), max(setpoints), total / span
+
+class History():
+    # Sensor history of one Safety Printer MCU. append() is called on each status update, query() by the API.
+
+    def __init__(self, path, capacity=HISTORY_RECORDS, setpointCapacity=SETPOINT_EVENTS):
+        self.path = path
+        self.capacity = capacity
+        self.rollupCapacity = max(1, capacity // ROLLUP_PERIOD)
+        self.setpointCapacity = setpointCapacity
+        self.sensors = -1
+        self._file = None
+        self._map = None
+        self._lock = threading.Lock()
+        self._lastTime = 0
+        self._lastFlags = -1
+        self._setpoints = []
+        self._preparing = None  # Sensor count of the file being written by the background thread
+        self._error = None      # Error of the last background write, raised by the next append()
+        self._retryTime = 0
+
+    def _flags(self, header):
+        flags = 0
+        for bit, name in enumerate(FLAG_NAMES):
+            if getattr(header, name):
+                flags |= 1 << bit
+        return flags
+
+    def _layout(self, sensors):
+        # (name, format, records) of each column, widest first so all of them are aligned
+        raw, rollup, events = self.capacity, self.rollupCapacity, self.setpointCapacity
+        columns = [("time", "I", raw), ("rollup.time", "I", rollup), ("setpoint.time", "I", events)]
+        columns += [("rollup.value.sum.%d" % i, "i", rollup) for i in range(sensors)]
+        columns += [("value.%d" % i, "h", raw) for i in range(sensors)]
+        columns += [("rollup.value.min.%d" % i, "h", rollup) for i in range(sensors)]
+        columns += [("rollup.value.max.%d" % i, "h", rollup) for i in range(sensors)]
+        columns += [("setpoint.value", "h", events)]
+        columns += [("rollup.count", "H", rollup), ("flags", "B", raw), ("rollup.flags", "B", rollup), ("setpoint.sensor", "B", events)]
+        return columns
+
+    def _size(self, sensors):
+        return _HEADER_SIZE + sum(struct.calcsize(kind) * records for _, kind, records in self._layout(sensors))
+
+    def _valid(self, header, sensors, size):
+        if len(header) != _HEADER.size:
+            return False
+        magic, version, fileSensors, capacity = _HEADER.unpack(header)[:4]
+        return (magic == _MAGIC and version == _VERSION and fileSensors == sensors and capacity == self.capacity and
+                size == self._size(sensors))
+
+    def _create(self, sensors):
+        # Writes the file of a layout (sensors or capacity), unless it already has it. Slow (one week of records):
+        # called on the background thread, without the lock. The new file replaces the old one when complete, so a
+        # query still reading the old mapping never sees it truncated.
+        size = self._size(sensors)
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        if os.path.isfile(self.path):
+            with open(self.path, "rb") as f:
+                if self._valid(f.read(_HEADER.size), sensors, os.fstat(f.fileno()).st_size):
+                    return
+        temp = self.path + ".tmp"
+        with open(temp, "wb") as f:
+            # Space is written (not just reserved) so a full disk fails here and not on a mapped write
+            f.write(_HEADER.pack(_MAGIC, _VERSION, sensors, self.capacity, 0, 0, 0, 0, 0, 0).ljust(_HEADER_SIZE, b"\0"))
+            zeros = bytes(1 << 20)
+            left = size - _HEADER_SIZE
+            while left > 0:
+                left -= f.write(zeros[:left])
+        os.replace(temp, self.path)
+
+    def _prepare(self, sensors):
+        # Background thread: writes the file, then maps it (unless closed or another layout was requested meanwhile)
+        try:
+            self._create(sensors)
+            with self._lock:
+                if self._preparing == sensors:
+                    self._open(sensors)
+        except (OSError, ValueError) as e:
+            with self._lock:
+                self._error = e
+                self._retryTime = time.monotonic() + HISTORY_RETRY
+        finally:
+            with self._lock:
+                if self._preparing == sensors:
+                    self._preparing = None
+
+    def _open(self, sensors):
+        # Maps a file written by _create(). Raises ValueError if it hasn't this layout.
+        self._close()
+        size = self._size(sensors)
+        self._file = open(self.path, "r+b")
+        if not self._valid(self._file.read(_HEADER.size), sensors, os.fstat(self._file.fileno()).st_size):
+            self._close()
+            raise ValueError("Sensor history file has another layout.")
+        self._map = mmap.mmap(self._file.fileno(), size)
+        view = memoryview(self._map)
+        self._columns = {}
+        offset = _HEADER_SIZE
+        for name, kind, records in self._layout(sensors):
+            length = struct.calcsize(kind) * records
+            self._columns[name] = view[offset:offset + length].cast(kind)
+            offset += length
+        # Per sensor: (raw, rollup min, rollup max, rollup sum) columns used by append()
+        self._sensorColumns = [(self._columns["value.%d" % i], self._columns["rollup.value.min.%d" % i],
+                                self._columns["rollup.value.max.%d" % i], self._columns["rollup.value.sum.%d" % i])
+                               for i in range(sensors)]
+        self._next, self._count, self._rollupNext, self._rollupCount, self._setpointNext, self._setpointCount = _STATE.unpack_from(self._map, _STATE_OFFSET)
+        self.sensors = sensors
+        self._lastTime = self._columns["time"][(self._next - 1) % self.capacity] if self._count else 0
+        self._lastFlags = -1
+        self._setpoints = [None] * sensors
+
+    def _close(self):
+        if self._map is not None:
+            self._columns = None
+            self._sensorColumns = None
+            self._map.flush()
+            try:
+                self._map.close()
+            except BufferError:
+                pass # Still used by a query. Closed when released.
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.sensors = -1
+
+    def close(self):
+        with self._lock:
+            self._preparing = None
+            self._close()
+
+    def append(self, now, header, sensors):
+        # Records a Protocol.StatusFrame (header and sensor list). O(1): writes one slot of each column.
+        # Returns False if the record was skipped (too soon or file not ready). Raises the error of the file creation.
+        flags = self._flags(header)
+        with self._lock:
+            if self._error is not None:
+                error, self._error = self._error, None
+                raise error
+            if len(sensors) != self.sensors:
+                if (self._preparing != len(sensors)) and (time.monotonic() >= self._retryTime):
+                    # New layout: the file is written on a background thread
+                    self._close()
+                    self._preparing = len(sensors)
+                    thread = threading.Thread(target=self._prepare, args=(len(sensors),), name="SafetyPrinterHistory")
+                    thread.daemon = True
+                    thread.start()
+                return False
+            now = max(now, self._lastTime) # The wall clock stepped back: keep the last time (see above)
+            if (flags == self._lastFlags) and (now - self._lastTime < HISTORY_PERIOD):
+                return False
+            columns = self._columns
+            seconds = int(now)
+            slot = self._next
+            columns["time"][slot] = seconds
+            columns["flags"][slot] = flags
+
+            # Per minute tier: a new record when the minute changes
+            minute = seconds - seconds % ROLLUP_PERIOD
+            rollup = (self._rollupNext - 1) % self.rollupCapacity
+            newMinute = (self._rollupCount == 0) or (columns["rollup.time"][rollup] != minute)
+            if newMinute:
+                rollup = self._rollupNext
+                self._rollupNext = (rollup + 1) % self.rollupCapacity
+                self._rollupCount = min(self._rollupCount + 1, self.rollupCapacity)
+                columns["rollup.time"][rollup] = minute
+                columns["rollup.count"][rollup] = 1
+                columns["rollup.flags"][rollup] = flags
+            else:
+                columns["rollup.count"][rollup] += 1
+                columns["rollup.flags"][rollup] |= flags
+
+            for index, (sensor, (raw, low, high, total)) in enumerate(zip(sensors, self._sensorColumns)):
+                value = _scaled(sensor.actualValue)
+                raw[slot] = value
+                if newMinute:
+                    low[rollup] = high[rollup] = total[rollup] = value
+                else:
+                    low[rollup] = min(low[rollup], value)
+                    high[rollup] = max(high[rollup], value)
+                    total[rollup] += value
+
+                # Setpoint tier: an event only when it changes
+                setpoint = _scaled(sensor.SP)
+                if setpoint != self._setpoints[index]:
+                    event = self._setpointNext
+                    columns["setpoint.time"][event] = seconds
+                    columns["setpoint.sensor"][event] = index
+                    columns["setpoint.value"][event] = setpoint
+                    self._setpointNext = (event + 1) % self.setpointCapacity
+                    self._setpointCount = min(self._setpointCount + 1, self.setpointCapacity)
+                    self._setpoints[index] = setpoint
+
+            self._next = (slot + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            _STATE.pack_into(self._map, _STATE_OFFSET, self._next, self._count, self._rollupNext, self._rollupCount, self._setpointNext, self._setpointCount)
+            self._lastTime = now
+            self._lastFlags = flags
+            return True
+
+    def query(self, start, end, points=HISTORY_POINTS):
+        # Records between start and end (s), reduced to "points" buckets of the same duration.
+        # Per bucket: start time, flags seen (OR) and min/max/mean of each sensor value and setpoint. Empty buckets are None.
+        # Buckets longer than 2 minutes are reduced from the per minute tier (whole minutes). Setpoint means are time
+        # weighted. The records of the range are copied under the lock and reduced after it, so append() isn't delayed
+        # and never changes them while they are read.
+        points = max(1, min(int(points), HISTORY_MAX_POINTS))
+        result = {"start": start, "end": end, "time": [], "flags": [], "flagNames": FLAG_NAMES, "sensors": []}
+        with self._lock:
+            if (self._map is None) and (self._preparing is None) and os.path.isfile(self.path):
+                # Nothing recorded since startup: open the history left by the last run
+                try:
+                    with open(self.path, "rb") as f:
+                        sensors = _HEADER.unpack(f.read(_HEADER.size))[2]
+                    self._open(sensors)
+                except (OSError, struct.error, ValueError):
+                    self._close()
+            if self._map is None:
+                return result
+            columns = self._columns
+            sensors = self.sensors
+            step = (end - start) / points
+            rollup = step >= 2 * ROLLUP_PERIOD
+            if rollup:
+                prefix, capacity, count, nextSlot = "rollup.", self.rollupCapacity, self._rollupCount, self._rollupNext
+            else:
+                prefix, capacity, count, nextSlot = "", self.capacity, self._count, self._next
+            first = (nextSlot - count) % capacity
+            logical = _LogicalTimes(columns[prefix + "time"], first, count, capacity)
+            lower = bisect.bisect_left(logical, start)
+            upper = bisect.bisect_right(logical, end, lower)
+
+            def copy(name):
+                return _copy(columns[name], first, capacity, lower, upper)
+
+            times = copy(prefix + "time")
+            flagsColumn = copy(prefix + "flags")
+            countColumn = copy("rollup.count") if rollup else None
+            stats = []
+            for i in range(sensors):
+                if rollup:
+                    stats.append((copy("rollup.value.min.%d" % i), copy("rollup.value.max.%d" % i), copy("rollup.value.sum.%d" % i)))
+                else:
+                    column = copy("value.%d" % i)
+                    stats.append((column, column, column))
+            setpointCount = self._setpointCount
+            setpointFirst = (self._setpointNext - setpointCount) % self.setpointCapacity
+            eventTimes, eventSensors, eventValues = [_copy(columns[name], setpointFirst, self.setpointCapacity, 0, setpointCount)
+                                                     for name in ("setpoint.time", "setpoint.sensor", "setpoint.value")]
+
+        # Setpoint events of each sensor, oldest first
+        setpointTimes = [[] for _ in range(sensors)]
+        setpointValues = [[] for _ in range(sensors)]
+        for eventTime, index, setpoint in zip(eventTimes, eventSensors, eventValues):
+            if index < sensors:
+                setpointTimes[index].append(eventTime)
+                setpointValues[index].append(setpoint)
+
+        for _ in range(sensors):
+            result["sensors"].append({field: {"min": [], "max": [], "mean": []} for field in FIELDS})
+
+        # Records of the range, from 0 to len(times)
+        a = 0
+        for bucket in range(points):
+            bucketStart = start + bucket * step
+            if bucket < points - 1:
+                b = bisect.bisect_left(times, bucketStart + step, a)
+            else:
+                b = len(times)
+            result["time"].append(round(bucketStart, 3))
+            if b <= a:
+                result["flags"].append(None)
+                for sensor in result["sensors"]:
+                    for values in sensor.values():
+                        values["min"].append(None)
+                        values["max"].append(None)
+                        values["mean"].append(None)
+                continue
+
+            flags = 0
+            for value in set(flagsColumn[a:b]):
+                flags |= value
+            result["flags"].append(flags)
+            records = sum(countColumn[a:b]) if rollup else b - a
+            for sensor, (lowColumn, highColumn, sumColumn) in zip(result["sensors"], stats):
+                values = sensor["value"]
+                values["min"].append(min(lowColumn[a:b]) / VALUE_SCALE)
+                values["max"].append(max(highColumn[a:b]) / VALUE_SCALE)
+                values["mean"].append(round(sum(sumColumn[a:b]) / records / VALUE_SCALE, 2))
+            bucketEnd = min(bucketStart + step, end)
+            for sensor, sensorTimes, setpoints in zip(result["sensors"], setpointTimes, setpointValues):
+                values = sensor["SP"]
+                setpointStats = _setpointStats(sensorTimes, setpoints, bucketStart, bucketEnd)
+                if setpointStats is None:
+                    values["min"].append(None)
+                    values["max"].append(None)
+                    values["mean"].append(None)
+                else:
+                    low, high, mean = setpointStats
+                    values["min"].append(low / VALUE_SCALE)
+                    values["max"].append(high / VALUE_SCALE)
+                    values["mean"].append(round(mean / VALUE_SCALE, 2))
+            a = b
+
+        return result
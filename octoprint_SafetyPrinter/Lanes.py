@@ -0,0 +1,107 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import threading
+import time
+
+# Command lanes, highest priority first
+LANE_SAFETY = 0     # Emergency button, printer power, MCU reset
+LANE_CONTROL = 1    # Settings and user commands
+LANE_READ = 2       # Status and info reads
+LANE_NAMES = ("safety", "control", "read")
+
+SAFETY_COMMANDS = ("C2", "C6", "C9")
+READ_COMMANDS = ("R1", "R2", "R4", "R5", "R6")
+
+SAFETY_DEADLINE = 2.0   # Latency target (s) for a safety command answer, retries included. Later answers count as misses.
+SAFETY_RETRY = 0.05     # Pause (s) between safety command retries
+
+def commandLane(commandId):
+    commandId = commandId.upper()
+    if commandId in SAFETY_COMMANDS:
+        return LANE_SAFETY
+    elif commandId in READ_COMMANDS:
+        return LANE_READ
+    return LANE_CONTROL
+
+class CommandGate():
+    # Serial port access, one command at a time. When the port is released, the waiting command of the highest
+    # priority lane goes next, so a safety command never waits behind queued reads.
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._busy = False
+        self._waiting = [0] * len(LANE_NAMES)
+
+    def _first(self, lane):
+        return not any(self._waiting[:lane])
+
+    def acquire(self, lane, timeout=-1):
+        # Returns False if the port isn't free for this lane until timeout (s). timeout < 0 waits forever.
+        deadline = None if timeout < 0 else time.monotonic() + timeout
+        with self._cond:
+            self._waiting[lane] += 1
+            try:
+                while self._busy or not self._first(lane):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                self._busy = True
+                return True
+            finally:
+                self._waiting[lane] -= 1
+                # A lane that gave up may unblock lower lanes
+                self._cond.notify_all()
+
+    def release(self):
+        with self._cond:
+            self._busy = False
+            self._cond.notify_all()
+
+class LaneStats():
+    # Latency of the commands of one lane: from the request (ex.: button pressed) to the MCU answer.
+    __slots__ = ("count", "failures", "deadlineMisses", "last", "max", "total", "lastWait")
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.deadlineMisses = 0
+        self.last = 0.0
+        self.max = 0.0
+        self.total = 0.0
+        self.lastWait = 0.0     # Time waiting for the port (queue) on the last command
+
+    def record(self, latency, wait, ok, deadline=None):
+        self.count += 1
+        self.last = latency
+        self.lastWait = wait
+        self.total += latency
+        self.max = max(self.max, latency)
+        if not ok:
+            self.failures += 1
+        if deadline is not None and latency > deadline:
+            self.deadlineMisses += 1
+
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+    def asDict(self):
+        return {"count": self.count, "failures": self.failures, "deadlineMisses": self.deadlineMisses, "last": self.last,
+                "max": self.max, "average": self.average(), "lastWait": self.lastWait}
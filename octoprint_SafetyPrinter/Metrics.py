@@ -0,0 +1,282 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import threading
+import time
+from .Retry import ERROR_BUSY, ERROR_BAD_CRC
+from .Lanes import READ_COMMANDS
+
+# Histogram buckets (s)
+RTT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+JITTER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Command IDs of the protocol. Anything else (ex.: typed in the terminal) is labelled "other", so the number of
+# series stays bounded.
+PROTOCOL_COMMANDS = frozenset(READ_COMMANDS + tuple("C%d" % n for n in range(1, 10)) + ("S1", "S2", "S3"))
+
+def commandLabel(commandId):
+    commandId = commandId.upper()
+    return commandId if commandId in PROTOCOL_COMMANDS else "other"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=""):
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric():
+    # One metric family: a value (counter, gauge) or bucket counts (histogram) per label values tuple.
+
+    def __init__(self, name, kind, help, labelNames=(), buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.buckets = tuple(buckets) if buckets else None
+        self._values = {}
+        if (not self.labelNames) and (kind != "histogram"):
+            self._values[()] = 0 # Shown before the first event
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), value=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def set(self, labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # [count per bucket..., sum, count]
+                series = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def get(self, labels=()):
+        with self._lock:
+            value = self._values.get(labels)
+            return list(value) if isinstance(value, list) else value
+
+    def remove(self, labelName, value):
+        # Drops the series with this label value (ex.: a removed board)
+        if labelName not in self.labelNames:
+            return
+        position = self.labelNames.index(labelName)
+        with self._lock:
+            for labels in [labels for labels in self._values if labels[position] == value]:
+                del self._values[labels]
+
+    def render(self, lines):
+        # Prometheus text exposition format
+        lines.append("# HELP %s %s" % (self.name, self.help))
+        lines.append("# TYPE %s %s" % (self.name, self.kind))
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            if self.kind != "histogram":
+                lines.append("%s%s %s" % (self.name, _labels(self.labelNames, labels), _number(value)))
+                continue
+            cumulative = 0
+            for bound, count in zip(self.buckets, value):
+                cumulative += count
+                lines.append("%s_bucket%s %d" % (self.name, _labels(self.labelNames, labels, 'le="%s"' % _number(bound)), cumulative))
+            lines.append("%s_bucket%s %d" % (self.name, _labels(self.labelNames, labels, 'le="+Inf"'), value[-1]))
+            lines.append("%s_sum%s %s" % (self.name, _labels(self.labelNames, labels), _number(float(value[-2]))))
+            lines.append("%s_count%s %d" % (self.name, _labels(self.labelNames, labels), value[-1]))
+
+class MetricsRegistry():
+    # Plugin wide metrics, served by the /metrics endpoint in the Prometheus text format.
+    # Kept for the plugin lifetime: reconnects don't reset them. Collectors are called before each scrape to update
+    # the values that are read rather than counted (ex.: time disconnected).
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelNames=()):
+        return self._add(Metric(name, "counter", help, labelNames))
+
+    def gauge(self, name, help, labelNames=()):
+        return self._add(Metric(name, "gauge", help, labelNames))
+
+    def histogram(self, name, help, labelNames=(), buckets=RTT_BUCKETS):
+        return self._add(Metric(name, "histogram", help, labelNames, buckets))
+
+    def addCollector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def remove(self, labelName, value):
+        for metric in list(self._metrics):
+            metric.remove(labelName, value)
+
+    def render(self):
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for collector in collectors:
+            collector()
+        lines = []
+        for metric in metrics:
+            metric.render(lines)
+        return "\n".join(lines) + "\n"
+
+class PollMetrics():
+    # Status poll timing (see PollScheduler)
+
+    def __init__(self, registry):
+        self.overruns = registry.counter("safetyprinter_poll_overruns_total",
+                                         "Status polls that took longer than the poll period.")
+        self.jitter = registry.histogram("safetyprinter_poll_jitter_seconds",
+                                         "Difference between the scheduled and the actual status poll start.",
+                                         (), JITTER_BUCKETS)
+
+class LinkMetrics():
+    # Serial link metrics of all the Safety Printer boards (see BoardMetrics)
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.rtt = registry.histogram("safetyprinter_command_rtt_seconds",
+                                      "Time from sending a command to the MCU answer, per attempt.", ("board", "command"))
+        self.crcErrors = registry.counter("safetyprinter_command_crc_errors_total",
+                                          "Command answers with a bad CRC.", ("board", "command"))
+        self.retries = registry.counter("safetyprinter_command_retries_total",
+                                        "Command attempts after the first one.", ("board", "command"))
+        self.failures = registry.counter("safetyprinter_command_failures_total",
+                                         "Commands not answered after all attempts, by last error.", ("board", "command", "error"))
+        self.frames = registry.counter("safetyprinter_frames_total", "Frames received with a CRC.", ("board",))
+        self.badFrames = registry.counter("safetyprinter_bad_frames_total", "Frames received with a bad CRC or encoding.", ("board",))
+        self.portWait = registry.histogram("safetyprinter_port_wait_seconds",
+                                           "Time waiting for the serial port (or a pipeline slot) before sending a command.",
+                                           ("board", "lane"), WAIT_BUCKETS)
+        self.portTimeouts = registry.counter("safetyprinter_port_wait_timeouts_total",
+                                             "Commands that gave up waiting for the serial port.", ("board", "lane"))
+        self.connects = registry.counter("safetyprinter_connects_total", "Connections to the MCU.", ("board",))
+        self.reconnects = registry.counter("safetyprinter_reconnects_total",
+                                           "Connections to the MCU after the first one.", ("board",))
+        self.connected = registry.gauge("safetyprinter_connected", "1 if the MCU is connected.", ("board",))
+        self.disconnectedTime = registry.counter("safetyprinter_disconnected_seconds_total",
+                                                 "Time with the MCU disconnected, since the plugin started.", ("board",))
+        self.boards = {}
+        self._lock = threading.Lock()
+        registry.addCollector(self.collect)
+
+    def board(self, boardId):
+        with self._lock:
+            metrics = self.boards.get(boardId)
+            if metrics is None:
+                metrics = self.boards[boardId] = BoardMetrics(self, boardId)
+            return metrics
+
+    def removeBoard(self, boardId):
+        with self._lock:
+            self.boards.pop(boardId, None)
+        self.registry.remove("board", boardId)
+
+    def collect(self):
+        now = time.monotonic()
+        with self._lock:
+            boards = list(self.boards.values())
+        for metrics in boards:
+            metrics.collect(now)
+
+class BoardMetrics():
+    # Serial link metrics of one board. Shared by all its Connection objects, so they survive reconnects.
+
+    def __init__(self, link, boardId):
+        self._link = link
+        self.boardId = boardId
+        self._board = (boardId,)
+        self._up = False
+        self._downSince = time.monotonic()
+        self._downTotal = 0.0
+        self._lock = threading.Lock()
+
+    def command(self, commandId, lane, rtt, wait, error):
+        # One attempt (Connection.transact)
+        link = self._link
+        commandId = commandLabel(commandId)
+        laneLabels = (self.boardId, lane)
+        if error == ERROR_BUSY:
+            link.portTimeouts.inc(laneLabels)
+            return
+        link.portWait.observe(laneLabels, wait)
+        if error is None:
+            link.rtt.observe((self.boardId, commandId), rtt)
+        elif error == ERROR_BAD_CRC:
+            link.crcErrors.inc((self.boardId, commandId))
+
+    def request(self, commandId, attempts, error):
+        # One command with all its attempts (Connection.send_with_retry)
+        commandId = commandLabel(commandId)
+        if attempts > 1:
+            self._link.retries.inc((self.boardId, commandId), attempts - 1)
+        if error is not None:
+            self._link.failures.inc((self.boardId, commandId, error))
+
+    def frame(self, ok):
+        self._link.frames.inc(self._board)
+        if not ok:
+            self._link.badFrames.inc(self._board)
+
+    def linkUp(self):
+        with self._lock:
+            if self._up:
+                return
+            self._up = True
+            self._downTotal += time.monotonic() - self._downSince
+            reconnect = self._link.connects.get(self._board) is not None
+        self._link.connects.inc(self._board)
+        if reconnect:
+            self._link.reconnects.inc(self._board)
+
+    def linkDown(self):
+        with self._lock:
+            if self._up:
+                self._up = False
+                self._downSince = time.monotonic()
+
+    def collect(self, now):
+        with self._lock:
+            down = self._downTotal if self._up else self._downTotal + now - self._downSince
+            up = self._up
+        self._link.connected.set(self._board, 1 if up else 0)
+        self._link.disconnectedTime.set(self._board, down)
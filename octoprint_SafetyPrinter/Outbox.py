@@ -0,0 +1,83 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import threading
+from contextlib import contextmanager
+
+class Outbox():
+    # Plugin messages to the UI. Inside a batch() block, messages are collected and sent together in one "batch"
+    # message when the (outermost) block ends. Outside it, messages are sent at once.
+    # Batches are per thread: a message from another thread is never held by a poll tick.
+
+    def __init__(self, plugin_manager, identifier):
+        self._plugin_manager = plugin_manager
+        self._identifier = identifier
+        self._local = threading.local()
+
+    def send(self, message):
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            pending.append(message)
+        else:
+            self._plugin_manager.send_plugin_message(self._identifier, message)
+
+    def afterSend(self, callback):
+        # Calls back once the messages sent so far went to OctoPrint: when the batch ends, or at once outside it.
+        if getattr(self._local, "pending", None) is not None:
+            self._local.callbacks.append(callback)
+        else:
+            callback()
+
+    @contextmanager
+    def batch(self):
+        outer = getattr(self._local, "pending", None) is None
+        if outer:
+            self._local.pending = []
+            self._local.callbacks = []
+        try:
+            yield self
+        finally:
+            if outer:
+                pending = self._local.pending
+                callbacks = self._local.callbacks
+                self._local.pending = None
+                self._local.callbacks = None
+                if len(pending) == 1:
+                    self._plugin_manager.send_plugin_message(self._identifier, pending[0])
+                elif pending:
+                    self._plugin_manager.send_plugin_message(self._identifier, {"type": "batch", "messages": pending})
+                for callback in callbacks:
+                    callback()
+
+class BoardOutbox():
+    # Outbox of one Safety Printer board: every message carries the board ID. Batches are those of the plugin outbox.
+
+    def __init__(self, outbox, boardId):
+        self._outbox = outbox
+        self.boardId = boardId
+
+    def send(self, message):
+        message["board"] = self.boardId
+        self._outbox.send(message)
+
+    def afterSend(self, callback):
+        self._outbox.afterSend(callback)
+
+    def batch(self):
+        return self._outbox.batch()
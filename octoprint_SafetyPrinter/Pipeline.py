@@ -0,0 +1,117 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import threading
+import time
+from collections import namedtuple
+from .Lanes import LANE_SAFETY
+
+PIPELINE_WINDOW = 4     # Commands in flight at the same time (MCU receive buffer)
+MAX_SEQ = 255           # Sequence numbers go from 1 to MAX_SEQ (uint8 in binary frames)
+
+# Binary frame with a sequence number (see BinaryCodec.FRAME_TAGGED)
+Tagged = namedtuple("Tagged", ["seq", "frame"])
+
+def tag(command, seq):
+    # "<C3 1 50>" -> "<C3 1 50 @12>"
+    pos = command.rfind(">")
+    return command[:pos] + " @%d" % seq + command[pos:]
+
+def untag(frame):
+    # Returns (seq, frame). seq is None for untagged frames.
+    # Text answers are tagged as "@12:<answer>" (the tag is outside the $crc$ envelope).
+    if isinstance(frame, Tagged):
+        return frame.seq, frame.frame
+    if isinstance(frame, str) and frame.startswith("@"):
+        pos = frame.find(":")
+        if pos > 1 and frame[1:pos].isdigit():
+            return int(frame[1:pos]), frame[pos + 1:]
+    return None, frame
+
+class Pending():
+    __slots__ = ("seq", "command", "frame", "event")
+
+    def __init__(self, seq, command):
+        self.seq = seq
+        self.command = command
+        self.frame = None
+        self.event = threading.Event()
+
+    def wait(self, timeout):
+        # Returns the answer frame or None on timeout
+        if self.event.wait(timeout):
+            return self.frame
+        return None
+
+class Pipeline():
+    # Commands in flight, matched to their answers by sequence number (feature "pipeline", see Protocol.py).
+    # Up to "window" commands wait for their answers at the same time. The serial reader thread delivers each
+    # tagged answer to the command with the same sequence number. Late answers (command already timed out) are dropped.
+    # The last slot of the window is kept for safety commands (see Lanes.py), so they never wait for reads.
+
+    def __init__(self, window=PIPELINE_WINDOW):
+        self.window = window
+        self._lock = threading.Condition()
+        self._pending = {}
+        self._seq = 0
+
+    def acquire(self, command, timeout, lane=LANE_SAFETY):
+        # Waits for a free window slot. Returns a Pending or None if the window stays full until timeout (s).
+        limit = self.window if lane == LANE_SAFETY else self.window - 1
+        deadline = None if timeout < 0 else time.monotonic() + timeout
+        with self._lock:
+            while len(self._pending) >= limit:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._lock.wait(remaining)
+            while True:
+                self._seq = self._seq % MAX_SEQ + 1
+                if self._seq not in self._pending:
+                    break
+            pending = Pending(self._seq, command)
+            self._pending[pending.seq] = pending
+        return pending
+
+    def release(self, pending):
+        with self._lock:
+            if self._pending.get(pending.seq) is pending:
+                del self._pending[pending.seq]
+            self._lock.notify_all()
+
+    def deliver(self, seq, frame):
+        # Called by the serial reader thread. Returns False if no command waits for this sequence number.
+        with self._lock:
+            pending = self._pending.get(seq)
+        if pending is None or pending.event.is_set():
+            return False
+        pending.frame = frame
+        pending.event.set()
+        return True
+
+    def inFlight(self):
+        with self._lock:
+            return len(self._pending)
+
+    def cancelAll(self):
+        # Wakes all waiting commands without an answer (connection closed)
+        with self._lock:
+            pending = list(self._pending.values())
+        for item in pending:
+            item.event.set()
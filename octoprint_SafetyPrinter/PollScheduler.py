@@ -0,0 +1,92 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import time
+
+# Status poll periods (s)
+POLL_ALARM = 0.25       # Trip or sensor alarm active
+POLL_PRINTING = 0.5
+POLL_IDLE = 2.0         # Printer connected, not printing
+POLL_OFFLINE = 5.0      # Printer disconnected
+
+# Maximum share of the serial link used by the status poll
+LINK_BUDGET = 0.5
+BITS_PER_BYTE = 10      # 8N1: start + 8 data + stop bits
+
+class PollScheduler():
+    # Chooses the status poll period from the printer state, the alarm state and the serial link capacity.
+    # When all boards are in push mode, the board manager waits for the status frames itself and the period is 0.
+    # Otherwise the period is set by the boards that are polled.
+    # nextInterval() is used as the RepeatedTimer interval: it is called after each poll and returns the time to
+    # the next scheduled poll, so a slow poll doesn't delay all the following ones.
+
+    def __init__(self, printer, connections, logger, metrics=None):
+        self._printer = printer
+        self._connections = connections # callable returning the Connection objects to poll
+        self._logger = logger
+        self._metrics = metrics # Metrics.PollMetrics
+        self._period = POLL_IDLE
+        self._nextPoll = None
+
+    def period(self):
+        connections = [conn for conn in self._connections() if conn.is_connected()]
+        polled = [conn for conn in connections if not conn.pushMode]
+
+        if connections and not polled:
+            # The MCUs send the status by themselves. Each update waits for the frames, so no pause between them.
+            return 0
+        elif any(conn.alarmActive() for conn in connections):
+            period = POLL_ALARM
+        elif self._printer.is_printing():
+            period = POLL_PRINTING
+        elif self._printer.is_closed_or_error():
+            period = POLL_OFFLINE
+        else:
+            period = POLL_IDLE
+
+        # Never ask more than the link can carry
+        for conn in polled:
+            period = max(period, conn.statusWireTime() / LINK_BUDGET)
+        return period
+
+    def nextInterval(self):
+        now = time.monotonic()
+        period = self.period()
+        if period != self._period:
+            self._logger.debug("Status poll period changed from %.2fs to %.2fs.", self._period, period)
+            self._period = period
+
+        if self._nextPoll is None:
+            self._nextPoll = now
+        self._nextPoll += period
+        if self._nextPoll < now:
+            # Poll overrun: start again from now instead of firing the missed polls in a burst.
+            # In push mode (period 0) there is no schedule to miss.
+            self._nextPoll = now
+            if (self._metrics is not None) and (period > 0):
+                self._metrics.overruns.inc()
+        return self._nextPoll - now
+
+    def pollStarted(self):
+        # Called by the status timer when a poll starts: records how far from its scheduled time
+        if (self._metrics is not None) and (self._nextPoll is not None) and (self._period > 0):
+            self._metrics.jitter.observe((), abs(time.monotonic() - self._nextPoll))
+
+    def reset(self):
+        self._nextPoll = None
@@ -0,0 +1,130 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import os
+import re
+import threading
+import time
+import serial.tools.list_ports
+
+# Arduino boards and USB-serial chips accepted on AUTO connection (VID:PID)
+ARDUINO_VIDPID = re.compile(r"(2341:(003D|003F|0042|0043|0044|8036)|0403:(6001|6015)|1A86:(5523|7523))", re.IGNORECASE)
+
+# Entries that change when a serial device is plugged or unplugged.
+# devtmpfs updates the /dev modification time on each new or removed node, sysfs doesn't, so its entries are listed.
+DEV_DIR = "/dev"
+SYSFS_TTY_DIR = "/sys/class/tty"
+REFRESH_TTL = 5.0 # Rescan period (s) where none of them exists (Windows)
+
+def _realpath(port):
+    try:
+        return os.path.realpath(port)
+    except (TypeError, ValueError):
+        return None
+
+def _alternatePath(path):
+    # because ports usually have a second available one (.tty or .cu)
+    if "tty." in path:
+        return path.replace("tty.", "cu.", 1)
+    elif "cu." in path:
+        return path.replace("cu.", "tty.", 1)
+    return path
+
+class PortSnapshot():
+    __slots__ = ("arduinoPorts", "realPaths", "printerPort", "printerPaths")
+
+    def __init__(self, arduinoPorts, realPaths, printerPort, printerPaths):
+        self.arduinoPorts = arduinoPorts # Devices matching ARDUINO_VIDPID
+        self.realPaths = realPaths       # device -> real path
+        self.printerPort = printerPort   # Printer port (None if the printer isn't connected)
+        self.printerPaths = printerPaths # Real path of the printer port and its alternate
+
+    def realpath(self, port):
+        path = self.realPaths.get(port)
+        if path is None:
+            path = _realpath(port)
+        return path
+
+    def isPrinterPort(self, port):
+        path = self.realpath(port)
+        return path is not None and path in self.printerPaths
+
+class PortInventory():
+    # Serial ports found on the system, enumerated in one pass and cached.
+    # The list is rebuilt only when a watched directory changes (a device was plugged or unplugged), the printer
+    # port is resolved again only when the printer connection changes.
+
+    def __init__(self, printer, logger):
+        self._printer = printer
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._signature = None
+        self._lastScan = 0
+        self._ports = []
+        self._realPaths = {}
+        self._printerConnection = None
+        self._snapshot = None
+
+    def _deviceSignature(self):
+        signature = []
+        try:
+            signature.append(os.stat(DEV_DIR).st_mtime_ns)
+        except OSError:
+            pass
+        try:
+            signature.append(hash(frozenset(os.listdir(SYSFS_TTY_DIR))))
+        except OSError:
+            pass
+        return tuple(signature)
+
+    def _scan(self):
+        ports = []
+        realPaths = {}
+        for port in serial.tools.list_ports.comports():
+            if ARDUINO_VIDPID.search(port.hwid) or ARDUINO_VIDPID.search(port.description):
+                self._logger.info("Arduino port: %s", port.device)
+                ports.append(port.device)
+            realPaths[port.device] = _realpath(port.device)
+        self._ports = ports
+        self._realPaths = realPaths
+
+    def snapshot(self, force=False):
+        # Returns the current PortSnapshot. Costs a directory listing and one printer connection query when nothing changed.
+        with self._lock:
+            signature = self._deviceSignature()
+            now = time.monotonic()
+            rescan = force or self._snapshot is None or signature != self._signature
+            if not signature and now - self._lastScan > REFRESH_TTL:
+                rescan = True
+            if rescan:
+                self._scan()
+                self._signature = signature
+                self._lastScan = now
+
+            state, port = self._printer.get_current_connection()[:2]
+            printerConnection = port if (state != "Closed" and self._printer.is_operational()) else None
+            if rescan or printerConnection != self._printerConnection:
+                self._printerConnection = printerConnection
+                printerPaths = frozenset()
+                if printerConnection is not None:
+                    path = _realpath(printerConnection)
+                    if path is not None:
+                        printerPaths = frozenset((path, _alternatePath(path)))
+                self._snapshot = PortSnapshot(list(self._ports), self._realPaths, printerConnection, printerPaths)
+            return self._snapshot
@@ -0,0 +1,118 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import queue
+import threading
+import time
+import serial
+from .SerialReader import SerialReader, SERIAL_ERRORS
+
+MCU_BANNER = "R6: Safety Printer MCU"
+
+class PortProber():
+    # Looks for the Safety Printer MCU on several serial ports at the same time.
+    # Each port is opened on its own thread, receives <R6> and is watched for the MCU banner until the deadline.
+    # The first port that answers wins. The other probes are cancelled and their ports closed.
+
+    def __init__(self, ports, baudRate, timeout, terminal, mux=None):
+        self.ports = ports
+        self.mux = mux # SerialMux reading the ports
+        self.baudRate = baudRate
+        self.timeout = timeout
+        self.terminal = terminal # terminal(msg, ttype, *args), as Connection.terminal
+        self.winner = None # (port, serialConn, reader)
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._running = 0
+
+    def run(self):
+        # Blocks until a port answers (returns port, serialConn, reader) or all probes fail (returns None)
+        deadline = time.monotonic() + self.timeout
+        threads = []
+        self._running = len(self.ports)
+        for port in self.ports:
+            thread = threading.Thread(target=self._probe, args=(port, deadline), name="SafetyPrinterProbe")
+            thread.daemon = True
+            threads.append(thread)
+            thread.start()
+
+        while not self._done.wait(0.5):
+            self.terminal("Waiting Safety Printer MCU answer...","Info")
+
+        for thread in threads:
+            thread.join(1.0)
+        return self.winner
+
+    def cancel(self):
+        self._done.set()
+
+    def _finished(self):
+        with self._lock:
+            self._running -= 1
+            if self._running <= 0:
+                self._done.set()
+
+    def _claim(self, port, serialConn, reader):
+        with self._lock:
+            if self.winner is not None or self._done.is_set():
+                return False
+            self.winner = (port, serialConn, reader)
+            self._done.set()
+            return True
+
+    def _probe(self, port, deadline):
+        serialConn = None
+        reader = None
+        try:
+            serialConn = serial.Serial(port, self.baudRate, timeout=0.5)
+            reader = SerialReader(serialConn, mux=self.mux)
+            reader.start()
+            serialConn.write("<R6>".encode())
+
+            while not self._done.is_set() and time.monotonic() < deadline:
+                try:
+                    responseStr = reader.get(0.2)
+                except queue.Empty:
+                    continue
+                self.terminal("%s: %s","Info",port,responseStr)
+                if responseStr.find(MCU_BANNER) > -1:
+                    if self._claim(port, serialConn, reader):
+                        return
+                    break
+            else:
+                if not self._done.is_set():
+                    self.terminal("No answer on port: %s","Info",port)
+
+        except SERIAL_ERRORS as e:
+            with self._lock:
+                self.errors += 1
+            self.terminal("Safety Printer MCU connection error: " + str(e),"ERROR")
+        except (TypeError, ValueError):
+            with self._lock:
+                self.errors += 1
+            self.terminal("Safety Printer MCU connection error: Invalid selected port.","ERROR")
+        finally:
+            if serialConn is not None and (self.winner is None or self.winner[1] is not serialConn):
+                if reader is not None:
+                    reader.stop()
+                serialConn.close()
+                if reader is not None:
+                    reader.wait()
+            self._finished()
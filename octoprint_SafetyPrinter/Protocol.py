@@ -0,0 +1,234 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+'''
+Safety Printer MCU communication protocol codec.
+
+Answers (after the $crc$ envelope is removed by Connection.crcCheck):
+
+R1:<interlock>,<resetInhibit>,<memWarning>,<execWarning>,<tempWarning>,<voltWarning>,#<index>,<enabled>,<active>,<actualValue>,<SP>,<timer>,<trigger>,#...
+R2:#<index>,<label>,<type>,<forceDisable>,<lowSP>,<highSP>,#...
+R4:<version>,<releaseDate>,<EEPROM>,<commProtocol>,<boardType>,
+R5:<SRAM>,<temp>,<volts>,<maxTime>,<avgTime>,
+R7:<feature>,<feature>,...,
+
+Each answer is parsed in one pass to a typed record. Flags ("T"/"F") become bool and numbers become int or float.
+Malformed answers raise ProtocolError.
+
+Optional features are negotiated after the <R4> handshake. The communication protocol stays 6: "<R7>" (capability
+query) answers the features the MCU supports ($crc$R7:push,binary,). A firmware without the query rejects it
+("Invalid command: R7") or doesn't answer, and is polled with text frames. A feature is only used once its mode command
+is confirmed ("S1: Push on."); anything else keeps the plain polling:
+
+push: "<S1 on>" (answer "S1:...") makes the MCU send the R1 frame ($crc$R1:...) by itself right away, then whenever
+      the interlock, a warning or a sensor changes, and at least every PUSH_KEEPALIVE seconds. "<S1 off>" goes back
+      to polling.
+binary: "<S2 on>" (answer "S2:...", the last one in ASCII) makes the MCU send all answers in binary frames, with
+        fixed width fields for the status (see BinaryCodec.py).
+pipeline: "<S3 on>" (answer "S3:...") allows several commands in flight. Each command ends with a sequence number
+          ("<R1 @12>") and its answer starts with it ("@12:$crc$R1:..." or a binary TAGGED frame). Untagged
+          commands are answered untagged.
+
+The MCU must turn all the modes off when it boots or when DTR drops (port closed). On a clean disconnection the plugin
+also sends the "off" commands, but it can't when the port fails.
+'''
+
+from collections import namedtuple
+
+class ProtocolError(ValueError):
+    def __init__(self, frame, field, reason):
+        ValueError.__init__(self, "%s (field %s) in '%s'" % (reason, field, frame))
+        self.frame = frame
+        self.field = field
+        self.reason = reason
+
+# Per sensor records
+SensorStatus = namedtuple("SensorStatus", ["index", "enabled", "active", "actualValue", "SP", "timer", "trigger"])
+SensorInfo = namedtuple("SensorInfo", ["index", "label", "type", "forceDisable", "lowSP", "highSP"])
+
+class StatusHeader():
+    __slots__ = ("interlock", "resetInhibit", "memWarning", "execWarning", "tempWarning", "voltWarning")
+
+    def __init__(self, interlock, resetInhibit, memWarning, execWarning, tempWarning, voltWarning):
+        self.interlock = interlock
+        self.resetInhibit = resetInhibit
+        self.memWarning = memWarning
+        self.execWarning = execWarning
+        self.tempWarning = tempWarning
+        self.voltWarning = voltWarning
+
+class StatusFrame():
+    __slots__ = ("header", "sensors")
+
+    def __init__(self, header, sensors):
+        self.header = header
+        self.sensors = sensors
+
+class FirmwareInfo():
+    __slots__ = ("version", "releaseDate", "EEPROM", "commProtocol", "boardType")
+
+    def __init__(self, version, releaseDate, EEPROM, commProtocol, boardType):
+        self.version = version
+        self.releaseDate = releaseDate
+        self.EEPROM = EEPROM
+        self.commProtocol = commProtocol
+        self.boardType = boardType
+
+class MCUStats():
+    __slots__ = ("SRAM", "temp", "volts", "maxTime", "avgTime")
+
+    def __init__(self, SRAM, temp, volts, maxTime, avgTime):
+        self.SRAM = SRAM
+        self.temp = temp
+        self.volts = volts
+        self.maxTime = maxTime
+        self.avgTime = avgTime
+
+STATUS_HEADER_FIELDS = len(StatusHeader.__slots__)
+SENSOR_STATUS_FIELDS = len(SensorStatus._fields)
+SENSOR_INFO_FIELDS = len(SensorInfo._fields)
+
+_FLAGS = {"T": True, "F": False}
+
+# Optional features, in the order they are turned on
+FEATURES = ("binary", "pipeline", "push")
+# Mode command of each feature
+MODE_COMMANDS = {"push": "S1", "binary": "S2", "pipeline": "S3"}
+
+PUSH_KEEPALIVE = 5.0
+
+def isRejection(frame, command):
+    # Answer of the MCU to a command it doesn't know
+    if not frame.startswith("Invalid command"):
+        return False
+    words = frame.partition(":")[2].split()
+    return bool(words) and words[0].upper() == command.upper()
+
+def isModeOn(frame, command):
+    # Mode command answer ("S1: Push on.") confirming the mode is on
+    if not frame.startswith(command + ":"):
+        return False
+    words = frame[len(command) + 1:].strip().rstrip(".").split()
+    return bool(words) and words[-1].lower() == "on"
+
+def isStatusFrame(frame):
+    # Raw status frame ($crc$R1:...), before the CRC check
+    return frame.startswith("$") and frame.find("$R1:", 1) > 0
+
+def _fields(frame, command):
+    # Checks the command ID and splits the answer. The trailing comma sent by the MCU is removed.
+    if not frame.startswith(command + ":"):
+        raise ProtocolError(frame, 0, "Expected %s answer" % command)
+    fields = frame[len(command) + 1:].strip().split(",")
+    if fields and fields[-1] == "":
+        fields.pop()
+    return fields
+
+def _flag(frame, field, value):
+    try:
+        return _FLAGS[value]
+    except KeyError:
+        raise ProtocolError(frame, field, "Invalid flag '%s'" % value)
+
+def _int(frame, field, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise ProtocolError(frame, field, "Invalid integer '%s'" % value)
+
+def _number(frame, field, value):
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            raise ProtocolError(frame, field, "Invalid number '%s'" % value)
+
+def _index(frame, field, value):
+    if not value.startswith("#") or not value[1:].isdigit():
+        raise ProtocolError(frame, field, "Invalid sensor index '%s'" % value)
+    return int(value[1:])
+
+def _sensorGroups(frame, fields, start, size):
+    if (len(fields) - start) % size:
+        raise ProtocolError(frame, len(fields), "Incomplete sensor record")
+    return range(start, len(fields), size)
+
+def parseStatus(frame):
+    # <R1> answer
+    fields = _fields(frame, "R1")
+    if len(fields) < STATUS_HEADER_FIELDS:
+        raise ProtocolError(frame, len(fields), "Incomplete status header")
+    header = StatusHeader(*[_flag(frame, i, fields[i]) for i in range(STATUS_HEADER_FIELDS)])
+
+    sensors = []
+    for i in _sensorGroups(frame, fields, STATUS_HEADER_FIELDS, SENSOR_STATUS_FIELDS):
+        sensors.append(SensorStatus(
+            _index(frame, i, fields[i]),
+            _flag(frame, i + 1, fields[i + 1]),
+            _flag(frame, i + 2, fields[i + 2]),
+            _number(frame, i + 3, fields[i + 3]),
+            _number(frame, i + 4, fields[i + 4]),
+            _int(frame, i + 5, fields[i + 5]),
+            _flag(frame, i + 6, fields[i + 6])))
+    return StatusFrame(header, sensors)
+
+def formatStatus(status):
+    # StatusFrame back to the <R1> answer text (for the terminal, when it was received in binary)
+    fields = ["R1:"]
+    for name in StatusHeader.__slots__:
+        fields.append("T," if getattr(status.header, name) else "F,")
+    for sensor in status.sensors:
+        fields.append("#%d,%s,%s,%s,%s,%d,%s," % (sensor.index, "T" if sensor.enabled else "F", "T" if sensor.active else "F",
+                                                  sensor.actualValue, sensor.SP, sensor.timer, "T" if sensor.trigger else "F"))
+    return "".join(fields)
+
+def parseSensorInfo(frame):
+    # <R2> answer
+    fields = _fields(frame, "R2")
+    sensors = []
+    for i in _sensorGroups(frame, fields, 0, SENSOR_INFO_FIELDS):
+        sensors.append(SensorInfo(
+            _index(frame, i, fields[i]),
+            fields[i + 1],
+            _int(frame, i + 2, fields[i + 2]),
+            _flag(frame, i + 3, fields[i + 3]),
+            _number(frame, i + 4, fields[i + 4]),
+            _number(frame, i + 5, fields[i + 5])))
+    return sensors
+
+def parseFirmwareInfo(frame):
+    # <R4> answer. Identifiers are kept as strings.
+    fields = _fields(frame, "R4")
+    if len(fields) < len(FirmwareInfo.__slots__):
+        raise ProtocolError(frame, len(fields), "Incomplete firmware info")
+    return FirmwareInfo(*[field.strip() for field in fields[:len(FirmwareInfo.__slots__)]])
+
+def parseMCUStats(frame):
+    # <R5> answer
+    fields = _fields(frame, "R5")
+    if len(fields) < len(MCUStats.__slots__):
+        raise ProtocolError(frame, len(fields), "Incomplete MCU stats")
+    return MCUStats(*[_number(frame, i, fields[i]) for i in range(len(MCUStats.__slots__))])
+
+def parseFeatures(frame):
+    # <R7> answer. Features unknown to this plugin are left out.
+    fields = _fields(frame, "R7")
+    return tuple(feature for feature in FEATURES if feature in [field.strip().lower() for field in fields])
@@ -0,0 +1,92 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import random
+from .Lanes import LANE_SAFETY, SAFETY_DEADLINE, SAFETY_RETRY
+
+# Why a command attempt failed
+ERROR_BUSY = "busy"                 # Port (or pipeline window) not free in time. The command was not sent.
+ERROR_BAD_CRC = "bad CRC"           # Answer received, but corrupted (ex.: noisy USB cable)
+ERROR_BAD_ANSWER = "bad answer"     # Answer to another command
+ERROR_NO_ANSWER = "no answer"       # Sent, but no answer in time. The MCU may have run it.
+ERROR_DISCONNECTED = "disconnected" # Port closed or failed. Never retried.
+ERROR_REJECTED = "rejected"         # The MCU doesn't know the command ("Invalid command"). Never retried.
+
+TRANSIENT_ERRORS = frozenset((ERROR_BUSY, ERROR_BAD_CRC, ERROR_BAD_ANSWER, ERROR_NO_ANSWER))
+UNSENT_ERRORS = frozenset((ERROR_BUSY,))
+
+class RetryPolicy():
+    # Retries a command until an overall deadline, with exponential backoff and jitter between the attempts.
+    # Only the errors in "retryable" are retried, the others end the command at once.
+
+    def __init__(self, deadline, baseDelay=0.05, maxDelay=1.0, multiplier=2.0, jitter=0.5, retryable=TRANSIENT_ERRORS):
+        self.deadline = deadline
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.retryable = retryable
+
+    def withDeadline(self, deadline):
+        return RetryPolicy(deadline, self.baseDelay, self.maxDelay, self.multiplier, self.jitter, self.retryable)
+
+    def canRetry(self, error):
+        return error in self.retryable
+
+    def delay(self, attempt):
+        # Pause (s) after the attempt number "attempt" (1 = first) failed
+        delay = min(self.maxDelay, self.baseDelay * self.multiplier ** (attempt - 1))
+        return delay * (1.0 - self.jitter * random.random())
+
+# Commands that are safe to send again after an attempt without answer. A command not listed here (ex.: typed
+# in the terminal) is only retried if it was never sent. <C9> (MCU reset) doesn't answer while the MCU reboots.
+IDEMPOTENT_COMMANDS = ("R1", "R2", "R4", "R5", "R6", "C1", "C2", "C3", "C4", "C5", "C6", "C7", "C8", "S1", "S2", "S3")
+
+def commandPolicy(commandId, lane, deadline):
+    # Safety commands retry faster, and never give up before the caller's deadline. SAFETY_DEADLINE (see Lanes.py) is
+    # their latency target: a later answer is still taken, but recorded as a deadline miss.
+    retryable = TRANSIENT_ERRORS if commandId.upper() in IDEMPOTENT_COMMANDS else UNSENT_ERRORS
+    if lane == LANE_SAFETY:
+        return RetryPolicy(max(deadline, SAFETY_DEADLINE), baseDelay=SAFETY_RETRY, maxDelay=0.2, retryable=retryable)
+    return RetryPolicy(deadline, retryable=retryable)
+
+class AttemptStats():
+    # Attempts per command ID
+    __slots__ = ("requests", "attempts", "failures", "lastAttempts", "maxAttempts", "lastError")
+
+    def __init__(self):
+        self.requests = 0
+        self.attempts = 0
+        self.failures = 0
+        self.lastAttempts = 0
+        self.maxAttempts = 0
+        self.lastError = None
+
+    def record(self, attempts, error):
+        self.requests += 1
+        self.attempts += attempts
+        self.lastAttempts = attempts
+        self.maxAttempts = max(self.maxAttempts, attempts)
+        self.lastError = error
+        if error is not None:
+            self.failures += 1
+
+    def asDict(self):
+        return {"requests": self.requests, "attempts": self.attempts, "failures": self.failures,
+                "lastAttempts": self.lastAttempts, "maxAttempts": self.maxAttempts, "lastError": self.lastError}
@@ -0,0 +1,145 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+'''
+Batch sensor configuration (configureSensors API command).
+
+All the changes are checked before any command is sent. Setpoints and timers are applied first and enables last, so
+a sensor is never enabled with its old setpoint (spurious trip).
+'''
+
+CONFIG_DEADLINE = 10.0 # Time (s) for the whole batch, retries and <C5> included
+
+# Item status
+STATUS_OK = "ok"
+STATUS_UNCHANGED = "unchanged" # Already set on the MCU: no command sent
+STATUS_INVALID = "invalid"
+STATUS_FAILED = "failed"       # Not answered by the MCU
+STATUS_SKIPPED = "skipped"     # Not sent: a previous item failed or the deadline expired
+
+DEADLINE_EXPIRED = "Deadline expired before it was sent."
+
+# Field: (command, apply order)
+FIELDS = {
+    "SP": ("C4", 0),
+    "timer": ("C7", 0),
+    "enabled": ("C3", 1),
+}
+
+class ConfigItem():
+    __slots__ = ("index", "field", "value", "status", "error")
+
+    def __init__(self, index, field, value):
+        self.index = index
+        self.field = field
+        self.value = value
+        self.status = None
+        self.error = None
+
+    def command(self):
+        if self.field == "enabled":
+            argument = "on" if self.value else "off"
+        else:
+            argument = str(self.value)
+        return "<%s %d %s>" % (FIELDS[self.field][0], self.index, argument)
+
+    def fail(self, status, error):
+        self.status = status
+        self.error = error
+
+    def asDict(self):
+        result = {"id": self.index, "field": self.field, "value": self.value, "status": self.status}
+        if self.error:
+            result["error"] = self.error
+        return result
+
+def _number(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    number = float(value)
+    if number != number or number in (float("inf"), float("-inf")):
+        raise ValueError(value)
+    return int(number) if number.is_integer() else number
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ("on", "true", "1"):
+        return True
+    if str(value).lower() in ("off", "false", "0"):
+        return False
+    raise ValueError(value)
+
+def _check(item, sensors):
+    # Converts and checks the value of one item against the sensor limits (SensorStore). Returns the error or None.
+    if not (0 <= item.index < sensors.size):
+        return "Unknown sensor."
+    try:
+        if item.field == "SP":
+            item.value = _number(item.value)
+            lowSP = sensors.get("lowSP", item.index)
+            highSP = sensors.get("highSP", item.index)
+            if not (lowSP <= item.value <= highSP):
+                return "Setpoint out of range (%s to %s)." % (lowSP, highSP)
+        elif item.field == "timer":
+            item.value = _number(item.value)
+            if (not isinstance(item.value, int)) or (item.value < 0):
+                return "Timer must be a non-negative integer."
+        elif item.field == "enabled":
+            item.value = _flag(item.value)
+            if item.value and sensors.get("forceDisable", item.index):
+                return "Sensor disabled by the firmware."
+    except (TypeError, ValueError):
+        return "Invalid value."
+    if sensors.get(item.field, item.index) == item.value:
+        item.status = STATUS_UNCHANGED
+    return None
+
+def parseChanges(changes, sensors):
+    # [{"id": 1, "SP": 60, "timer": 5, "enabled": true}, ...] to ConfigItems in apply order.
+    # Returns (items, valid). Invalid items have their status and error set.
+    if not isinstance(changes, list):
+        raise ValueError("changes must be a list.")
+    items = []
+    seen = set()
+    valid = True
+    for change in changes:
+        if not isinstance(change, dict):
+            raise ValueError("Each change must be an object.")
+        try:
+            index = int(change.get("id"))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid sensor id: %s" % change.get("id"))
+        for field, value in change.items():
+            if field == "id":
+                continue
+            item = ConfigItem(index, field, value)
+            items.append(item)
+            if field not in FIELDS:
+                error = "Unknown field."
+            elif (index, field) in seen:
+                error = "Duplicated change."
+            else:
+                error = _check(item, sensors)
+            seen.add((index, field))
+            if error:
+                item.fail(STATUS_INVALID, error)
+                valid = False
+    items.sort(key=lambda item: FIELDS.get(item.field, (None, 0))[1])
+    return items, valid
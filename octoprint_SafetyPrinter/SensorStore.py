@@ -0,0 +1,126 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+from array import array
+
+def _number(value):
+    # Integers are stored as double, but shown without decimals.
+    if value.is_integer():
+        return int(value)
+    return value
+
+# Sensor fields: name, array type code (None = python list) and the type sent to the UI.
+# Field names match Protocol.SensorInfo / Protocol.SensorStatus.
+INFO_FIELDS = (
+    ("label", None, str),
+    ("type", "B", int),
+    ("forceDisable", "B", bool),
+    ("lowSP", "d", _number),
+    ("highSP", "d", _number),
+)
+
+STATUS_FIELDS = (
+    ("enabled", "B", bool),
+    ("active", "B", bool),
+    ("actualValue", "d", _number),
+    ("SP", "d", _number),
+    ("timer", "l", int),
+    ("trigger", "B", bool),
+)
+
+FIELDS = INFO_FIELDS + STATUS_FIELDS
+_INFO_NAMES = tuple(name for name, _, _ in INFO_FIELDS)
+_STATUS_NAMES = tuple(name for name, _, _ in STATUS_FIELDS)
+FIELD_BIT = dict((name, 1 << bit) for bit, (name, _, _) in enumerate(FIELDS))
+ALL_FIELDS = (1 << len(FIELDS)) - 1
+
+class SensorStore():
+    # Sensor state in columns: one typed array per field and a dirty bitmask per sensor.
+    # A field bit is set only when its value really changes, so the UI receives just what changed.
+
+    def __init__(self):
+        self.size = 0
+        self.columns = {}
+        self.export = {}
+        for name, typecode, export in FIELDS:
+            self.columns[name] = [] if typecode is None else array(typecode)
+            self.export[name] = export
+        self.dirty = array("L")
+        self.alarmNotified = array("B")
+
+    def resize(self, size):
+        # Grows (new sensors are fully dirty) or shrinks the store.
+        if size > self.size:
+            grow = size - self.size
+            for name, typecode, _ in FIELDS:
+                if typecode is None:
+                    self.columns[name].extend([""] * grow)
+                else:
+                    self.columns[name].extend(array(typecode, [0]) * grow)
+            self.dirty.extend(array("L", [ALL_FIELDS]) * grow)
+            self.alarmNotified.extend(array("B", [0]) * grow)
+        elif size < self.size:
+            for column in self.columns.values():
+                del column[size:]
+            del self.dirty[size:]
+            del self.alarmNotified[size:]
+        self.size = size
+
+    def _set(self, index, names, record):
+        mask = 0
+        columns = self.columns
+        for name in names:
+            value = getattr(record, name)
+            column = columns[name]
+            if column[index] != value:
+                column[index] = value
+                mask |= FIELD_BIT[name]
+        self.dirty[index] |= mask
+        return mask
+
+    def setInfo(self, index, info):
+        # Protocol.SensorInfo (<R2>). Returns the changed fields bitmask.
+        return self._set(index, _INFO_NAMES, info)
+
+    def setStatus(self, index, status):
+        # Protocol.SensorStatus (<R1>). Returns the changed fields bitmask.
+        return self._set(index, _STATUS_NAMES, status)
+
+    def get(self, name, index):
+        return self.export[name](self.columns[name][index])
+
+    def markAllDirty(self):
+        for index in range(self.size):
+            self.dirty[index] = ALL_FIELDS
+
+    def anyActive(self):
+        return any(self.columns["active"])
+
+    def dirtySensors(self):
+        return [index for index in range(self.size) if self.dirty[index]]
+
+    def popChanges(self, index):
+        # Returns {field: value} with the dirty fields of a sensor and clears them.
+        mask = self.dirty[index]
+        self.dirty[index] = 0
+        changes = {}
+        for name, _, export in FIELDS:
+            if mask & FIELD_BIT[name]:
+                changes[name] = export(self.columns[name][index])
+        return changes
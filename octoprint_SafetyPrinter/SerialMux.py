@@ -0,0 +1,147 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import io
+import os
+import selectors
+import threading
+
+READ_SIZE = 4096
+REQUEST_TIMEOUT = 1.0 # Time (s) waiting for the event loop to add or remove a port
+
+class SerialMux(threading.Thread):
+    # Reads all the Safety Printer serial ports on one event loop thread (selectors: epoll on Linux).
+    # Ports are read without blocking as soon as they have data, and the bytes go to the SerialReader of the port,
+    # which splits and dispatches the frames. With no data, the thread sleeps in select() and uses no CPU.
+    # Ports without a file descriptor (Windows, pyserial URL handlers) keep a reader thread (see SerialReader.start).
+
+    def __init__(self, logger):
+        threading.Thread.__init__(self, name="SafetyPrinterSerialIO")
+        self.daemon = True
+        self._logger = logger
+        self._selector = selectors.DefaultSelector()
+        self._wakeRead, self._wakeWrite = os.pipe()
+        os.set_blocking(self._wakeRead, False)
+        os.set_blocking(self._wakeWrite, False)
+        self._selector.register(self._wakeRead, selectors.EVENT_READ, None)
+        self._lock = threading.Lock()
+        self._requests = []
+        self._fds = {} # SerialReader: file descriptor
+        self._stopEvent = threading.Event()
+
+    @staticmethod
+    def supports(serialConn):
+        if os.name != "posix":
+            return False
+        try:
+            return serialConn.fileno() >= 0
+        except (AttributeError, ValueError, OSError, io.UnsupportedOperation):
+            return False
+
+    def register(self, reader):
+        self._request(self._add, reader)
+
+    def unregister(self, reader):
+        # Returns after the port is out of the event loop, so it can be closed.
+        self._request(self._remove, reader)
+
+    def ports(self):
+        return len(self._fds)
+
+    def stop(self):
+        self._stopEvent.set()
+        self._wake()
+
+    def _request(self, action, reader):
+        if threading.current_thread() is self:
+            action(reader)
+            return
+        done = threading.Event()
+        with self._lock:
+            self._requests.append((action, reader, done))
+        self._wake()
+        if not done.wait(REQUEST_TIMEOUT):
+            self._logger.warning("Serial I/O thread didn't answer in %.1fs.", REQUEST_TIMEOUT)
+
+    def _wake(self):
+        try:
+            os.write(self._wakeWrite, b"\x00")
+        except BlockingIOError:
+            pass # Already awake
+
+    def _add(self, reader):
+        fd = reader.serialConn.fileno()
+        self._selector.register(fd, selectors.EVENT_READ, reader)
+        self._fds[reader] = fd
+
+    def _remove(self, reader):
+        fd = self._fds.pop(reader, None)
+        if fd is not None:
+            try:
+                self._selector.unregister(fd)
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def _serveRequests(self):
+        try:
+            while os.read(self._wakeRead, READ_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+        with self._lock:
+            requests = self._requests
+            self._requests = []
+        for action, reader, done in requests:
+            try:
+                action(reader)
+            except (ValueError, OSError) as e:
+                reader.error(e)
+            finally:
+                done.set()
+
+    def _read(self, reader, fd):
+        try:
+            data = os.read(fd, READ_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            # USB cable unplugged
+            self._remove(reader)
+            reader.error(e)
+            return
+        if not data:
+            self._remove(reader)
+            reader.error(OSError("Serial port closed."))
+            return
+        try:
+            reader.feed(data)
+        except Exception:
+            # A bad frame handler must not stop the other ports
+            self._logger.exception("Error while handling Safety Printer MCU data.")
+
+    def run(self):
+        while not self._stopEvent.is_set():
+            for key, _ in self._selector.select():
+                if key.data is None:
+                    self._serveRequests()
+                else:
+                    self._read(key.data, key.fd)
+        for reader in list(self._fds):
+            self._remove(reader)
+        self._serveRequests()
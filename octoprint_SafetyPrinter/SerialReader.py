@@ -0,0 +1,122 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import sys
+import queue
+import threading
+import time
+import serial
+
+if ((sys.platform == 'linux') or (sys.platform =='linux2')):
+    import termios
+    SERIAL_ERRORS = (serial.SerialException, OSError, termios.error)
+else:
+    SERIAL_ERRORS = (serial.SerialException, OSError)
+
+# The MCU terminates every answer with a new line (0x00 in binary mode). A frame bigger than this is garbage
+# (wrong BAUD rate, noise). <R1> with 256 sensors has about 6 kB.
+MAX_FRAME_SIZE = 8192
+
+class SerialReader():
+    # Owns all reads from the Safety Printer MCU serial port.
+    # Incoming bytes are split in frames (one per line) as soon as they arrive and queued to the waiting caller.
+    # When a decoder is set (binary mode, see BinaryCodec.py), frames end with 0x00 and are queued as decoded.
+    # The port is read by the shared event loop (SerialMux) or, if it can't watch the port, by a thread of its own.
+
+    def __init__(self, serialConn, onError=None, onFrame=None, mux=None):
+        self.serialConn = serialConn
+        self.onError = onError
+        self.onFrame = onFrame # Returns True if the frame was handled and must not be queued (ex.: pushed status)
+        self.decoder = None    # Binary mode: returns the decoded frame or None to drop it
+        self.frames = queue.Queue()
+        self.lastRxTime = 0.0 # time.monotonic() of the last bytes received
+        self._buffer = bytearray()
+        self._stopEvent = threading.Event()
+        self._mux = mux if (mux is not None) and mux.is_alive() and mux.supports(serialConn) else None
+        self._thread = None
+
+    def start(self):
+        if self._mux is not None:
+            self._mux.register(self)
+        else:
+            self._thread = threading.Thread(target=self.run, name="SafetyPrinterReader")
+            self._thread.daemon = True
+            self._thread.start()
+
+    def error(self, e):
+        if not self._stopEvent.is_set() and self.onError:
+            self.onError(e)
+
+    def run(self):
+        while not self._stopEvent.is_set():
+            try:
+                # Blocks up to the port timeout when there is nothing to read.
+                data = self.serialConn.read(self.serialConn.in_waiting or 1)
+            except SERIAL_ERRORS + (TypeError, AttributeError) as e:
+                # TypeError/AttributeError are raised by pyserial when the port is closed under our feet.
+                self.error(e)
+                break
+            if data:
+                self.feed(data)
+
+    def feed(self, data):
+        # Splits raw bytes in frames. Incomplete frames stay on the buffer until the rest arrives.
+        # onFrame may set the decoder, so the delimiter is checked again for each frame.
+        self.lastRxTime = time.monotonic()
+        self._buffer += data
+        while True:
+            decoder = self.decoder
+            pos = self._buffer.find(b"\x00" if decoder else b"\n")
+            if pos < 0:
+                break
+            frame = bytes(self._buffer[:pos])
+            del self._buffer[:pos + 1]
+            if decoder:
+                frame = decoder(frame) if frame else None
+            else:
+                frame = frame.decode(errors="replace").strip()
+            if frame and not (self.onFrame and self.onFrame(frame)):
+                self.frames.put(frame)
+
+        if len(self._buffer) > MAX_FRAME_SIZE:
+            self._buffer.clear()
+
+    def get(self, timeout):
+        # Returns the next received frame. Raises queue.Empty if nothing arrives until timeout (s) expires.
+        return self.frames.get(True, timeout)
+
+    def clear(self):
+        # Discards frames nobody asked for (late answers, MCU boot messages).
+        discarded = []
+        while True:
+            try:
+                discarded.append(self.frames.get_nowait())
+            except queue.Empty:
+                return discarded
+
+    def stop(self):
+        # Must be called before closing the port, so the read error raised by the close isn't reported.
+        self._stopEvent.set()
+        if self._mux is not None:
+            self._mux.unregister(self)
+
+    def wait(self, timeout=1.0):
+        thread = self._thread
+        if thread is not None and thread.is_alive() and threading.current_thread() is not thread:
+            thread.join(timeout)
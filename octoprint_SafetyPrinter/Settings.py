@@ -0,0 +1,66 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+from collections import namedtuple
+
+# Plugin settings and their types. Defaults are in SafetyPrinterPlugin.get_settings_defaults.
+SETTINGS = (
+    ("serialport", str),
+    ("BAUDRate", str),
+    ("abortTimeout", int),
+    ("rememberCheckBox", bool),
+    ("lastCheckBoxValue", bool),
+    ("turnOffPrinter", bool),
+    ("showTerminal", bool),
+    ("loggingLevel", str),
+    ("notifyWarnings", bool),
+    ("useEmoji", bool),
+    ("additionalPort", str),
+    ("notifyVoltageTemp", bool),
+    ("avrdude_path", str),
+    ("terminalMsgFilter", bool),
+    ("forceRedComm", bool),
+    ("boards", list),
+)
+
+SettingsSnapshot = namedtuple("SettingsSnapshot", [name for name, _ in SETTINGS])
+
+class SettingsCache():
+    # Immutable, typed copy of the plugin settings. Reading OctoPrint settings walks all its config layers, so the
+    # status poll and the terminal read this copy instead. rebuild() must be called whenever the settings are saved.
+
+    def __init__(self, settings):
+        self._settings = settings
+        self.current = None
+
+    def rebuild(self):
+        values = []
+        for name, kind in SETTINGS:
+            if kind is bool:
+                values.append(bool(self._settings.get_boolean([name])))
+            elif kind is int:
+                values.append(self._settings.get_int([name]))
+            elif kind is list:
+                value = self._settings.get([name])
+                values.append(tuple(value) if value else ())
+            else:
+                value = self._settings.get([name])
+                values.append(value if value is None else str(value))
+        self.current = SettingsSnapshot(*values)
+        return self.current
@@ -0,0 +1,447 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+'''
+Virtual Safety Printer MCU on a pseudo-terminal (Linux), speaking communication protocol 6. By default it behaves like
+a firmware without the <R7> capability query. --features lists the optional features it reports and accepts
+(see Protocol.py), ex.: --features push,binary,pipeline
+
+    push: status push ("<S1 on>")
+    binary: binary frames ("<S2 on>", see BinaryCodec.py)
+    pipeline: pipelined commands ("<S3 on>", answers tagged with the command "@seq")
+
+Run it and set the plugin serialport to the printed path (or to the --link path):
+
+    python -m octoprint_SafetyPrinter.Simulator --sensors 8 --link /tmp/ttySafetyPrinter
+
+Sensors are numbered from 0. Even sensors are analog (temperature, alarm when value >= SP), odd ones digital
+(alarm when value == SP). An enabled sensor in alarm for longer than its timer (s) trips the interlock, which stays
+tripped until <C1>.
+
+Scripts (--script, several allowed) change the inputs at a given time (s) after start:
+
+    5:value:0:300     sensor #0 value set to 300
+    12:trip           emergency button (same as <C2>)
+    20:reset          same as <C1>
+
+Faults: --delay (s before each answer), --drop (probability of losing each byte), --bad-crc (probability of a wrong
+$crc$ or binary frame CRC), --baud (answers paced at this BAUD rate, 0: as fast as possible). The pushStalled attribute stops the status
+push (firmware fault).
+'''
+
+import argparse
+import os
+import random
+import select
+import signal
+import sys
+import threading
+import time
+from . import BinaryCodec
+from . import Protocol
+from .Crc16 import crc16
+
+MCU_BANNER = "R6: Safety Printer MCU"
+FW_VERSION = "1.3.0-sim"
+FW_RELEASE_DATE = "01/01/2023"
+FW_EEPROM = "1"
+FW_COMM_PROTOCOL = "6"
+FW_BOARD_TYPE = "SIM"
+BITS_PER_BYTE = 10
+WIRE_CHUNK = 64 # Bytes written at a time when the BAUD rate is simulated
+
+TYPE_DIGITAL = 0
+TYPE_ANALOG = 1
+
+# Optional feature of each mode command (see Protocol.py)
+MODE_COMMANDS = dict((command, feature) for feature, command in Protocol.MODE_COMMANDS.items())
+
+class SimSensor():
+    __slots__ = ("index", "label", "type", "forceDisable", "lowSP", "highSP", "enabled", "value", "SP", "timer",
+                 "alarmSince", "trigger", "defaults")
+
+    def __init__(self, index):
+        self.index = index
+        self.type = TYPE_ANALOG if index % 2 == 0 else TYPE_DIGITAL
+        if self.type == TYPE_ANALOG:
+            self.label = "Temp %d" % index
+            self.lowSP, self.highSP = 0, 300
+            self.defaults = (True, 25, 250, 5)  # enabled, value, SP, timer
+        else:
+            self.label = "Switch %d" % index
+            self.lowSP, self.highSP = 0, 1
+            self.defaults = (True, 0, 1, 0)
+        self.forceDisable = False
+        self.alarmSince = None
+        self.trigger = False
+        self.loadDefaults()
+
+    def loadDefaults(self):
+        self.enabled, self.value, self.SP, self.timer = self.defaults
+
+    def active(self):
+        if not self.enabled:
+            return False
+        if self.type == TYPE_ANALOG:
+            return self.value >= self.SP
+        return self.value == self.SP
+
+def _flag(value):
+    return "T" if value else "F"
+
+def _corrupt(frame):
+    # Flips bits of the last byte before the delimiter (CRC or COBS code): the frame fails its check
+    data = bytearray(frame)
+    data[-2] ^= 0x5A if data[-2] != 0x5A else 0xA5
+    return bytes(data)
+
+def parseScript(text):
+    # "5:value:0:300" -> (5.0, "value", ["0", "300"])
+    fields = text.split(":")
+    if len(fields) < 2:
+        raise ValueError("Invalid script: " + text)
+    return (float(fields[0]), fields[1], fields[2:])
+
+class Simulator(threading.Thread):
+    # Opens a pseudo-terminal and answers the plugin commands like a Safety Printer MCU.
+
+    def __init__(self, sensors=4, delay=0.0, dropRate=0.0, badCrcRate=0.0, baudRate=0, script=(), seed=None, link=None,
+                 features=None):
+        threading.Thread.__init__(self, name="SafetyPrinterSimulator")
+        self.daemon = True
+        import pty
+        import tty
+        self._master, self._slave = pty.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False) # Like a UART: bytes nobody reads are lost, the MCU never waits
+        self.path = os.ttyname(self._slave)
+        self.link = link
+        if link:
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(self.path, link)
+
+        self.sensors = [SimSensor(index) for index in range(sensors)]
+        self.interlock = False
+        self.resetInhibit = False
+        self.printerPower = True
+        self.features = None if features is None else tuple(features) # None: <R7> unknown
+        self.push = False           # <S1 on>: status sent without being asked
+        self.pushKeepalive = Protocol.PUSH_KEEPALIVE
+        self.pushStalled = False    # Fault: push mode on, but no status sent
+        self.binary = False         # <S2 on>: answers in binary frames
+        self.pipeline = False       # <S3 on>: "@seq" of the commands sent back with their answers
+        self.delay = delay
+        self.dropRate = dropRate
+        self.badCrcRate = badCrcRate
+        self.baudRate = baudRate
+        self.script = sorted(script)
+        self.random = random.Random(seed)
+        self.commands = 0       # Commands received
+        self.bytesSent = 0
+        self.lastCommandTime = 0.0 # time.monotonic() when the last command arrived
+        self.lastCommand = ""
+        self.tripWireTime = None # time.monotonic() when the first <R1> answer with the interlock tripped started to be sent
+        self._lock = threading.RLock()
+        self._buffer = b""
+        self._stopEvent = threading.Event()
+        self._start = None
+        self._resetAt = None
+        self._pushed = None         # Last status pushed and when
+        self._pushTime = 0.0
+
+    # *******************************  Inputs (also used by scripts)
+
+    def setValue(self, index, value):
+        with self._lock:
+            self.sensors[index].value = value
+            self.update()
+
+    def trip(self):
+        with self._lock:
+            if not self.interlock:
+                self.tripWireTime = None
+            self.interlock = True
+
+    def reset(self):
+        # <C1>: only if no sensor is in alarm
+        with self._lock:
+            self.update()
+            if any(sensor.active() for sensor in self.sensors):
+                self.resetInhibit = True
+                return False
+            self.interlock = False
+            self.resetInhibit = False
+            self.tripWireTime = None
+            for sensor in self.sensors:
+                sensor.trigger = False
+            return True
+
+    def update(self, now=None):
+        # Alarm timers: an enabled sensor in alarm for longer than its timer trips the interlock
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for sensor in self.sensors:
+                if sensor.active():
+                    if sensor.alarmSince is None:
+                        sensor.alarmSince = now
+                    if now - sensor.alarmSince >= sensor.timer:
+                        sensor.trigger = True
+                        self.interlock = True
+                else:
+                    sensor.alarmSince = None
+
+    def _runScript(self, now):
+        elapsed = now - self._start
+        while self.script and self.script[0][0] <= elapsed:
+            _, action, args = self.script.pop(0)
+            if action == "value":
+                self.setValue(int(args[0]), float(args[1]) if "." in args[1] else int(args[1]))
+            elif action == "trip":
+                self.trip()
+            elif action == "reset":
+                self.reset()
+
+    # *******************************  Answers
+
+    def status(self):
+        fields = ["R1:", _flag(self.interlock), ",", _flag(self.resetInhibit), ",F,F,F,F,"]
+        for sensor in self.sensors:
+            fields.append("#%d,%s,%s,%s,%s,%d,%s," % (sensor.index, _flag(sensor.enabled), _flag(sensor.active()),
+                                                       sensor.value, sensor.SP, sensor.timer, _flag(sensor.trigger)))
+        return "".join(fields)
+
+    def sensorInfo(self):
+        return "R2:" + "".join("#%d,%s,%d,%s,%s,%s," % (sensor.index, sensor.label, sensor.type, _flag(sensor.forceDisable),
+                                                        sensor.lowSP, sensor.highSP) for sensor in self.sensors)
+
+    def answer(self, command):
+        # Returns (answer, with CRC envelope) for a command without "<>"
+        fields = command.split()
+        commandId = fields[0].upper() if fields else ""
+        args = fields[1:]
+        with self._lock:
+            self.update()
+            if commandId == "R1":
+                return self.status(), True
+            elif commandId == "R2":
+                return self.sensorInfo(), True
+            elif commandId == "R4":
+                return "R4:%s,%s,%s,%s,%s," % (FW_VERSION, FW_RELEASE_DATE, FW_EEPROM, FW_COMM_PROTOCOL, FW_BOARD_TYPE), True
+            elif commandId == "R5":
+                return "R5:1024,35.5,5.01,12,3,", True
+            elif commandId == "R6":
+                return MCU_BANNER, False
+            elif commandId == "R7" and self.features is not None:
+                return "R7:" + "".join(feature + "," for feature in self.features), True
+            elif commandId == "C1":
+                return ("C1: Interlock reset." if self.reset() else "C1: Reset inhibited: sensor in alarm."), False
+            elif commandId == "C2":
+                self.trip()
+                return "C2: Emergency button.", False
+            elif commandId == "C5":
+                return "C5: Configuration saved.", False
+            elif commandId == "C6" and args:
+                self.printerPower = args[0].lower() == "on"
+                return "C6: Printer power %s." % ("on" if self.printerPower else "off"), False
+            elif commandId == "C9":
+                delay = int(args[0]) / 1000.0 if args else 0.5
+                self._resetAt = time.monotonic() + delay
+                return "C9: Resetting.", False
+            elif (commandId in MODE_COMMANDS) and (MODE_COMMANDS[commandId] in (self.features or ())) and args:
+                # Modes of the optional features. Unknown without the feature (invalid command).
+                feature = MODE_COMMANDS[commandId]
+                on = args[0].lower() == "on"
+                setattr(self, feature, on)
+                if feature == "push":
+                    self._pushed = None
+                return "%s: %s %s." % (commandId, feature.capitalize(), "on" if on else "off"), False
+            elif commandId in ("C3", "C4", "C7", "C8") and args:
+                try:
+                    sensor = self.sensors[int(args[0])]
+                except (ValueError, IndexError):
+                    return "%s: Invalid sensor." % commandId, False
+                if commandId == "C3" and len(args) > 1:
+                    sensor.enabled = (args[1].lower() == "on") and not sensor.forceDisable
+                elif commandId == "C4" and len(args) > 1:
+                    sensor.SP = float(args[1]) if "." in args[1] else int(args[1])
+                elif commandId == "C7" and len(args) > 1:
+                    sensor.timer = int(args[1])
+                elif commandId == "C8":
+                    sensor.loadDefaults()
+                return "%s: Sensor #%d updated." % (commandId, sensor.index), False
+            return "Invalid command: " + command, False
+
+    def encode(self, text, crc, binary, seq=None):
+        # Answer text to the bytes sent on the wire. seq: sequence number of a pipelined command.
+        badCrc = self.badCrcRate and self.random.random() < self.badCrcRate
+        if binary:
+            if text.startswith("R1:"):
+                data = BinaryCodec.encodeStatus(Protocol.parseStatus(text))
+            else:
+                data = BinaryCodec.encodeText(text)
+            if seq is not None:
+                data = BinaryCodec.encodeTagged(seq, data)
+            return _corrupt(data) if badCrc else data
+        if crc:
+            value = crc16(text)
+            if badCrc:
+                value ^= 0x5A5A
+            text = "$%d$%s" % (value, text)
+        if seq is not None:
+            text = "@%d:%s" % (seq, text)
+        return (text + "\r\n").encode()
+
+    def send(self, text, crc, binary=None, seq=None):
+        # binary: framing of the answer (default: the current one)
+        tripped = self.interlock and (self.tripWireTime is None) and text.startswith("R1:")
+        data = self.encode(text, crc, self.binary if binary is None else binary, seq)
+        if self.dropRate:
+            data = bytes(byte for byte in data if self.random.random() >= self.dropRate)
+        if tripped:
+            self.tripWireTime = time.monotonic()
+        if self.baudRate:
+            # Sent at the link speed, like the MCU UART
+            for pos in range(0, len(data), WIRE_CHUNK):
+                chunk = data[pos:pos + WIRE_CHUNK]
+                time.sleep(len(chunk) * BITS_PER_BYTE / self.baudRate)
+                self._write(chunk)
+        else:
+            self._write(data)
+        self.bytesSent += len(data)
+
+    def _write(self, data):
+        try:
+            os.write(self._master, data)
+        except BlockingIOError:
+            pass # Port not read (plugin disconnected): the pseudo-terminal buffer is full
+        except OSError:
+            self._stopEvent.set() # Closed
+
+    def _receive(self, data):
+        self._buffer += data
+        while True:
+            end = self._buffer.find(b">")
+            if end < 0:
+                break
+            start = self._buffer.rfind(b"<", 0, end)
+            command = self._buffer[start + 1:end].decode(errors="replace").strip() if start > -1 else ""
+            self._buffer = self._buffer[end + 1:]
+            if not command:
+                continue
+            seq = None
+            if self.pipeline:
+                # "<R1 @12>": answered as "@12:..."
+                fields = command.split()
+                if (len(fields) > 1) and fields[-1].startswith("@") and fields[-1][1:].isdigit():
+                    seq = int(fields[-1][1:])
+                    command = " ".join(fields[:-1])
+            self.commands += 1
+            self.lastCommand = command
+            self.lastCommandTime = time.monotonic()
+            if self.delay:
+                time.sleep(self.delay)
+            # Answered with the framing in use when the command arrived ("<S2 on>" is answered in text)
+            binary = self.binary
+            self.send(*self.answer(command), binary=binary, seq=seq)
+        if len(self._buffer) > 256:
+            self._buffer = b""
+
+    def _push(self, now):
+        # Push mode: the status when it changes and at least every pushKeepalive seconds
+        if not self.push or self.pushStalled:
+            return
+        with self._lock:
+            status = self.status()
+        if (status != self._pushed) or (now - self._pushTime >= self.pushKeepalive):
+            self._pushed = status
+            self._pushTime = now
+            self.send(status, True)
+
+    # *******************************  Main loop
+
+    def run(self):
+        self._start = time.monotonic()
+        while not self._stopEvent.is_set():
+            try:
+                readable, _, _ = select.select([self._master], [], [], 0.05)
+            except (OSError, ValueError):
+                break
+            now = time.monotonic()
+            if self._resetAt is not None and now >= self._resetAt:
+                # <C9>: MCU reboot
+                self._resetAt = None
+                self._buffer = b""
+                for feature in MODE_COMMANDS.values():
+                    setattr(self, feature, False)
+                self.send(MCU_BANNER, False)
+            self._runScript(now)
+            self.update(now)
+            if readable:
+                try:
+                    data = os.read(self._master, 1024)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    break
+                self._receive(data)
+            self._push(time.monotonic())
+
+    def close(self):
+        self._stopEvent.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(1.0)
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+
+def main():
+    parser = argparse.ArgumentParser(description="Virtual Safety Printer MCU on a pseudo-terminal.")
+    parser.add_argument("--sensors", type=int, default=4, help="number of sensors (default: 4)")
+    parser.add_argument("--delay", type=float, default=0.0, help="delay (s) before each answer")
+    parser.add_argument("--drop", type=float, default=0.0, help="probability of dropping each answer byte")
+    parser.add_argument("--bad-crc", type=float, default=0.0, help="probability of a corrupted CRC")
+    parser.add_argument("--baud", type=int, default=0, help="pace answers at this BAUD rate (0: no pacing)")
+    parser.add_argument("--script", action="append", default=[], help="TIME:value:SENSOR:VALUE, TIME:trip or TIME:reset")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for the faults")
+    parser.add_argument("--link", default=None, help="symlink to the pseudo-terminal (ex.: /tmp/ttySafetyPrinter)")
+    parser.add_argument("--features", default=None,
+                        help="optional features answered to <R7>, comma separated: %s (default: no <R7>)" % ",".join(Protocol.FEATURES))
+    args = parser.parse_args()
+
+    simulator = Simulator(args.sensors, args.delay, args.drop, args.bad_crc, args.baud,
+                          [parseScript(text) for text in args.script], args.seed, args.link,
+                          None if args.features is None else [feature.strip() for feature in args.features.split(",") if feature.strip()])
+    simulator.start()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("Safety Printer MCU simulator on %s%s" % (simulator.path, (" (" + args.link + ")") if args.link else ""), flush=True)
+    try:
+        while simulator.is_alive():
+            simulator.join(1.0)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.close()
+
+if __name__ == "__main__":
+    main()
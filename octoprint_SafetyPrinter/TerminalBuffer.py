@@ -0,0 +1,53 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import threading
+from collections import deque
+
+TERMINAL_BUFFER_SIZE = 300 # Same amount of lines as the UI terminal
+
+class TerminalBuffer():
+    # Last terminal lines, kept on the server so a client that opens (or reconnects) gets the history at once.
+    # Each line has a sequence number: clients ask only for the lines after the last one they have, and ignore lines
+    # they already received.
+
+    def __init__(self, size=TERMINAL_BUFFER_SIZE):
+        self._lines = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.lastSeq = 0
+
+    def append(self, line, terminalType, board=None):
+        with self._lock:
+            self.lastSeq += 1
+            self._lines.append((self.lastSeq, line, terminalType, board))
+            return self.lastSeq
+
+    def since(self, seq=0):
+        # Lines after seq, oldest first
+        with self._lock:
+            if seq >= self.lastSeq:
+                return []
+            lines = list(self._lines)
+        if seq > 0:
+            first = lines[0][0] if lines else 0
+            lines = lines[max(0, seq - first + 1):]
+        return [{"seq": s, "line": line, "terminalType": terminalType, "board": board} for s, line, terminalType, board in lines]
+
+    def message(self, seq=0):
+        return {"type": "terminalBacklog", "lastSeq": self.lastSeq, "entries": self.since(seq)}
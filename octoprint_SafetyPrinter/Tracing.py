@@ -0,0 +1,112 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ '''
+
+import threading
+import time
+from collections import deque
+
+TRACE_HISTORY = 20  # Last trips and alarms kept
+TRACE_BUDGET = 0.25 # Host side reaction budget (s): status frame received to UI message sent
+
+# Stages of a status frame, in the usual order
+STAGE_RECEIVED = "received" # Frame complete on the serial reader
+STAGE_CHECKED = "checked"   # CRC checked (or binary frame decoded) and handed to the status update
+STAGE_PARSED = "parsed"     # Answer parsed, before the trip and alarm checks
+STAGE_NOTIFIED = "notified" # Console log and app notification (Octopod) done
+STAGE_SENT = "sent"         # UI message given to OctoPrint (send_plugin_message)
+
+REACTION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+class EventTrace():
+    # Timestamps (time.monotonic()) of one trip or alarm along the host side reaction chain
+
+    __slots__ = ("kind", "board", "detail", "time", "stages")
+
+    def __init__(self, kind, board, detail, stages):
+        self.kind = kind # "trip" or "alarm"
+        self.board = board
+        self.detail = detail
+        self.time = time.time()
+        self.stages = list(stages) # [(stage, monotonic time), ...]
+
+    def mark(self, stage):
+        self.stages.append((stage, time.monotonic()))
+
+    def total(self):
+        return self.stages[-1][1] - self.stages[0][1] if self.stages else 0.0
+
+    def breakdown(self):
+        # [(stage, time since the previous stage)]
+        result = []
+        previous = self.stages[0][1] if self.stages else 0.0
+        for stage, stamp in self.stages:
+            result.append((stage, stamp - previous))
+            previous = stamp
+        return result
+
+    def describe(self):
+        steps = ", ".join("%s +%.1f ms" % (stage, delta * 1000) for stage, delta in self.breakdown())
+        return "%s trace (board %s%s): %s. Total %.1f ms." % (self.kind.capitalize(), self.board,
+                                                             ", " + self.detail if self.detail else "", steps, self.total() * 1000)
+
+    def __str__(self):
+        # Lazy logging: the breakdown is only formatted if the message is logged
+        return self.describe()
+
+    def asDict(self):
+        return {"kind": self.kind, "board": self.board, "detail": self.detail, "time": self.time,
+                "total": self.total(), "overBudget": self.total() > TRACE_BUDGET,
+                "stages": [{"stage": stage, "delta": delta} for stage, delta in self.breakdown()]}
+
+class TripTracer():
+    # Keeps the traces of the last trips and alarms (all boards) and writes each one to the console log.
+
+    def __init__(self, logger, registry=None, history=TRACE_HISTORY):
+        self._logger = logger
+        self._traces = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._reaction = None
+        if registry is not None:
+            self._reaction = registry.histogram("safetyprinter_reaction_seconds",
+                                                "Trip and alarm reaction time, from the status frame received to the UI message sent.",
+                                                ("board", "kind"), REACTION_BUCKETS)
+
+    def start(self, kind, board, detail, stages):
+        # stages: the status frame timestamps so far
+        trace = EventTrace(kind, board, detail, stages)
+        if not trace.stages:
+            trace.mark(STAGE_PARSED)
+        return trace
+
+    def finish(self, trace):
+        trace.mark(STAGE_SENT)
+        with self._lock:
+            self._traces.append(trace)
+        if self._reaction is not None:
+            self._reaction.observe((trace.board, trace.kind), trace.total())
+        if trace.total() > TRACE_BUDGET:
+            self._logger.warning("%s Over the %.0f ms budget.", trace, TRACE_BUDGET * 1000)
+        else:
+            self._logger.info("%s", trace)
+
+    def traces(self, board=None):
+        # Newest first
+        with self._lock:
+            traces = list(self._traces)
+        return [trace.asDict() for trace in reversed(traces) if board is None or trace.board == board]
@@ -19,6 +19,35 @@
  *  Change log:
  *
  *  
+ * Version 1.3.0
+ * (in development)
+ * 1) Serial reads moved to a dedicated reader thread. Commands complete as soon as the answer arrives;
+ * 2) Table driven CRC-16;
+ * 3) MCU answers parsed by a protocol codec (Protocol.py) to typed records. Flags are sent to the UI as booleans;
+ * 4) Sensor status kept in a columnar store (SensorStore.py). Only changed fields are sent to the UI;
+ * 5) Messages produced on each status update are sent to the UI in a single batch message;
+ * 6) Adaptive status poll rate: faster while printing or with an active alarm, slower when idle;
+ * 7) Status push mode (optional feature reported on <R7>): the MCU sends status frames on change, polling is kept as fallback;
+ * 8) Candidate serial ports are probed in parallel on connection;
+ * 9) Connection runs in background as a state machine. Progress is shown on the UI;
+ * 10) Serial ports are enumerated in one pass and cached until a device is plugged or unplugged;
+ * 11) Settings used on the status poll and terminal are read from a snapshot rebuilt when saved;
+ * 12) Console log is written to file by a background thread, so disk writes don't delay the serial communication;
+ * 13) Terminal history kept on the server and fetched by each client from the lines it is missing;
+ * 14) Sensor readings history (memory mapped circular file) with a downsampled query endpoint (/history);
+ * 15) Binary framing (optional feature reported on <R7>): COBS frames with binary CRC and fixed width status fields;
+ * 16) Pipelined commands (optional feature reported on <R7>): several commands in flight, answers matched by sequence number;
+ * 17) Priority lanes: safety commands (trip, printer power, MCU reset) go first, with a latency target and latency stats;
+ * 18) Command retries with a deadline, exponential backoff and jitter. A command without answer doesn't close the connection;
+ * 19) Several Safety Printer boards per OctoPrint instance ("boards" setting). API commands and UI messages carry the board ID. Boards connect at the same time and share one status timer;
+ * 20) All serial ports are read by one event loop thread (selectors) instead of one reader thread per port;
+ * 21) Virtual Safety Printer MCU on a pseudo-terminal, for tests without an Arduino (Simulator.py);
+ * 22) End to end connection benchmarks with stored baselines (benchmarks/connection_benchmark.py). Long answers still arriving at a low BAUD rate get more time;
+ * 23) Metrics endpoint (/metrics, Prometheus text format): command round trips, CRC errors, retries, port waits, poll overruns and jitter, reconnects;
+ * 24) Trip and alarm reaction traces: time of each stage from the status frame received to the UI message (/traces endpoint and console log);
+ * 25) Sensor settings saved in one batch command (configureSensors): all changes checked first, applied in one sequence and saved with a single <C5>;
+ *
+ *
  * Version 1.2.0
  * 26/12/22
  * 1) Include <r4> command in connection to receive answer from Arduino Leonardo;
@@ -79,7 +108,17 @@ import octoprint.plugin
 import serial
 import time
 import flask
-from . import Connection
+from .BoardManager import BoardManager, PRIMARY_BOARD
+from .SerialMux import SerialMux
+from .Outbox import Outbox
+from .PollScheduler import PollScheduler
+from .PortInventory import PortInventory
+from .Settings import SettingsCache
+from .ConsoleLog import AsyncLogHandler
+from .TerminalBuffer import TerminalBuffer
+from .History import HISTORY_POINTS
+from .Metrics import MetricsRegistry, LinkMetrics, PollMetrics, CONTENT_TYPE
+from .Tracing import TripTracer, TRACE_BUDGET
 from octoprint.util import RepeatedTimer
 from octoprint.events import eventManager, Events
 from octoprint.server import user_permission
@@ -115,25 +154,39 @@ class SafetyPrinterPlugin(
         self._flash_thread = None
         self._console_logger = logging.getLogger("octoprint.plugins.safetyprinter") 
         #  Use self._logger.info for debug
+
+    def initialize(self):
+        # Messages to the UI. Everything sent during one status update goes in a single batch message.
+        self.outbox = Outbox(self._plugin_manager, self._identifier)
+        # Serial ports cache, shared by all connections
+        self.portInventory = PortInventory(self._printer, self._console_logger)
+        # Reads all the MCU serial ports on one thread
+        self.serialMux = SerialMux(self._console_logger)
+        self.serialMux.start()
+        # Settings read on the status poll and terminal paths. Rebuilt on startup and when saved.
+        self.settingsCache = SettingsCache(self._settings)
+        self.settingsCache.rebuild()
+        # Terminal history. Each client fetches the lines it is missing (/terminal?since=)
+        self.terminalBuffer = TerminalBuffer()
+        # Link, poll and port metrics (/metrics endpoint). Kept across reconnects.
+        self.metrics = MetricsRegistry()
+        self.linkMetrics = LinkMetrics(self.metrics)
+        # Reaction time of the last trips and alarms, stage by stage (/traces endpoint and console log)
+        self.tracer = TripTracer(self._console_logger, self.metrics)
+        # Status poll rate follows the printer and alarm states
+        self.scheduler = PollScheduler(self._printer, lambda: self.boards.connections(), self._console_logger, PollMetrics(self.metrics))
+        # Safety Printer boards, each one with its connection and sensor history (memory mapped file)
+        self.boards = BoardManager(self)
+
+    @property
+    def conn(self):
+        # Primary board connection
+        return self.boards.get(PRIMARY_BOARD)
         
-    def new_connection(self,waitPrinter):
-        self._console_logger.info("Attempting to connect to Safety Printer MCU ...")
-        self.conn = Connection.Connection(self,waitPrinter)
-        self.startTimer(1.0)
-
-    def startTimer(self, interval):
-        # timer that updates UI with Arduino information
-        self._commTimer = RepeatedTimer(interval, self.updateStatus, None, None, True)
-        self._commTimer.start()
-
-    def updateStatus(self):
-        # Update UI status (connection, trip and sensors)
-        if self.conn:            
-            self.conn.update_ui_connection_status()
-            if self.conn.is_connected():
-                self.conn.update_ui_status()
-            else:
-                self._commTimer.cancel()
+    def new_connection(self, waitPrinter, board=None):
+        # Connection runs on the board manager thread. Progress is sent to the UI on connectionUpdate messages.
+        # Returns False if it wasn't queued (unknown board or a connection already in progress).
+        return self.boards.connect(board, waitPrinter)
 
     # ~~ StartupPlugin mixin
     def on_startup(self, host, port):
@@ -141,47 +194,55 @@ class SafetyPrinterPlugin(
         console_logging_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
         #console_logging_handler.setLevel(logging.DEBUG)
 
-        self._console_logger.addHandler(console_logging_handler)
+        # File writes (and rotation) are done on a background thread
+        self._console_log_handler = AsyncLogHandler(console_logging_handler)
+        self._console_log_handler.start()
+        self._console_logger.addHandler(self._console_log_handler)
         self.loggingLevel = self._settings.get_int(["loggingLevel"])
         self._console_logger.setLevel(self.loggingLevel)
         #self.console_setlevel(self.loggingLevel)
         self._console_logger.propagate = False
 
     def on_after_startup(self):
+        self.settingsCache.rebuild()
         self._logger.info("Safety Printer Plugin started.") #Octoprint logger 
         self._console_logger.info("******************* Starting Safety Printer Plug-in ***************************")
         self._console_logger.info("Default Serial Port:" + str(self._settings.get(["serialport"])))
         self._console_logger.info("Default BAUD rate:" + str(self._settings.get(["BAUDRate"])))
-        self.new_connection(True)
+        self._console_logger.info("Safety Printer boards: %s", self.boards.ids())
+        self.boards.connectAll(True)
 
         self.abortTimeout = self._settings.get_int(["abortTimeout"])
-        self._console_logger.debug("abortTimeout: %s" % self.abortTimeout)
+        self._console_logger.debug("abortTimeout: %s", self.abortTimeout)
 
         self.rememberCheckBox = self._settings.get_boolean(["rememberCheckBox"])
-        self._console_logger.debug("rememberCheckBox: %s" % self.rememberCheckBox)
+        self._console_logger.debug("rememberCheckBox: %s", self.rememberCheckBox)
 
         self.lastCheckBoxValue = self._settings.get_boolean(["lastCheckBoxValue"])
-        self._console_logger.debug("lastCheckBoxValue: %s" % self.lastCheckBoxValue)
+        self._console_logger.debug("lastCheckBoxValue: %s", self.lastCheckBoxValue)
         if self.rememberCheckBox:
             self._automatic_shutdown_enabled = self.lastCheckBoxValue
 
         self.showTerminal = self._settings.get_boolean(["showTerminal"])
-        self._console_logger.debug("showTerminal: %s" % self.showTerminal)
+        self._console_logger.debug("showTerminal: %s", self.showTerminal)
 
         self.loggingLevel = self._settings.get(["loggingLevel"])
-        self._console_logger.debug("loggingLevel: %s" % self.loggingLevel)
+        self._console_logger.debug("loggingLevel: %s", self.loggingLevel)
 
         self.notifyVoltageTemp = self._settings.get_boolean(["notifyVoltageTemp"])
-        self._console_logger.debug("notifyVoltageTemp: %s" % self.notifyVoltageTemp)
+        self._console_logger.debug("notifyVoltageTemp: %s", self.notifyVoltageTemp)
 
-        self._console_logger.debug("avrdude_path: %s" % self._settings.get(["avrdude_path"]))
+        self._console_logger.debug("avrdude_path: %s", self._settings.get(["avrdude_path"]))
 
     # ~~ ShutdonwPlugin mixin
     def on_shutdown(self):
         self._console_logger.info("Disconnecting from Safety Printer MCU...")
-        self._commTimer.cancel()
-        self.conn.abortSerialConn = True
-        self.conn.closeConnection()        
+        self.boards.closeAll()
+        self.serialMux.stop()
+
+    def disconnect(self, board=None):
+        self._console_logger.info("Disconnecting from Safety Printer MCU (board %s)...", board or PRIMARY_BOARD)
+        self.boards.close(board)
                             
     ##~~ SettingsPlugin mixin    
     def get_settings_defaults(self):
@@ -200,11 +261,15 @@ class SafetyPrinterPlugin(
             notifyVoltageTemp = True,
             avrdude_path = "/usr/bin/avrdude",
             terminalMsgFilter = False,
-            forceRedComm = False
+            forceRedComm = False,
+            boards = [] # Additional boards: [{"id": "enclosure", "port": "/dev/ttyUSB1"}, ...]
         )
 
     def on_settings_save(self, data):
         octoprint.plugin.SettingsPlugin.on_settings_save(self, data)
+        self.settingsCache.rebuild()
+        for board in self.boards.configure():
+            self.new_connection(False, board)
 
         self.abortTimeout = self._settings.get_int(["abortTimeout"])
         self.rememberCheckBox = self._settings.get_boolean(["rememberCheckBox"])
@@ -216,18 +281,19 @@ class SafetyPrinterPlugin(
         #self._console_logger.setLevel(self.loggingLevel)
         
         self._console_logger.info("User changed settings.")
-        self._console_logger.debug("serialport: %s" % self._settings.get(["serialport"]))
-        self._console_logger.debug("BAUDRate: %s" % self._settings.get(["BAUDRate"]))
-        self._console_logger.debug("abortTimeout: %s" % self.abortTimeout)
-        self._console_logger.debug("rememberCheckBox: %s" % self.rememberCheckBox)
-        self._console_logger.debug("lastCheckBoxValue: %s" % self.lastCheckBoxValue)
-        self._console_logger.debug("showTerminal: %s" % self.showTerminal)
-        self._console_logger.debug("loggingLevel: %s" % self.loggingLevel)
-        self._console_logger.debug("notifyWarnings: %s" % self._settings.get(["notifyWarnings"]))
-        self._console_logger.debug("useEmoji: %s" % self._settings.get(["useEmoji"]))
-        self._console_logger.debug("additionalPort: %s" % self._settings.get(["additionalPort"]))
-        self._console_logger.debug("notifyVoltageTemp: %s" % self._settings.get(["notifyVoltageTemp"]))
-        self._console_logger.debug("avrdude_path : %s" % self._settings.get(["avrdude_path"]))
+        self._console_logger.debug("serialport: %s", self._settings.get(["serialport"]))
+        self._console_logger.debug("BAUDRate: %s", self._settings.get(["BAUDRate"]))
+        self._console_logger.debug("abortTimeout: %s", self.abortTimeout)
+        self._console_logger.debug("rememberCheckBox: %s", self.rememberCheckBox)
+        self._console_logger.debug("lastCheckBoxValue: %s", self.lastCheckBoxValue)
+        self._console_logger.debug("showTerminal: %s", self.showTerminal)
+        self._console_logger.debug("loggingLevel: %s", self.loggingLevel)
+        self._console_logger.debug("notifyWarnings: %s", self._settings.get(["notifyWarnings"]))
+        self._console_logger.debug("useEmoji: %s", self._settings.get(["useEmoji"]))
+        self._console_logger.debug("additionalPort: %s", self._settings.get(["additionalPort"]))
+        self._console_logger.debug("notifyVoltageTemp: %s", self._settings.get(["notifyVoltageTemp"]))
+        self._console_logger.debug("avrdude_path : %s", self._settings.get(["avrdude_path"]))
+        self._console_logger.debug("boards: %s", self._settings.get(["boards"]))
 
 
     def get_template_vars(self):
@@ -293,6 +359,7 @@ class SafetyPrinterPlugin(
             toggleEnabled=["id", "onoff"],
             changeSP=["id", "newSP"],
             changeTimer=["id", "newTimer"],
+            configureSensors=["changes"],
             sendCommand=["serialCommand"],
             resetSettings=["id"],
             saveEEPROM=[],
@@ -306,29 +373,38 @@ class SafetyPrinterPlugin(
         )
 
     def on_api_command(self, command, data):
+        # Board commands accept an optional "board" ID (default: primary board)
+        board = data.get("board")
+        if (board is not None) and (not self.boards.exists(board)):
+            return flask.jsonify(error="Unknown Safety Printer board: %s" % board, status=400), 400
         try:
             if command == "reconnect":
-                self.new_connection(False)
+                if not self.new_connection(False, board):
+                    return flask.jsonify(error="Safety Printer MCU connection already in progress.", queued=False, status=409), 409
             elif command == "disconnect":
-                self.on_shutdown()
+                self.disconnect(board)
             elif command == "resetTrip":
-                self.resetTrip()
+                self.resetTrip(board)
             elif command == "sendTrip":
-                self.sendTrip()
+                self.sendTrip(board)
             elif command == "getPorts":
-                self.conn.update_ui_ports()
+                conn = self.boards.get(board)
+                if conn:
+                    conn.update_ui_ports()
             elif command == "toggleEnabled":
-                self.toggleEnabled(int(data["id"]), str(data["onoff"]))
+                self.toggleEnabled(int(data["id"]), str(data["onoff"]), board)
             elif command == "changeSP":
-                self.changeSP(int(data["id"]), str(data["newSP"]))
+                self.changeSP(int(data["id"]), str(data["newSP"]), board)
             elif command == "changeTimer":
-                self.changeTimer(int(data["id"]), str(data["newTimer"]))
+                self.changeTimer(int(data["id"]), str(data["newTimer"]), board)
+            elif command == "configureSensors":
+                return self.configureSensors(data["changes"], bool(data.get("save", True)), board)
             elif command == "sendCommand":
-                self.sendCommand(str(data["serialCommand"]))
+                self.sendCommand(str(data["serialCommand"]), board)
             elif command == "resetSettings":
-                self.resetSettings(int(data["id"]))    
+                self.resetSettings(int(data["id"]), board)    
             elif command == "saveEEPROM":
-                self.saveEEPROM()
+                self.saveEEPROM(board)
             elif command == "enableShutdown":
                 self.enableShutdown()
             elif command == "disableShutdown":
@@ -336,77 +412,98 @@ class SafetyPrinterPlugin(
             elif command == "abortShutdown":
                 self.abortShutdown()
             elif command == "refreshMCUStats":
-                self.refreshMCUStats()
+                self.refreshMCUStats(board)
             elif command == "forceRenew":
-                self.forceRenew()
+                self.forceRenew(board)
             elif command == "settingsVisible":
-                self.settingsVisible(bool(data["status"]))
+                self.settingsVisible(bool(data["status"]), board)
             elif command == "flashFile":
                 self.flashFile(str(data["fileName"]))
             response = "POST request (%s) successful" % command
             return flask.jsonify(response=response, data=data, status=200), 200
         except Exception as e:
             error = str(e)
-            self._console_logger.info("Exception message: %s" % str(e))
+            self._console_logger.info("Exception message: %s", str(e))
             return flask.jsonify(error=error, status=500), 500
 
-    def resetTrip(self):
-        if self.conn:
-            if self.conn.is_connected():
-                self.conn.resetTrip()
-                self._console_logger.info("Resseting ALL trips.")
-                self.conn.newSerialCommand("<C1>",10, False)
+    def connected_board(self, board):
+        # Connection of a board, if connected
+        conn = self.boards.get(board)
+        if conn and conn.is_connected():
+            return conn
+        return None
+
+    def resetTrip(self, board=None):
+        conn = self.connected_board(board)
+        if conn:
+            conn.resetTrip()
+            self._console_logger.info("Resseting ALL trips.")
+            conn.newSerialCommand("<C1>",10, False)
             
-    def sendTrip(self):
-        if self.conn:
-            if self.conn.is_connected():
-                self._console_logger.info("Virtual Emergency Button pressed.")            
-                self.conn.newSerialCommand("<C2>",10, True)
-
-    def toggleEnabled(self, index, status):
-        if self.conn:
-            if self.conn.is_connected():
-                if status == "on":
-                    self._console_logger.info("Enabling sensor #" + str(index))
-                else:
-                    self._console_logger.info("Disabling sensor #" + str(index))
-                self.conn.newSerialCommand("<C3 " + str(index) + " " + status + ">",10, False)
-
-    def changeSP(self, index, newSP):
-        if self.conn:            
-            if self.conn.is_connected():
-                self._console_logger.info("Changing sensor #" + str(index) + " setpoint to:" + newSP)
-                self.conn.newSerialCommand("<C4 " + str(index) + " " + newSP + ">",10, False)
-
-    def changeTimer(self, index, newTimer):
-        if self.conn:
-            if self.conn.is_connected():
-                self._console_logger.info("Changing sensor #" + str(index) + " timer to:" + newTimer)
-                self.conn.newSerialCommand("<C7 " + str(index) + " " + newTimer + ">",10, False)
-
-    def sendCommand(self,newCommand):
-        if self.conn:
-            if self.conn.is_connected():
-                self._console_logger.info("Sending terminal command: " + newCommand)
-                self.conn.newSerialCommand(newCommand,10, False)
+    def sendTrip(self, board=None):
+        conn = self.connected_board(board)
+        if conn:
+            self._console_logger.info("Virtual Emergency Button pressed.")            
+            conn.newSerialCommand("<C2>",10, True)
+
+    def toggleEnabled(self, index, status, board=None):
+        conn = self.connected_board(board)
+        if conn:
+            if status == "on":
+                self._console_logger.info("Enabling sensor #" + str(index))
+            else:
+                self._console_logger.info("Disabling sensor #" + str(index))
+            conn.newSerialCommand("<C3 " + str(index) + " " + status + ">",10, False)
+
+    def changeSP(self, index, newSP, board=None):
+        conn = self.connected_board(board)
+        if conn:
+            self._console_logger.info("Changing sensor #" + str(index) + " setpoint to:" + newSP)
+            conn.newSerialCommand("<C4 " + str(index) + " " + newSP + ">",10, False)
+
+    def changeTimer(self, index, newTimer, board=None):
+        conn = self.connected_board(board)
+        if conn:
+            self._console_logger.info("Changing sensor #" + str(index) + " timer to:" + newTimer)
+            conn.newSerialCommand("<C7 " + str(index) + " " + newTimer + ">",10, False)
+
+    def configureSensors(self, changes, save, board=None):
+        # Setpoints, timers and enables of several sensors in one request. Answers with the status of each change.
+        conn = self.connected_board(board)
+        if not conn:
+            return flask.jsonify(error="Safety Printer MCU not connected.", status=409), 409
+        self._console_logger.info("Applying sensor configuration batch.")
+        try:
+            result = conn.configure_sensors(changes, save)
+        except ValueError as e:
+            return flask.jsonify(error=str(e), status=400), 400
+        result["board"] = conn.boardId
+        return flask.jsonify(result), (200 if result["valid"] else 400)
+
+    def sendCommand(self, newCommand, board=None):
+        conn = self.connected_board(board)
+        if conn:
+            self._console_logger.info("Sending terminal command: " + newCommand)
+            conn.newSerialCommand(newCommand,10, False)
     
-    def resetSettings(self, index):
-        if self.conn:
-            if self.conn.is_connected():
-                self._console_logger.info("Loading sensor #" + str(index) + " default configurations.")
-                self.conn.newSerialCommand("<C8 " + str(index) + ">",10, False)
-
-    def saveEEPROM(self):
-        if self.conn:
-            if self.conn.is_connected():
-                self._console_logger.info("Saving configuration to EEPROM.")
-                self.conn.newSerialCommand("<C5>",10, False)
+    def resetSettings(self, index, board=None):
+        conn = self.connected_board(board)
+        if conn:
+            self._console_logger.info("Loading sensor #" + str(index) + " default configurations.")
+            conn.newSerialCommand("<C8 " + str(index) + ">",10, False)
+
+    def saveEEPROM(self, board=None):
+        conn = self.connected_board(board)
+        if conn:
+            self._console_logger.info("Saving configuration to EEPROM.")
+            conn.newSerialCommand("<C5>",10, False)
 
     def toggleShutdown(self):
         self.lastCheckBoxValue = self._automatic_shutdown_enabled
         if self.rememberCheckBox:
             self._settings.set_boolean(["lastCheckBoxValue"], self.lastCheckBoxValue)
             self._settings.save()
+            self.settingsCache.rebuild()
             eventManager().fire(Events.SETTINGS_UPDATED)
         self._plugin_manager.send_plugin_message(self._identifier, {"type":"shutdown","automaticShutdownEnabled": self._automatic_shutdown_enabled, "timeout_value":self._timeout_value})
     
@@ -429,21 +526,23 @@ class SafetyPrinterPlugin(
         self._plugin_manager.send_plugin_message(self._identifier, {"type":"shutdown","automaticShutdownEnabled": self._automatic_shutdown_enabled, "timeout_value":self._timeout_value})
         self._console_logger.info("Shutdown aborted.")
     
-    def refreshMCUStats(self):
-        if self.conn:
-            if self.conn.is_connected():
-                self._console_logger.info("Refreshing MCU status.")
-                self.conn.update_MCU_Stats()
-
-    def forceRenew(self):
-        if self.conn:
-            self.conn.forceRenew = True
-            self.conn.forceRenewConn = True
-            self.conn.terminal("Renew UI status.","INFO")
-
-    def settingsVisible(self,status):
-        if self.conn:
-            self.conn.settingsVisible = status
+    def refreshMCUStats(self, board=None):
+        conn = self.connected_board(board)
+        if conn:
+            self._console_logger.info("Refreshing MCU status.")
+            conn.update_MCU_Stats()
+
+    def forceRenew(self, board=None):
+        conn = self.boards.get(board)
+        if conn:
+            conn.forceRenew = True
+            conn.forceRenewConn = True
+            conn.terminal("Renew UI status.","INFO")
+
+    def settingsVisible(self, status, board=None):
+        conn = self.boards.get(board)
+        if conn:
+            conn.settingsVisible = status
 
     '''def flashFile(self, fileName):
         if self.conn:
@@ -491,7 +590,7 @@ class SafetyPrinterPlugin(
         c = len(octoprint.timelapse.get_unrendered_timelapses())
 
         if c > 0:
-                self._console_logger.info("Waiting for %s timelapse(s) to finish rendering before starting shutdown timer..." % c)
+                self._console_logger.info("Waiting for %s timelapse(s) to finish rendering before starting shutdown timer...", c)
         else:
                 self._timer_start()
 
@@ -525,9 +624,11 @@ class SafetyPrinterPlugin(
 
     def _shutdown_system(self):
         if self.turnOffPrinter:
-            if self.conn.is_connected():
-                self._console_logger.info("Turning off the printer.")
-                self.conn.newSerialCommand("<C6 off>",10, False)           
+            # The printer power may be on any board
+            for conn in self.boards.connections():
+                if conn.is_connected():
+                    self._console_logger.info("Turning off the printer (board %s).", conn.boardId)
+                    conn.newSerialCommand("<C6 off>",10, False)           
 
         shutdown_command = self._settings.global_get(["server", "commands", "systemShutdownCommand"])
         self._console_logger.info("Shutting down system with command: {command}".format(command=shutdown_command))
@@ -549,6 +650,55 @@ class SafetyPrinterPlugin(
     def status(self):
         return flask.jsonify(flashing=self._flash_thread is not None)
 
+    @octoprint.plugin.BlueprintPlugin.route("/terminal", methods=["GET"])
+    @octoprint.server.util.flask.restricted_access
+    def terminal_backlog(self):
+        # Terminal lines after the "since" sequence number (all of them by default)
+        try:
+            since = int(flask.request.values.get("since", 0))
+        except ValueError:
+            return flask.make_response("Invalid since value.", 400)
+        return flask.jsonify(self.terminalBuffer.message(since))
+
+    @octoprint.plugin.BlueprintPlugin.route("/history", methods=["GET"])
+    @octoprint.server.util.flask.restricted_access
+    def sensor_history(self):
+        # Sensor history of a board between "start" and "end" (epoch, s. Default: last hour) reduced to "points" buckets
+        board = self.boards.board(flask.request.values.get("board"))
+        if board is None:
+            return flask.make_response("Unknown Safety Printer board.", 404)
+        try:
+            end = float(flask.request.values.get("end", time.time()))
+            start = float(flask.request.values.get("start", end - 3600))
+            points = int(flask.request.values.get("points", HISTORY_POINTS))
+        except ValueError:
+            return flask.make_response("Invalid history range.", 400)
+        if (end <= start) or (points <= 0):
+            return flask.make_response("Invalid history range.", 400)
+
+        result = board.history.query(start, end, points)
+        result["board"] = board.id
+        conn = board.conn
+        for i, sensor in enumerate(result["sensors"]):
+            sensor["index"] = i
+            sensor["label"] = conn.sensors.get("label", i) if (conn and i < conn.sensors.size) else ""
+        return flask.jsonify(result)
+
+    @octoprint.plugin.BlueprintPlugin.route("/metrics", methods=["GET"])
+    @octoprint.server.util.flask.restricted_access
+    def metrics_export(self):
+        # Prometheus text format. Scrapers authenticate with the X-Api-Key header.
+        return flask.Response(self.metrics.render(), content_type=CONTENT_TYPE)
+
+    @octoprint.plugin.BlueprintPlugin.route("/traces", methods=["GET"])
+    @octoprint.server.util.flask.restricted_access
+    def reaction_traces(self):
+        # Last trips and alarms (newest first) with the time spent on each stage, from the status frame to the UI
+        board = flask.request.values.get("board")
+        if board is not None and not self.boards.exists(board):
+            return flask.make_response("Unknown Safety Printer board.", 404)
+        return flask.jsonify(budget=TRACE_BUDGET, traces=self.tracer.traces(board))
+
     @octoprint.plugin.BlueprintPlugin.route("/flash", methods=["POST"])
     @octoprint.server.util.flask.restricted_access
     @octoprint.server.admin_permission.require(403)
@@ -619,7 +769,7 @@ class SafetyPrinterPlugin(
         
         if self.conn:
             if self.conn.is_connected():
-                self.conn.terminal("Starting Safety Printer MCU flashing on port: " + mcu_port + ".","INFO")
+                self.conn.terminal("Starting Safety Printer MCU flashing on port: %s.","INFO",mcu_port)
                 self._send_status("progress", subtype="boardreset")
                 self.conn.newSerialCommand("<C9 500>",10 , True)
                 
@@ -628,7 +778,7 @@ class SafetyPrinterPlugin(
 
                 self._flash_thread = threading.Thread(target=self._flash_worker, args=(hex_file, mcu_port))
                 self._flash_thread.daemon = True
-                self.on_shutdown() #Disconect from the MCU
+                self.disconnect() #Disconect from the MCU
                 self._flash_thread.start()
 
                 return True
@@ -641,7 +791,7 @@ class SafetyPrinterPlugin(
 
             if self.conn:
                 if self.conn.is_connected():
-                    self.on_shutdown()
+                    self.disconnect()
                     self._send_status("progress", subtype="disconnecting")
 
             self._send_status("progress", subtype="startingflash")
@@ -657,11 +807,11 @@ class SafetyPrinterPlugin(
                     self._send_status("success")
 
                 else:
-                    self.on_shutdown() #Disconect from the MCU
+                    self.disconnect() #Disconect from the MCU
    
             except:
                 self.conn.terminal("Error while attempting to flash","ERROR")
-                self.on_shutdown() #Disconect from the MCU
+                self.disconnect() #Disconect from the MCU
 
             finally:
                 try:
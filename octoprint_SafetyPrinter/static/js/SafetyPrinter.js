@@ -94,7 +94,6 @@ $(function() {
         self.expertMode = ko.observable(false);
         self.availablePorts = ko.observableArray();
         self.settingsVisible = false;
-        self.changedFlag = false;
 
         self.updateSettingsSensors = false;
         self.FWVersion = ko.observable("");
@@ -114,6 +113,9 @@ $(function() {
         self.badMsgs = ko.observable("");
         
         self.sensorDataVisible = ko.observable(false);
+        self.sensorData = [];
+        self.inBatch = false;
+        self.terminalChanged = false;
 
         self.spSensorsSettings = ko.observableArray([
            new spSensorsSettingsType(false,false,"","0",false,false,"0","0","0",[],false,false,false),
@@ -160,6 +162,7 @@ $(function() {
         self.showDebug = ko.observable(false);
         self.terminalLines = ko.observableArray();
         self.countTerminalLines = 0;
+        self.lastTerminalSeq = 0; // Sequence number of the last line received from the server
         self.command = ko.observable();
         self.tabActive = false;
         //self.tempMsgFilter = ko.observable(false);
@@ -179,6 +182,25 @@ $(function() {
         self.newTrip = ko.observable(false);
         self.numOfSensors = 0;
         self.reducedConn = ko.observable(false);
+        // Safety Printer boards (messages and commands carry the board ID)
+        self.boards = ko.observableArray(["main"]);
+        self.selectedBoard = ko.observable("main");
+
+        self.boardCommand = function(command, data) {
+            // Simple API command to the selected board
+            return OctoPrint.simpleApiCommand("SafetyPrinter", command, _.extend({board: self.selectedBoard()}, data || {}));
+        };
+
+        self.selectedBoard.subscribe(function (board) {
+            // Shows another board: clears the displayed status and asks the server for all of it again
+            if (self.debug) {console.log("SafetyPrinter: board " + board)};
+            // Cached sensor fields belong to the previous board. forceRenew sends all of them again.
+            self.sensorData = [];
+            self.applyMessage({type: "connectionUpdate", connectionStatus: false, failure: true});
+            self.interlock(false);
+            self.boardCommand("settingsVisible", {status: self.settingsVisible});
+            self.boardCommand("forceRenew");
+        });
 
         // ************* Notifications :
 
@@ -291,7 +313,21 @@ $(function() {
             if (self.debug) {console.log("SafetyPrinter: onStartupComplete")};
             //Show or hide terminal TAB.
             self.showHideTab();
-            OctoPrint.simpleApiCommand("SafetyPrinter", "forceRenew"); 
+            self.boardCommand("forceRenew"); 
+            self.requestTerminalBacklog();
+        };
+
+        self.onServerReconnect = function() {
+            if (self.debug) {console.log("SafetyPrinter: onServerReconnect")};
+            self.requestTerminalBacklog();
+        };
+
+        self.requestTerminalBacklog = function() {
+            // Asks the server only for the terminal lines this client doesn't have yet
+            OctoPrint.get(OctoPrint.getBlueprintUrl("SafetyPrinter") + "terminal", {data: {since: self.lastTerminalSeq}})
+                .done(function(response) {
+                    self.applyTerminalBacklog(response);
+                });
         };
 
       
@@ -416,9 +452,9 @@ $(function() {
             self.configAvrdudePath(self.settingsViewModel.settings.plugins.SafetyPrinter.avrdude_path());
             self.configSerialPort(self.settingsViewModel.settings.plugins.SafetyPrinter.serialport());
 
-            OctoPrint.simpleApiCommand("SafetyPrinter", "settingsVisible", {status: self.settingsVisible});
+            self.boardCommand("settingsVisible", {status: self.settingsVisible});
 
-            //OctoPrint.simpleApiCommand("SafetyPrinter", "forceRenew"); 
+            //self.boardCommand("forceRenew"); 
             self.updatePorts(self.settingsViewModel.settings.plugins.SafetyPrinter.additionalPort());
 
         };
@@ -430,18 +466,13 @@ $(function() {
             if (addPort != ""){
                self.availablePorts.push(new ItemViewModel(addPort));   
             }
-            OctoPrint.simpleApiCommand("SafetyPrinter", "getPorts");
+            self.boardCommand("getPorts");
         };        
 
         self.onSettingsHidden = function () {            
             if (self.debug) {console.log("SafetyPrinter: onSettingsHidden")};
             self.settingsVisible = false;
-            OctoPrint.simpleApiCommand("SafetyPrinter", "settingsVisible", {status: self.settingsVisible});
-            if (self.changedFlag && !self.printerState.isPrinting()) {
-                if (self.debug) {console.log("SafetyPrinter: Writing EEPROM")};
-                self.changedFlag = false;
-                OctoPrint.simpleApiCommand("SafetyPrinter", "saveEEPROM");  
-            }
+            self.boardCommand("settingsVisible", {status: self.settingsVisible});
         }; 
 
         self.refreshSettings = function(i) {
@@ -491,53 +522,75 @@ $(function() {
             self.settingsViewModel.settings.plugins.SafetyPrinter.avrdude_path(self.configAvrdudePath());  
             self.settingsViewModel.settings.plugins.SafetyPrinter.serialport(self.configSerialPort());       
             
+            // All the sensor changes go in one batch, applied by the server in one sequence and saved once (<C5>)
+            var changes = [];
             for (i = 0; i < self.numOfSensors; i++) {                                         
 
                 if (self.spSensorsSettings()[i].validInfo && !self.notConnected()) {
+                    var change = {id: i};
                     if (self.spSensorsSettings()[i].SP() != self.spSensors()[i].SP()) {
-                        if (!self.printerState.isPrinting()) {  // avoids changes during printing.
-                            if (self.debug) {console.log("SafetyPrinter: Changing SP: " + self.spSensorsSettings()[i].label())};
-                            OctoPrint.simpleApiCommand("SafetyPrinter", "changeSP", {id: i, newSP: self.spSensorsSettings()[i].SP()});
-                            self.changedFlag = true;
-                        } else {
-                            alertFlag = true;
-                        }
+                        if (self.debug) {console.log("SafetyPrinter: Changing SP: " + self.spSensorsSettings()[i].label())};
+                        change.SP = self.spSensorsSettings()[i].SP();
                     }
 
                     if (self.spSensorsSettings()[i].timer() != self.spSensors()[i].timer()) {
-                        if (!self.printerState.isPrinting()) {  // avoids changes during printing.
-                            if (self.debug) {console.log("SafetyPrinter: Changing Timer: " + self.spSensorsSettings()[i].label())};
-                            OctoPrint.simpleApiCommand("SafetyPrinter", "changeTimer", {id: i, newTimer: self.spSensorsSettings()[i].timer()});
-                            self.changedFlag = true;
-                        } else {
-                            alertFlag = true;
-                        }
+                        if (self.debug) {console.log("SafetyPrinter: Changing Timer: " + self.spSensorsSettings()[i].label())};
+                        change.timer = self.spSensorsSettings()[i].timer();
                     }
 
-                    //Always keep ENABLE as the last saved one to avoid spurious trip
+                    // The server applies the enables after all setpoints and timers to avoid spurious trips
                     if (self.spSensorsSettings()[i].enabled() != self.spSensors()[i].enabled()) {
-                        if (!self.printerState.isPrinting()) {  // avoids changes during printing.
-                            if (self.spSensorsSettings()[i].enabled()) {                        
-                                if (self.debug) {console.log("SafetyPrinter: Enabling: " + self.spSensorsSettings()[i].label())};
-                                OctoPrint.simpleApiCommand("SafetyPrinter", "toggleEnabled", {id: i, onoff: "on"});
-                                self.changedFlag = true;
-                            } else {
-                                if (self.debug) {console.log("SafetyPrinter: Disabling: " + self.spSensorsSettings()[i].label())};
-                                OctoPrint.simpleApiCommand("SafetyPrinter", "toggleEnabled", {id: i, onoff: "off"});
-                                self.changedFlag = true;
-                            }
-                        } else {
-                            alertFlag = true;
-                        }                    
+                        if (self.debug) {console.log("SafetyPrinter: " + (self.spSensorsSettings()[i].enabled() ? "Enabling: " : "Disabling: ") + self.spSensorsSettings()[i].label())};
+                        change.enabled = self.spSensorsSettings()[i].enabled();
+                    }
+
+                    if (_.size(change) > 1) {
+                        changes.push(change);
                     }
                 }
             }
+
+            if (changes.length > 0) {
+                if (self.printerState.isPrinting()) {  // avoids changes during printing.
+                    alertFlag = true;
+                } else {
+                    self.configureSensors(changes);
+                }
+            }
             self.showHideTab();
             if (alertFlag) {
                 window.alert("The Safety Printer modifications cannot be applied during printing.");
             }
         };
 
+        self.configureSensors = function(changes) {
+            // Shows the changes refused or not applied by the server
+            self.boardCommand("configureSensors", {changes: changes})
+                .done(function(result) {
+                    self.showConfigErrors(result);
+                })
+                .fail(function(xhr) {
+                    if (xhr.responseJSON && xhr.responseJSON.items) {
+                        self.showConfigErrors(xhr.responseJSON);
+                    } else {
+                        self.showPopup("error", "Safety Printer", "Sensor configuration not applied: " + ((xhr.responseJSON && xhr.responseJSON.error) || xhr.statusText));
+                    }
+                });
+        };
+
+        self.showConfigErrors = function(result) {
+            var lines = result.error ? [result.error] : [];
+            _.each(result.items, function(item) {
+                if (item.status != "ok" && item.status != "unchanged") {
+                    var sensor = self.spSensors()[item.id];
+                    lines.push((sensor ? sensor.label() : "#" + item.id) + " " + item.field + ": " + item.status + (item.error ? " (" + item.error + ")" : ""));
+                }
+            });
+            if (lines.length > 0 || !result.ok) {
+                self.showPopup("error", "Safety Printer", "Sensor configuration " + (result.valid ? "not saved" : "refused") + ".\n" + lines.join("\n"));
+            }
+        };
+
         // ************* Functions for each button on Settings TAB:
 
         self.toggleAutoscrollBtn = function() {
@@ -570,7 +623,7 @@ $(function() {
             for (i = 0; i < self.numOfSensors; i++) {                                         
                 if (self.spSensorsSettings()[i].checked()) {
                     //if (self.debug) {console.log("Restoring " + self.spSensorsSettings()[i].label() + " default settings.")};
-                    OctoPrint.simpleApiCommand("SafetyPrinter", "resetSettings", {id: i}); 
+                    self.boardCommand("resetSettings", {id: i}); 
                 }
             }
             self.updateSettingsSensors = true;            
@@ -579,7 +632,7 @@ $(function() {
         self.refreshMCUStats = function(item) {
             if (self.debug) {console.log("SafetyPrinter: refreshMCUStats")};
             // Send a command to arduino refresh MCU status
-            OctoPrint.simpleApiCommand("SafetyPrinter", "refreshMCUStats"); 
+            self.boardCommand("refreshMCUStats"); 
         };
 
         self.addPortBtn = function () {
@@ -728,17 +781,17 @@ $(function() {
 
             if (self.command()) {
                 if (self.command().toUpperCase() == "@DISCONNECT") {
-                    OctoPrint.simpleApiCommand("SafetyPrinter", "disconnect");     
+                    self.boardCommand("disconnect");     
                 } else if (self.command().toUpperCase() == "@CONNECT") {
-                    OctoPrint.simpleApiCommand("SafetyPrinter", "reconnect"); 
+                    self.boardCommand("reconnect"); 
                 } else if (self.command().toUpperCase() == "@RENEW") {
-                    OctoPrint.simpleApiCommand("SafetyPrinter", "forceRenew");  
+                    self.boardCommand("forceRenew");  
                 } else if (self.command().toUpperCase() == "@DEBUG") {
                     self.debug = !self.debug;
                     self.terminalLines.push(new TerminalViewModel("JS Debug mode is: "+String(self.debug),"INFO"));
                     self.countTerminalLines++;
                 } else {
-                    OctoPrint.simpleApiCommand("SafetyPrinter", "sendCommand", {serialCommand: self.command()}); 
+                    self.boardCommand("sendCommand", {serialCommand: self.command()}); 
                 }
                 if (self.countCommands != (self.lastCommands.length - 1)) {
                     self.lastCommands.push(self.command());                    
@@ -799,7 +852,7 @@ $(function() {
         self.tripResetBtn = function() {
             if (self.debug) {console.log("SafetyPrinter: tripResetBtn")};
             // Send a command to arduino to reset all trips
-            OctoPrint.simpleApiCommand("SafetyPrinter", "resetTrip");
+            self.boardCommand("resetTrip");
             
             // Remove notification.
             if (typeof self.tripPopup != "undefined") {
@@ -827,7 +880,7 @@ $(function() {
         self.tripConfirmBtn = function() {
             if (self.debug) {console.log("SafetyPrinter: tripConfirmBtn")};
             self.confirmVisible(!self.confirmVisible());
-            OctoPrint.simpleApiCommand("SafetyPrinter", "sendTrip");
+            self.boardCommand("sendTrip");
         };
 
         // ************* Functions for navbar:
@@ -875,11 +928,11 @@ $(function() {
             if (self.notConnected()) {
                 self.connection("Connecting");
                 //self.connectionColor("");
-                OctoPrint.simpleApiCommand("SafetyPrinter", "reconnect");    
+                self.boardCommand("reconnect");    
             } else {
                 self.connection("Disconecting");
                 //self.connectionColor("");                
-                OctoPrint.simpleApiCommand("SafetyPrinter", "disconnect");    
+                self.boardCommand("disconnect");    
             }
 
         };
@@ -896,11 +949,70 @@ $(function() {
                 return;
             }
 
+            if (data.type == "batch") {
+                self.applyBatch(data.messages);
+            } else {
+                self.applyMessage(data);
+            }
+        };
+
+        self.applyBatch = function(messages) {
+            // All messages from one status update. The terminal is redrawn only once.
+            self.inBatch = true;
+            self.terminalChanged = false;
+            _.each(messages, function (message) {
+                self.applyMessage(message);
+            });
+            self.inBatch = false;
+            if (self.terminalChanged) {
+                self.terminalLines.valueHasMutated();
+                if (self.autoscrollEnabled() && $("#SafetyPrinterTerminal").is(':visible') && OctoPrint.coreui.browserTabVisible) {
+                    self.scrollToEnd();
+                }
+            }
+        };
+
+        self.applyTerminalBacklog = function(data) {
+            // Terminal history kept by the server
+            if (data.lastSeq < self.lastTerminalSeq) {
+                // Server restarted: sequence numbers start again. The entries are after the old sequence number, so
+                // the whole history is fetched again.
+                self.lastTerminalSeq = 0;
+                self.requestTerminalBacklog();
+                return;
+            }
+            self.applyBatch(_.map(data.entries, function (entry) {
+                return _.extend({type: "terminalUpdate"}, entry);
+            }));
+        };
+
+        self.applyMessage = function(data) {
+            if (data.board !== undefined && data.board !== null) {
+                if (self.boards.indexOf(data.board) < 0) {
+                    self.boards.push(data.board);
+                }
+                if (data.board != self.selectedBoard()) {
+                    // Terminal shows all the boards and error popups come from any board. Everything else only for the selected one.
+                    if (data.type == "error") {
+                        self.showPopup("error",gettext("SafetyPrinter Error") + " (" + data.board + ")",data.errorMsg);
+                        return;
+                    } else if (data.type == "interlockUpdate" && data.interlockStatus) {
+                        self.showPopup("error",gettext("SafetyPrinter TRIP") + " (" + data.board + ")",gettext("Safety Printer board tripped: ") + data.board);
+                        return;
+                    } else if (data.type != "terminalUpdate") {
+                        return;
+                    }
+                }
+            }
+
             if (data.type == "statusUpdate") {
                 // Update all sensors status
                 
                 var i = parseInt(data.sensorIndex);
                 self.numOfSensors = parseInt(data.totalSensors);
+                // Messages carry only the fields that changed. Keeps the last value of the others.
+                self.sensorData[i] = _.extend(self.sensorData[i] || {}, data);
+                data = self.sensorData[i];
 
                 if (i >=0 || i < 8) {                                        
                     
@@ -908,7 +1020,7 @@ $(function() {
                     self.spSensorsSettings()[i].visible(true);                    
                     self.spSensors()[i].label(data.sensorLabel);
                     self.spSensorsSettings()[i].label(data.sensorLabel);
-                    if (data.sensorEnabled == "T") {
+                    if (data.sensorEnabled) {
                         self.spSensors()[i].enabled(true);    
                         //console.log(Math.floor(Math.random() * 101) + ":Index:" + i + " , Label:" + data.sensorLabel + " , Enabled: True - " + self.spSensors()[i].enabled());
                     } else {
@@ -916,7 +1028,7 @@ $(function() {
                         //console.log(Math.floor(Math.random() * 101) + ":Index:" + i + " , Label:" + data.sensorLabel + " , Enabled: False - " + self.spSensors()[i].enabled());
                     }
                     self.spSensorsSettings()[i].actualvalue(data.sensorActualValue);
-                    if (data.sensorActive == "T") {
+                    if (data.sensorActive) {
                         self.spSensors()[i].active(true); 
                         self.spSensorsSettings()[i].active(true);   
                     } else {
@@ -947,9 +1059,9 @@ $(function() {
                     } else {
                         statusStr = ""
                     }
-                    if (data.sensorActive == "T") {
-                        if(data.sensorEnabled == "T") {
-                            if (data.sensorTrigger == "T") {
+                    if (data.sensorActive) {
+                        if(data.sensorEnabled) {
+                            if (data.sensorTrigger) {
                                 statusStr += "Alarm (Trigger)";
                                 colorStr = "Red";  
                                 //Update shutdown warning:                                
@@ -966,7 +1078,7 @@ $(function() {
                             colorStr = "gray";
                         }                        
                     } else {
-                        if(data.sensorEnabled == "T") {
+                        if(data.sensorEnabled) {
                             colorStr = "green";
                         } else {
                             statusStr += "(Disabled)";
@@ -976,13 +1088,13 @@ $(function() {
                     self.spSensors()[i].status(statusStr);
                     self.spSensors()[i].color(colorStr);
 
-                    if (data.sensorForceDisable == "T") {
+                    if (data.sensorForceDisable) {
                         self.spSensorsSettings()[i].forceDisable(true);
                     } else {
                         self.spSensorsSettings()[i].forceDisable(false);
                     }
                     //console.log(data);
-                    if (data.sensorTrigger == "T") {
+                    if (data.sensorTrigger) {
                         self.spSensors()[i].trigger(true);
                     } else {
                         self.spSensors()[i].trigger(false);
@@ -1009,7 +1121,7 @@ $(function() {
 
             else if (data.type == "interlockUpdate") {
             // Update interlock (trip) status
-                if (data.interlockStatus == "F") {
+                if (!data.interlockStatus) {
                     self.interlock(false);
                     self.updateNavbar('Trip',false)
 
@@ -1113,6 +1225,8 @@ $(function() {
                         self.tripPopupOptions.buttons.closer = true,
                         self.tripPopup.update(self.tripPopupOptions);
                     }
+                } else if (!data.connectionStatus && data.state && data.state != "Disconnected" && data.state != "Failed") { // Connection in progress
+                    self.connection(data.state + "...");
                 }
             }
 
@@ -1123,15 +1237,35 @@ $(function() {
 
             else if (data.type == "terminalUpdate") {
             // Update messages displayed on settings terminal                
+                if (data.seq !== undefined) {
+                    if (data.seq <= self.lastTerminalSeq) {
+                        return; // Already received (history replay)
+                    }
+                    self.lastTerminalSeq = data.seq;
+                }
                 data.line.replace(/[\n\r]+/g, '');
+                var line = data.line;
+                if (data.board && self.boards().length > 1) {
+                    line = "[" + data.board + "] " + line;
+                }
  
-                self.terminalLines.push(new TerminalViewModel(data.line,data.terminalType));
+                if (self.inBatch) {
+                    // Changes the underlying array. Subscribers are notified once, at the end of the batch.
+                    self.terminalLines().push(new TerminalViewModel(line,data.terminalType));
+                    self.terminalChanged = true;
+                } else {
+                    self.terminalLines.push(new TerminalViewModel(line,data.terminalType));
+                }
                 self.countTerminalLines++;
 
                 if (self.countTerminalLines > 300) {  //same amount of lines as Octoprint's terminal
-                    self.terminalLines.shift(); //removes the first line
+                    if (self.inBatch) {
+                        self.terminalLines().shift();
+                    } else {
+                        self.terminalLines.shift(); //removes the first line
+                    }
                 }
-                if (self.autoscrollEnabled() && $("#SafetyPrinterTerminal").is(':visible') && OctoPrint.coreui.browserTabVisible) {
+                if (!self.inBatch && self.autoscrollEnabled() && $("#SafetyPrinterTerminal").is(':visible') && OctoPrint.coreui.browserTabVisible) {
                     self.scrollToEnd();
                 }
 
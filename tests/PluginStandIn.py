@@ -0,0 +1,140 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Stand-ins for the OctoPrint objects used by the plugin, shared by the tests (tests/) and the benchmarks
+ * (benchmarks/)
+ *
+ '''
+
+import logging
+import os
+import threading
+import time
+from octoprint_SafetyPrinter.BoardManager import BoardManager
+from octoprint_SafetyPrinter.History import History
+from octoprint_SafetyPrinter.Metrics import MetricsRegistry, LinkMetrics, PollMetrics
+from octoprint_SafetyPrinter.Outbox import Outbox
+from octoprint_SafetyPrinter.PollScheduler import PollScheduler
+from octoprint_SafetyPrinter.SerialMux import SerialMux
+from octoprint_SafetyPrinter.PortInventory import PortInventory
+from octoprint_SafetyPrinter.Settings import SettingsCache
+from octoprint_SafetyPrinter.TerminalBuffer import TerminalBuffer
+from octoprint_SafetyPrinter.Tracing import TripTracer
+
+def waitFor(condition, timeout=2.0):
+    # Returns True as soon as condition() is true, False if it isn't until timeout (s)
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+class StandInSettings():
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, path, **kwargs):
+        return self.values.get(path[0])
+
+    def get_boolean(self, path):
+        return bool(self.values.get(path[0]))
+
+    def get_int(self, path):
+        try:
+            return int(self.values.get(path[0]))
+        except (TypeError, ValueError):
+            return None
+
+class StandInPrinter():
+    def __init__(self):
+        self.printing = False
+
+    def is_operational(self):
+        return True
+
+    def is_printing(self):
+        return self.printing
+
+    def is_closed_or_error(self):
+        return False
+
+    def get_current_connection(self):
+        return ("Closed", None, None, None)
+
+class StandInPluginManager():
+    # Plugin messages to the UI, batches unpacked. Each one goes to received(): kept by default.
+
+    def __init__(self):
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def get_helpers(self, *args):
+        return None
+
+    def send_plugin_message(self, identifier, message):
+        for item in message["messages"] if message.get("type") == "batch" else [message]:
+            self.received(item)
+
+    def received(self, message):
+        with self._lock:
+            self.messages.append(message)
+
+    def sent(self, messageType):
+        with self._lock:
+            return [message for message in self.messages if message.get("type") == messageType]
+
+class StandInPlugin():
+    # The parts of SafetyPrinterPlugin used by BoardManager and Connection, with the primary board on port
+
+    def __init__(self, port, dataFolder, baudRate=115200, pluginManager=None):
+        self._identifier = "SafetyPrinter"
+        self._console_logger = logging.getLogger("octoprint.plugins.SafetyPrinter.standin")
+        self._logger = self._console_logger
+        self._printer = StandInPrinter()
+        self._printer_profile_manager = None
+        self._plugin_manager = pluginManager or StandInPluginManager()
+        self._settings = StandInSettings({"serialport": port, "BAUDRate": str(baudRate), "showTerminal": True,
+                                          "notifyWarnings": False, "notifyVoltageTemp": False, "forceRedComm": False,
+                                          "loggingLevel": "INFO", "boards": []})
+        self._dataFolder = dataFolder
+        self.outbox = Outbox(self._plugin_manager, self._identifier)
+        self.portInventory = PortInventory(self._printer, self._console_logger)
+        self.settingsCache = SettingsCache(self._settings)
+        self.settingsCache.rebuild()
+        self.terminalBuffer = TerminalBuffer()
+        self.serialMux = SerialMux(self._console_logger)
+        self.serialMux.start()
+        self.metrics = MetricsRegistry()
+        self.linkMetrics = LinkMetrics(self.metrics)
+        self.tracer = TripTracer(self._console_logger, self.metrics)
+        self.scheduler = PollScheduler(self._printer, lambda: self.boards.connections(), self._console_logger,
+                                       PollMetrics(self.metrics))
+        self.boards = BoardManager(self)
+        # One hour of history instead of one week: written at once
+        board = self.boards.board()
+        board.history.close()
+        board.history = History(os.path.join(dataFolder, "history.bin"), 3600)
+
+    def get_plugin_data_folder(self):
+        return self._dataFolder
+
+    def close(self):
+        self.boards.closeAll()
+        for boardId in self.boards.ids():
+            self.boards.board(boardId).history.close()
+        self.serialMux.stop()
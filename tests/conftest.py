@@ -0,0 +1,152 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Test fixtures. The plugin stand-ins are shared with the benchmarks (PluginStandIn.py).
+ * Run the tests with the same python that runs OctoPrint:
+ *
+ *    python -m pytest tests
+ *
+ '''
+
+import inspect
+import os
+import threading
+import flask
+import flask_login
+import octoprint.settings
+import pytest
+from octoprint_SafetyPrinter.Connection import Connection
+from octoprint_SafetyPrinter.PortProber import MCU_BANNER
+from octoprint_SafetyPrinter.SerialReader import SerialReader
+from octoprint_SafetyPrinter.Simulator import Simulator
+from tests.PluginStandIn import StandInPlugin
+
+class FakePort():
+    # Serial port that keeps what is written
+    def __init__(self):
+        self.written = b""
+
+    def write(self, data):
+        self.written += data
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __del__(self):
+        pass
+
+@pytest.fixture
+def offline(tmp_path):
+    # Connection that isn't connected (no port), with a serial reader fed by the test (reader.feed)
+    plugin = StandInPlugin(os.path.join(str(tmp_path), "ttyNone"), str(tmp_path))
+    board = plugin.boards.board()
+    conn = board.conn = Connection(plugin, board)
+    assert not conn.is_connected()
+    conn.reader = SerialReader(None, onFrame=conn.on_frame)
+    yield conn
+    plugin.close()
+
+@pytest.fixture
+def board(tmp_path):
+    # board(features, sensors=4, **simulator options) starts a virtual MCU and returns (simulator, connection),
+    # already connected. UI messages: connection._plugin_manager.sent(type)
+    started = []
+
+    def connect(features=None, sensors=4, **options):
+        simulator = Simulator(sensors, features=features, **options)
+        simulator.start()
+        plugin = StandInPlugin(simulator.path, str(tmp_path))
+        started.append((plugin, simulator))
+        board = plugin.boards.board()
+        conn = board.conn = Connection(plugin, board)
+        conn.connect(False)
+        assert conn.is_connected(), conn.state
+        return simulator, conn
+
+    yield connect
+    for plugin, simulator in started:
+        plugin.close()
+        simulator.close()
+
+class Terminal():
+    # One end of a pseudo-terminal. Answers <R6> with the MCU banner if banner is set.
+    def __init__(self, banner):
+        self.master, self.slave = os.openpty()
+        self.path = os.ttyname(self.slave)
+        self.banner = banner
+        self.received = b""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                data = os.read(self.master, 64)
+            except OSError:
+                return
+            self.received += data
+            if self.banner and b"<R6>" in self.received:
+                os.write(self.master, (MCU_BANNER + " 1.0\r\n").encode())
+                self.banner = False
+
+    def close(self):
+        os.close(self.slave)
+        os.close(self.master)
+
+@pytest.fixture
+def terminals():
+    # terminals(banner) opens a pseudo-terminal (Linux only). Its path is the port to connect to.
+    opened = []
+    def terminal(banner=False):
+        opened.append(Terminal(banner))
+        return opened[-1]
+    yield terminal
+    for terminal in opened:
+        terminal.close()
+
+API_KEY = "tester"
+
+class ApiUser(flask_login.UserMixin):
+    id = "tester"
+
+@pytest.fixture(scope="session")
+def octoprintSettings(tmp_path_factory):
+    # OctoPrint settings, read by restricted_access. Past the first run, so only the login is checked.
+    try:
+        settings = octoprint.settings.settings()
+    except ValueError:
+        settings = octoprint.settings.settings(init=True, basedir=str(tmp_path_factory.mktemp("octoprint")))
+    settings.setBoolean(["server", "firstRun"], False)
+    return settings
+
+@pytest.fixture
+def api(octoprintSettings):
+    # api(plugin) returns a flask test client with the plugin blueprint routes. Requests with the X-Api-Key header
+    # set to API_KEY are logged in, the others are anonymous.
+    def client(plugin):
+        app = flask.Flask("SafetyPrinterTests")
+        loginManager = flask_login.LoginManager()
+        loginManager.init_app(app)
+        loginManager.request_loader(lambda request: ApiUser() if request.headers.get("X-Api-Key") == API_KEY else None)
+        for name, member in inspect.getmembers(type(plugin), inspect.isfunction):
+            for rule, options in getattr(member, "_blueprint_rules", {}).get(name, []):
+                app.add_url_rule(rule, name, view_func=getattr(plugin, name), **options)
+        return app.test_client()
+    return client
@@ -0,0 +1,92 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Binary frames (feature "binary", <S2 on>, see BinaryCodec.py)
+ *
+ '''
+
+from octoprint_SafetyPrinter import BinaryCodec
+from octoprint_SafetyPrinter import Protocol
+from tests.conftest import FakePort
+from tests.PluginStandIn import waitFor
+
+STATUS = "R1:F,F,F,F,F,F,#0,T,F,25,250,5,F,#1,T,T,1,1,0,T,"
+
+def test_switch_to_binary_in_the_middle_of_a_buffer(offline):
+    offline.binaryRequested = True
+    status = BinaryCodec.encodeStatus(Protocol.parseStatus(STATUS))
+    # The "<S2 on>" answer and the first binary frames in one read, the end of the last frame in the next one
+    offline.reader.feed(b"S2: Binary on.\r\n" + BinaryCodec.encodeText("C5: Configuration saved.") + status[:7])
+    offline.reader.feed(status[7:])
+    frames = offline.reader.clear()
+    assert offline.binaryMode
+    assert frames[:2] == ["S2: Binary on.", "C5: Configuration saved."]
+    assert Protocol.formatStatus(frames[2]) == STATUS
+    assert (offline.totalmsgs, offline.badmsgs) == (2, 0)
+
+def test_status_with_256_sensors():
+    sensors = [Protocol.SensorStatus(index, index % 2 == 0, index % 3 == 0, index + 0.5, 1000 + index, index * 10, index % 5 == 0)
+               for index in range(256)]
+    status = Protocol.StatusFrame(Protocol.parseStatus(STATUS).header, sensors)
+    frame = BinaryCodec.encodeStatus(status)
+    assert len(frame) <= BinaryCodec.statusWireSize(256)
+    decoded = BinaryCodec.decodeFrame(frame[:-1])
+    assert decoded.sensors == sensors
+    assert Protocol.formatStatus(decoded) == Protocol.formatStatus(status)
+
+def test_bad_frames_are_counted(offline):
+    offline.binaryMode = True
+    offline.reader.decoder = offline.decode_binary
+    frame = bytearray(BinaryCodec.encodeText("R5:1024,35.5,5.01,12,3,"))
+    frame[-2] ^= 0xFF # CRC
+    offline.reader.feed(bytes(frame))
+    offline.reader.feed(b"\x09\x52\x35\x00") # COBS block longer than the frame
+    offline.reader.feed(BinaryCodec.encodeText("R5:1024,35.5,5.01,12,3,"))
+    assert offline.reader.clear() == ["R5:1024,35.5,5.01,12,3,"]
+    assert (offline.totalmsgs, offline.badmsgs) == (3, 2)
+
+def test_pushed_binary_status(offline):
+    offline.binaryMode = offline.pushMode = True
+    offline.reader.decoder = offline.decode_binary
+    offline.reader.feed(BinaryCodec.encodeStatus(Protocol.parseStatus(STATUS)))
+    assert offline.pushedFrames.qsize() == 1
+    assert offline.reader.clear() == []
+
+def test_binary_off_on_disconnection(offline):
+    offline.serialConn = port = FakePort()
+    offline._connected = True
+    offline.binaryMode = True
+    offline.reader = None
+    offline.closeConnection()
+    assert port.written == b"<S2 off>"
+    assert not offline.binaryMode
+
+def test_binary_mode_with_the_simulator(board):
+    simulator, conn = board(("push", "binary"))
+    assert conn.binaryMode and simulator.binary
+    assert conn.send_command("<R5>") == "R5:1024,35.5,5.01,12,3,"
+    conn.update_ui_status(1.0)
+    assert isinstance(conn.lastStatusFrame, Protocol.StatusFrame)
+
+    badmsgs = conn.badmsgs
+    simulator.badCrcRate = 1.0
+    assert conn.send_command("<R5>", answerTimeout=0.2) == "Error"
+    assert conn.badmsgs > badmsgs
+
+    simulator.badCrcRate = 0.0
+    conn.closeConnection()
+    assert waitFor(lambda: not simulator.binary and not simulator.push)
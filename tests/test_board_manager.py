@@ -0,0 +1,124 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Safety Printer boards (BoardManager.py): board settings, history files and claimed ports
+ *
+ '''
+
+import os
+import threading
+import flask
+from octoprint_SafetyPrinter import SafetyPrinterPlugin
+from octoprint_SafetyPrinter import Connection as ConnectionModule
+from octoprint_SafetyPrinter.BoardManager import PRIMARY_BOARD
+from octoprint_SafetyPrinter.Connection import Connection
+from tests.PluginStandIn import StandInPlugin, StandInPluginManager, waitFor
+
+def test_boards_from_the_settings(tmp_path):
+    plugin = StandInPlugin(str(tmp_path / "ttyS0"), str(tmp_path))
+    try:
+        plugin._settings.values["boards"] = [{"id": "enclosure", "port": "/dev/ttyUSB1"}, {"id": "dryer/box", "port": "AUTO"},
+                                             {"id": "enclosure", "port": "/dev/ttyUSB2"}, {"id": "noport"}, "invalid"]
+        plugin.settingsCache.rebuild()
+        assert plugin.boards.configure() == ["enclosure", "dryer/box"]
+        assert plugin.boards.ids() == [PRIMARY_BOARD, "enclosure", "dryer/box"]
+        assert plugin.boards.board("enclosure").port == "/dev/ttyUSB1"
+        assert plugin.boards.board(PRIMARY_BOARD).port is None
+        assert plugin.boards.board("dryer/box").history.path == os.path.join(str(tmp_path), "history-dryer_box.bin")
+
+        plugin._settings.values["boards"] = []
+        plugin.settingsCache.rebuild()
+        assert plugin.boards.configure() == []
+        assert plugin.boards.ids() == [PRIMARY_BOARD]
+        assert not plugin.boards.exists("enclosure")
+    finally:
+        plugin.close()
+
+def test_auto_probing_skips_the_ports_of_other_boards(tmp_path):
+    plugin = StandInPlugin(str(tmp_path / "ttyS0"), str(tmp_path))
+    try:
+        plugin._settings.values["boards"] = [{"id": "enclosure", "port": "/dev/ttyUSB1"}, {"id": "dryer", "port": "AUTO"}]
+        plugin.settingsCache.rebuild()
+        plugin.boards.configure()
+        dryer = plugin.boards.board("dryer")
+        dryer.conn = Connection(plugin, dryer)
+        assert plugin.boards.claimedPorts(dryer.conn) == {"/dev/ttyUSB1"}
+        assert plugin.boards.get("dryer") is dryer.conn
+        assert plugin.boards.get("enclosure") is None
+        assert plugin.boards.connections() == [dryer.conn]
+    finally:
+        plugin.close()
+
+def test_reconnect_already_in_progress(tmp_path):
+    standIn = StandInPlugin(str(tmp_path / "ttyS0"), str(tmp_path))
+    try:
+        board = standIn.boards.board()
+        board.conn = Connection(standIn, board)
+        board.conn.state = ConnectionModule.STATE_PROBING
+        plugin = SafetyPrinterPlugin()
+        plugin.boards = standIn.boards
+        with flask.Flask(__name__).test_request_context():
+            response, status = plugin.on_api_command("reconnect", {})
+            assert status == 409 and not response.get_json()["queued"]
+            response, status = plugin.on_api_command("reconnect", {"board": "enclosure"})
+            assert status == 400
+    finally:
+        standIn.close()
+
+def test_boards_connect_at_the_same_time(tmp_path, monkeypatch):
+    plugin = StandInPlugin(str(tmp_path / "ttyS0"), str(tmp_path))
+    try:
+        plugin._settings.values["boards"] = [{"id": "enclosure", "port": str(tmp_path / "ttyS1")}]
+        plugin.settingsCache.rebuild()
+        plugin.boards.configure()
+        inside = threading.Barrier(2, timeout=5)
+        monkeypatch.setattr(Connection, "connect", lambda conn, waitPrinter: inside.wait())
+        plugin.boards.connectAll(False)
+        assert waitFor(lambda: not plugin.boards._connecting)
+        assert not inside.broken
+    finally:
+        plugin.close()
+
+class SentMessages(StandInPluginManager):
+    # Messages as sent to OctoPrint, batches included
+
+    def __init__(self):
+        StandInPluginManager.__init__(self)
+        self.sentMessages = []
+
+    def send_plugin_message(self, identifier, message):
+        self.sentMessages.append(message)
+        StandInPluginManager.send_plugin_message(self, identifier, message)
+
+def test_update_status_sends_one_batch_per_board(tmp_path):
+    pluginManager = SentMessages()
+    plugin = StandInPlugin(str(tmp_path / "ttyS0"), str(tmp_path), pluginManager=pluginManager)
+    try:
+        plugin._settings.values["boards"] = [{"id": "enclosure", "port": str(tmp_path / "ttyS1")}]
+        plugin.settingsCache.rebuild()
+        plugin.boards.configure()
+        for boardId in plugin.boards.ids():
+            board = plugin.boards.board(boardId)
+            board.conn = Connection(plugin, board)
+            board.conn.forceRenewConn = True # Connection status and firmware info
+        del pluginManager.sentMessages[:]
+        plugin.boards.updateStatus()
+        assert [message["type"] for message in pluginManager.sentMessages] == ["batch", "batch"]
+        assert [set(item["board"] for item in message["messages"]) for message in pluginManager.sentMessages] == \
+               [{PRIMARY_BOARD}, {"enclosure"}]
+    finally:
+        plugin.close()
@@ -0,0 +1,115 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Connection state machine (Connection.connect): the states sent to the UI until Connected or Failed
+ *
+ '''
+
+import os
+import sys
+import logging
+import threading
+import pytest
+from octoprint_SafetyPrinter import Connection as ConnectionModule
+from octoprint_SafetyPrinter.Connection import Connection
+from tests.PluginStandIn import StandInPlugin
+
+def states(conn):
+    # States sent to the UI, without repeats
+    sent = []
+    for message in conn._plugin_manager.sent("connectionUpdate"):
+        if not sent or sent[-1] != message["state"]:
+            sent.append(message["state"])
+    return sent
+
+@pytest.fixture
+def connection(tmp_path):
+    plugins = []
+    def connection(port):
+        plugins.append(StandInPlugin(port, str(tmp_path)))
+        board = plugins[-1].boards.board()
+        board.conn = Connection(plugins[-1], board)
+        return board.conn
+    yield connection
+    for plugin in plugins:
+        plugin.close()
+
+def test_port_that_cant_be_opened(connection, tmp_path):
+    conn = connection(os.path.join(str(tmp_path), "ttyNone"))
+    conn.connect(False)
+    assert conn.state == ConnectionModule.STATE_FAILED and conn.connFail
+    assert not conn.is_connected()
+    assert states(conn) == [ConnectionModule.STATE_PROBING, ConnectionModule.STATE_FAILED]
+
+def test_abort_while_waiting_printer(connection, tmp_path):
+    conn = connection(os.path.join(str(tmp_path), "ttyNone"))
+    conn._printer.is_operational = lambda: False
+    # As SafetyPrinterPlugin.disconnect does
+    threading.Timer(0.1, setattr, (conn, "abortSerialConn", True)).start()
+    conn.connect(True)
+    assert states(conn)[0] == ConnectionModule.STATE_WAITING_PRINTER
+    assert conn.state == ConnectionModule.STATE_FAILED
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Needs a pseudo-terminal")
+@pytest.mark.parametrize("protocol, reduced", [("6", False), ("5", True)])
+def test_handshake(connection, terminals, monkeypatch, protocol, reduced):
+    mcu = terminals(banner=True)
+    conn = connection(mcu.path)
+    answers = {"<R4>": "R4:1.0.2,2022/01/30,3,%s,ATmega328P," % protocol}
+    monkeypatch.setattr(conn, "newSerialCommand", lambda command, timeout, force: answers.get(command, "Error"))
+    conn.connect(False)
+    try:
+        assert conn.is_connected() and conn.connectedPort == mcu.path
+        assert states(conn) == [ConnectionModule.STATE_PROBING, ConnectionModule.STATE_HANDSHAKING,
+                                ConnectionModule.STATE_CONNECTED]
+        assert conn.FWCommProtocol == protocol and conn.reducedComm == reduced
+        firmwareInfo = conn._plugin_manager.sent("firmwareInfo")[-1]
+        assert firmwareInfo["ValidVersion"] != reduced
+    finally:
+        conn.closeConnection()
+    assert conn.state == ConnectionModule.STATE_DISCONNECTED
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Needs a pseudo-terminal")
+def test_handshake_without_answer(connection, terminals, monkeypatch):
+    mcu = terminals(banner=True)
+    conn = connection(mcu.path)
+    monkeypatch.setattr(conn, "newSerialCommand", lambda command, timeout, force: "Error")
+    conn.connect(False)
+    assert conn.state == ConnectionModule.STATE_FAILED
+    assert not conn.is_connected()
+
+class Formatted():
+    # Terminal argument counting how many times it is formatted
+    count = 0
+
+    def __str__(self):
+        Formatted.count += 1
+        return "formatted"
+
+def test_terminal_lines_nobody_reads_are_not_formatted(offline, monkeypatch):
+    monkeypatch.setattr(offline._console_logger, "level", logging.WARNING)
+    monkeypatch.setattr(Formatted, "count", 0)
+    offline.terminal("Answer: %s", "Recv", Formatted())
+    assert Formatted.count == 1 # Shown on the terminal
+    assert offline._plugin_manager.sent("terminalUpdate")[-1]["line"] == "Answer: formatted"
+
+    offline._settings.values["showTerminal"] = False
+    offline.settingsCache.rebuild()
+    assert not offline.terminal_wanted("Recv") and offline.terminal_wanted("WARNING")
+    offline.terminal("Answer: %s", "Recv", Formatted())
+    offline.terminal("Answer: %s", "Info", Formatted())
+    assert Formatted.count == 1
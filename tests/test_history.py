@@ -0,0 +1,138 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Sensor history (History.py) and its /history endpoint
+ *
+ '''
+
+import threading
+import pytest
+from octoprint_SafetyPrinter import Protocol
+from octoprint_SafetyPrinter import SafetyPrinterPlugin
+from octoprint_SafetyPrinter.History import History, HISTORY_PERIOD
+from tests.conftest import API_KEY
+from tests.PluginStandIn import StandInPlugin, waitFor
+
+T0 = 1699999980 # Start of a minute
+
+def status(value, SP=250, interlock=False):
+    return Protocol.parseStatus("R1:%s,F,F,F,F,F,#0,T,F,%s,%s,5,F,#1,T,F,20,100,0,F," % ("T" if interlock else "F", value, SP))
+
+@pytest.fixture
+def history(tmp_path):
+    # One hour history, ready for records with 2 sensors
+    history = History(str(tmp_path / "history.bin"), 3600)
+    frame = status(0)
+    assert not history.append(T0 - 10, frame.header, frame.sensors) # The file is written on a background thread
+    assert waitFor(lambda: history.sensors == 2)
+    yield history
+    history.close()
+
+def record(history, now, frame):
+    return history.append(now, frame.header, frame.sensors)
+
+def test_values_reduced_to_buckets(history):
+    for second in range(60):
+        record(history, T0 + second, status(second))
+    result = history.query(T0, T0 + 60, 2)
+    assert result["time"] == [T0, T0 + 30]
+    value = result["sensors"][0]["value"]
+    assert (value["min"], value["max"], value["mean"]) == ([0, 30], [29, 59], [14.5, 44.5])
+    assert result["sensors"][1]["value"]["mean"] == [20, 20]
+
+def test_records_limited_to_one_per_period_unless_flags_change(history):
+    assert record(history, T0, status(1))
+    assert not record(history, T0 + HISTORY_PERIOD / 2, status(2))
+    assert record(history, T0 + HISTORY_PERIOD / 2, status(2, interlock=True))
+    assert history.query(T0, T0 + 1, 1)["flags"] == [1]
+
+def test_empty_buckets(history):
+    record(history, T0, status(1))
+    result = history.query(T0, T0 + 20, 2)
+    assert result["flags"] == [0, None]
+    assert result["sensors"][0]["value"]["mean"] == [1, None]
+
+def test_time_weighted_setpoint(history):
+    record(history, T0, status(0, SP=100))
+    record(history, T0 + 30, status(0, SP=200))
+    SP = history.query(T0, T0 + 40, 1)["sensors"][0]["SP"]
+    assert (SP["min"], SP["max"], SP["mean"]) == ([100], [200], [125])
+
+def test_long_ranges_from_the_minute_tier(history):
+    for second in range(0, 600, 2):
+        record(history, T0 + second, status(second // 60))
+    value = history.query(T0, T0 + 600, 2)["sensors"][0]["value"]
+    assert (value["min"], value["max"], value["mean"]) == ([0, 5], [4, 9], [2, 7])
+
+def test_clock_stepping_back(history):
+    record(history, T0 + 100, status(1))
+    # The wall clock goes back 50s: only the trip is recorded, at the last time, until the clock catches up
+    assert not record(history, T0 + 50, status(2))
+    assert record(history, T0 + 51, status(3, interlock=True))
+    assert not record(history, T0 + 60, status(4, interlock=True))
+    assert record(history, T0 + 101, status(5, interlock=True))
+    result = history.query(T0 + 100, T0 + 102, 2)
+    assert result["flags"] == [1, 1]
+    value = result["sensors"][0]["value"]
+    assert (value["min"], value["max"]) == ([1, 5], [3, 5])
+    assert history.query(T0, T0 + 99, 1)["flags"] == [None]
+
+def test_history_kept_across_restarts(history, tmp_path):
+    record(history, T0, status(7))
+    history.close()
+    reopened = History(str(tmp_path / "history.bin"), 3600)
+    assert reopened.query(T0, T0 + 1, 1)["sensors"][0]["value"]["max"] == [7]
+    reopened.close()
+
+def test_query_while_recording(history):
+    stop = threading.Event()
+    def recording():
+        second = 0
+        while not stop.is_set():
+            record(history, T0 + second, status(second % 100))
+            second += 1
+    thread = threading.Thread(target=recording)
+    thread.start()
+    try:
+        for _ in range(50):
+            result = history.query(T0, T0 + 3600, 300)
+            for low, high in zip(result["sensors"][0]["value"]["min"], result["sensors"][0]["value"]["max"]):
+                assert (low is None) or (0 <= low <= high <= 99)
+    finally:
+        stop.set()
+        thread.join()
+
+def test_history_endpoint(api, history, tmp_path):
+    for second in range(10):
+        record(history, T0 + second, status(second))
+    standIn = StandInPlugin(str(tmp_path / "ttyNone"), str(tmp_path))
+    standIn.boards.board().history.close()
+    standIn.boards.board().history = history
+    plugin = SafetyPrinterPlugin()
+    plugin.boards = standIn.boards
+    client = api(plugin)
+
+    assert client.get("/history?start=%d&end=%d" % (T0, T0 + 10)).status_code == 401
+    response = client.get("/history?start=%d&end=%d&points=1" % (T0, T0 + 10), headers={"X-Api-Key": API_KEY})
+    assert response.status_code == 200
+    result = response.get_json()
+    assert [sensor["index"] for sensor in result["sensors"]] == [0, 1]
+    assert result["sensors"][0]["value"]["max"] == [9]
+    assert result["board"] == "main"
+    assert client.get("/history?board=enclosure", headers={"X-Api-Key": API_KEY}).status_code == 404
+    assert client.get("/history?start=10&end=5", headers={"X-Api-Key": API_KEY}).status_code == 400
+    assert client.get("/history?points=many", headers={"X-Api-Key": API_KEY}).status_code == 400
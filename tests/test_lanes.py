@@ -0,0 +1,82 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Command lanes (Lanes.py): the priority gate and the pipeline slot kept for safety commands
+ *
+ '''
+
+import threading
+import time
+from octoprint_SafetyPrinter.Lanes import CommandGate, LaneStats, commandLane, LANE_SAFETY, LANE_CONTROL, LANE_READ
+from octoprint_SafetyPrinter.Pipeline import Pipeline, PIPELINE_WINDOW
+from tests.PluginStandIn import waitFor
+
+def test_command_lanes():
+    assert [commandLane(command) for command in ("C2", "c6", "C9")] == [LANE_SAFETY] * 3
+    assert [commandLane(command) for command in ("R1", "r5", "R6")] == [LANE_READ] * 3
+    assert [commandLane(command) for command in ("C3", "C7", "C5")] == [LANE_CONTROL] * 3
+
+def test_gate_serves_the_highest_lane_first():
+    gate = CommandGate()
+    assert gate.acquire(LANE_READ, 0)
+    order = []
+
+    def command(lane):
+        assert gate.acquire(lane, 5)
+        order.append(lane)
+        gate.release()
+
+    threads = []
+    for lane in (LANE_READ, LANE_READ, LANE_CONTROL, LANE_SAFETY):
+        threads.append(threading.Thread(target=command, args=(lane,)))
+        threads[-1].start()
+        assert waitFor(lambda: sum(gate._waiting) == len(threads))
+    gate.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == [LANE_SAFETY, LANE_CONTROL, LANE_READ, LANE_READ]
+
+def test_gate_timeout_unblocks_lower_lanes():
+    gate = CommandGate()
+    assert gate.acquire(LANE_READ, 0)
+    start = time.monotonic()
+    assert not gate.acquire(LANE_SAFETY, 0.1)
+    assert time.monotonic() - start >= 0.1
+    gate.release()
+    assert gate.acquire(LANE_READ, 0)
+
+def test_pipeline_slot_kept_for_safety_commands():
+    pipeline = Pipeline()
+    reads = [pipeline.acquire("<R1>", 0, LANE_READ) for _ in range(PIPELINE_WINDOW - 1)]
+    assert all(reads)
+    assert pipeline.acquire("<C3 0 on>", 0, LANE_CONTROL) is None
+    safety = pipeline.acquire("<C2>", 0, LANE_SAFETY)
+    assert safety is not None
+    assert pipeline.acquire("<C2>", 0, LANE_SAFETY) is None
+    assert pipeline.inFlight() == PIPELINE_WINDOW
+
+    pipeline.release(reads[0])
+    assert pipeline.acquire("<R5>", 0, LANE_READ) is None # The safety command still takes a slot
+    pipeline.release(safety)
+    assert pipeline.acquire("<R5>", 0, LANE_READ) is not None
+
+def test_lane_stats():
+    stats = LaneStats()
+    stats.record(0.5, 0.1, True, deadline=2.0)
+    stats.record(2.5, 0.0, False, deadline=2.0)
+    assert stats.asDict() == {"count": 2, "failures": 1, "deadlineMisses": 1, "last": 2.5, "max": 2.5,
+                              "average": 1.5, "lastWait": 0.0}
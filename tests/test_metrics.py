@@ -0,0 +1,84 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Link, poll and port metrics (Metrics.py) and their /metrics endpoint
+ *
+ '''
+
+from octoprint_SafetyPrinter import SafetyPrinterPlugin
+from octoprint_SafetyPrinter.Metrics import MetricsRegistry, LinkMetrics, CONTENT_TYPE
+from tests.conftest import API_KEY
+from tests.PluginStandIn import StandInPlugin
+
+def samples(text):
+    # {"name{labels}": value} of a Prometheus text export
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if line and not line.startswith("#"))
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "Test.", ("port",), (0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(('tty"0',), value)
+    exported = samples(registry.render())
+    assert exported['test_seconds_bucket{port="tty\\"0",le="0.1"}'] == "1"
+    assert exported['test_seconds_bucket{port="tty\\"0",le="1.0"}'] == "2"
+    assert exported['test_seconds_bucket{port="tty\\"0",le="+Inf"}'] == "3"
+    assert exported['test_seconds_count{port="tty\\"0"}'] == "3"
+    assert "# TYPE test_seconds histogram" in registry.render()
+
+def test_unknown_commands_share_one_label():
+    registry = MetricsRegistry()
+    metrics = LinkMetrics(registry).board("main")
+    for commandId in ("r5", "C42", "X9"):
+        metrics.request(commandId, 2, None)
+    exported = samples(registry.render())
+    assert exported['safetyprinter_command_retries_total{board="main",command="R5"}'] == "1"
+    assert exported['safetyprinter_command_retries_total{board="main",command="other"}'] == "2"
+
+def test_link_metrics_with_the_simulator(board):
+    simulator, conn = board()
+    registry = conn.boardManager._plugin.metrics
+    simulator.badCrcRate = 1.0
+    assert conn.newSerialCommand("<R5>", 0.3, False) == "Error"
+    simulator.badCrcRate = 0.0
+    conn.newSerialCommand("<R5>", 1, False)
+
+    exported = samples(registry.render())
+    assert exported['safetyprinter_connects_total{board="main"}'] == "1"
+    assert exported['safetyprinter_connected{board="main"}'] == "1"
+    assert int(exported['safetyprinter_command_crc_errors_total{board="main",command="R5"}']) > 1
+    assert int(exported['safetyprinter_command_retries_total{board="main",command="R5"}']) > 0
+    assert exported['safetyprinter_command_failures_total{board="main",command="R5",error="bad CRC"}'] == "1"
+    assert exported['safetyprinter_command_rtt_seconds_count{board="main",command="R5"}'] == "1"
+
+    conn.closeConnection()
+    assert samples(registry.render())['safetyprinter_connected{board="main"}'] == "0"
+
+def test_metrics_endpoint(api, tmp_path):
+    standIn = StandInPlugin(str(tmp_path / "ttyNone"), str(tmp_path))
+    try:
+        plugin = SafetyPrinterPlugin()
+        plugin.metrics = standIn.metrics
+        client = api(plugin)
+
+        assert client.get("/metrics").status_code == 401
+        response = client.get("/metrics", headers={"X-Api-Key": API_KEY})
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == CONTENT_TYPE
+        assert samples(response.get_data(as_text=True))["safetyprinter_poll_overruns_total"] == "0"
+    finally:
+        standIn.close()
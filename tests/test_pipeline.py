@@ -0,0 +1,153 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Pipelined commands (feature "pipeline", <S3 on>, see Pipeline.py)
+ *
+ '''
+
+import threading
+import time
+from octoprint_SafetyPrinter import BinaryCodec
+from octoprint_SafetyPrinter import Pipeline
+from octoprint_SafetyPrinter import Protocol
+from octoprint_SafetyPrinter import Retry
+from tests.conftest import FakePort
+from tests.PluginStandIn import waitFor
+
+STATUS = "R1:F,F,F,F,F,F,#0,T,F,25,250,5,F,#1,T,T,1,1,0,T,"
+
+def test_tags():
+    assert Pipeline.tag("<C3 1 50>", 12) == "<C3 1 50 @12>"
+    assert Pipeline.untag("@12:$123$R5:1,") == (12, "$123$R5:1,")
+    assert Pipeline.untag("R6: Safety Printer MCU") == (None, "R6: Safety Printer MCU")
+    assert Pipeline.untag("@x:R5") == (None, "@x:R5")
+
+def test_window_limit():
+    pipeline = Pipeline.Pipeline()
+    pending = [pipeline.acquire("<R1>", 0) for _ in range(Pipeline.PIPELINE_WINDOW)]
+    assert all(pending)
+    assert pipeline.acquire("<R5>", 0) is None
+    assert pipeline.inFlight() == Pipeline.PIPELINE_WINDOW
+    assert len(set(item.seq for item in pending)) == Pipeline.PIPELINE_WINDOW
+    pipeline.release(pending[0])
+    assert pipeline.acquire("<R5>", 0) is not None
+
+def test_answers_delivered_by_sequence_number(offline):
+    offline.pipeline = Pipeline.Pipeline()
+    first = offline.pipeline.acquire("<R5>", 0)
+    second = offline.pipeline.acquire("<R4>", 0)
+    # Answers in the reverse order, with an MCU boot message nobody waits for
+    offline.reader.feed(("@%d:R4:1.0.2,2022/01/30,3,6,ATmega328P,\n" % second.seq).encode() +
+                        b"R6: Safety Printer MCU\n" + ("@%d:R5:1024,35.5,5.01,12,3,\n" % first.seq).encode())
+    assert first.wait(0) == "R5:1024,35.5,5.01,12,3,"
+    assert second.wait(0).startswith("R4:")
+    assert offline.reader.clear() == []
+
+def test_tagged_binary_frames(offline):
+    offline.binaryMode = True
+    offline.reader.decoder = offline.decode_binary
+    offline.pipeline = Pipeline.Pipeline()
+    text = offline.pipeline.acquire("<R5>", 0)
+    status = offline.pipeline.acquire("<R1>", 0)
+    offline.reader.feed(BinaryCodec.encodeTagged(status.seq, BinaryCodec.encodeStatus(Protocol.parseStatus(STATUS))) +
+                        BinaryCodec.encodeTagged(text.seq, BinaryCodec.encodeText("R5:1024,35.5,5.01,12,3,")))
+    assert text.wait(0) == "R5:1024,35.5,5.01,12,3,"
+    assert Protocol.formatStatus(status.wait(0)) == STATUS
+    assert offline.reader.clear() == []
+
+def test_untagged_frames_are_dropped(offline):
+    offline.binaryMode = True
+    offline.reader.decoder = offline.decode_binary
+    offline.pipeline = Pipeline.Pipeline()
+    status = BinaryCodec.encodeStatus(Protocol.parseStatus(STATUS)) # Not in push mode
+    offline.reader.feed(status * 50 + BinaryCodec.encodeText("R6: Safety Printer MCU"))
+    assert offline.reader.frames.empty()
+
+def test_late_answer_is_dropped():
+    pipeline = Pipeline.Pipeline()
+    pending = pipeline.acquire("<R5>", 0)
+    assert pending.wait(0) is None # Timed out
+    pipeline.release(pending)
+    assert not pipeline.deliver(pending.seq, "R5:1024,35.5,5.01,12,3,")
+    assert pipeline.inFlight() == 0
+
+def test_cancel_wakes_the_commands_in_flight():
+    pipeline = Pipeline.Pipeline()
+    pending = pipeline.acquire("<R5>", 0)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(pending.wait(5)))
+    thread.start()
+    pipeline.cancelAll()
+    thread.join(1)
+    assert result == [None]
+
+def test_pipeline_off_on_disconnection(offline):
+    offline.serialConn = port = FakePort()
+    offline._connected = True
+    offline.pipeline = pipeline = Pipeline.Pipeline()
+    pending = pipeline.acquire("<R5>", 0)
+    offline.reader = None
+    offline.closeConnection()
+    assert port.written == b"<S3 off>"
+    assert offline.pipeline is None and pending.event.is_set()
+
+def test_commands_in_flight_with_the_simulator(board):
+    simulator, conn = board(("push", "binary", "pipeline"), delay=0.02)
+    assert conn.pipeline is not None and simulator.pipeline
+    answers = {}
+    inFlight = []
+
+    def change(index):
+        answers[index] = conn.send_command("<C7 %d %d>" % (index, index + 1), 5)
+
+    threads = [threading.Thread(target=change, args=(index % 4,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        inFlight.append(conn.pipeline.inFlight())
+        time.sleep(0.002)
+    for thread in threads:
+        thread.join()
+
+    assert answers == {index: "C7: Sensor #%d updated." % index for index in range(4)}
+    assert [sensor.timer for sensor in simulator.sensors] == [1, 2, 3, 4]
+    assert 1 < max(inFlight) <= Pipeline.PIPELINE_WINDOW - 1 # Control commands don't take the safety slot
+
+def test_late_answer_with_the_simulator(board):
+    simulator, conn = board(("push", "binary", "pipeline"))
+    simulator.pushStalled = True
+    simulator.delay = 0.6
+    assert conn.transact("<R5>", 1, answerTimeout=0.1) == ("Error", Retry.ERROR_NO_ANSWER)
+    assert conn.pipeline.inFlight() == 0
+    time.sleep(0.7) # The <R5> answer arrives: nobody waits for it
+    simulator.delay = 0.0
+    answer = conn.send_command("<R4>", 1)
+    assert answer.startswith("R4:")
+    assert conn.reader.clear() == []
+
+def test_disconnection_cancels_the_commands_in_flight(board):
+    simulator, conn = board(("push", "binary", "pipeline"))
+    simulator.delay = 1.0
+    result = []
+    thread = threading.Thread(target=lambda: result.append(conn.transact("<R5>", 1, answerTimeout=5)))
+    thread.start()
+    assert waitFor(lambda: conn.pipeline.inFlight() == 1)
+    start = time.monotonic()
+    conn.closeConnection()
+    thread.join(2)
+    assert result == [("Error", Retry.ERROR_DISCONNECTED)]
+    assert time.monotonic() - start < 0.5
@@ -0,0 +1,103 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Serial port discovery cache (PortInventory.py): rescans only when the device signature or the printer port changes
+ *
+ '''
+
+import importlib
+import logging
+import os
+import pytest
+from octoprint_SafetyPrinter.PortInventory import PortInventory
+from tests.PluginStandIn import StandInPrinter
+
+PortInventoryModule = importlib.import_module("octoprint_SafetyPrinter.PortInventory") # The package exports the class
+
+class ListPortInfo():
+    def __init__(self, device, hwid, description="USB Serial"):
+        self.device = device
+        self.hwid = hwid
+        self.description = description
+
+class ConnectedPrinter(StandInPrinter):
+    def __init__(self, port):
+        StandInPrinter.__init__(self)
+        self.port = port
+
+    def get_current_connection(self):
+        if self.port is None:
+            return ("Closed", None, None, None)
+        return ("Operational", self.port, 115200, "_default")
+
+@pytest.fixture
+def devices(tmp_path, monkeypatch):
+    # Fake /dev and /sys/class/tty directories, and the ports listed by pyserial
+    dev = tmp_path / "dev"
+    sysfs = tmp_path / "tty"
+    dev.mkdir()
+    sysfs.mkdir()
+    monkeypatch.setattr(PortInventoryModule, "DEV_DIR", str(dev))
+    monkeypatch.setattr(PortInventoryModule, "SYSFS_TTY_DIR", str(sysfs))
+    ports = []
+    scans = []
+    def comports():
+        scans.append(len(ports))
+        return list(ports)
+    monkeypatch.setattr(PortInventoryModule.serial.tools.list_ports, "comports", comports)
+
+    def plug(name, hwid):
+        (dev / name).write_text("")
+        (sysfs / name).mkdir()
+        ports.append(ListPortInfo(str(dev / name), hwid))
+        return str(dev / name)
+    plug.scans = scans
+    return plug
+
+def test_cached_until_a_device_is_plugged(devices):
+    nano = devices("ttyUSB0", "USB VID:PID=1A86:7523 LOCATION=1-1")
+    inventory = PortInventory(ConnectedPrinter(None), logging.getLogger("test"))
+    assert inventory.snapshot().arduinoPorts == [nano]
+    assert inventory.snapshot().arduinoPorts == [nano]
+    assert len(devices.scans) == 1
+
+    uno = devices("ttyACM0", "USB VID:PID=2341:0043 SER=1")
+    devices("ttyS0", "PNP0501") # Not an Arduino
+    assert inventory.snapshot().arduinoPorts == [nano, uno]
+    assert len(devices.scans) == 2
+
+def test_force_rescan(devices):
+    devices("ttyUSB0", "USB VID:PID=1A86:7523")
+    inventory = PortInventory(ConnectedPrinter(None), logging.getLogger("test"))
+    inventory.snapshot()
+    inventory.snapshot(force=True)
+    assert len(devices.scans) == 2
+
+def test_printer_port_follows_the_printer_connection(devices):
+    printerPort = devices("ttyUSB0", "USB VID:PID=1A86:7523")
+    mcuPort = devices("ttyUSB1", "USB VID:PID=1A86:7523")
+    link = os.path.join(os.path.dirname(printerPort), "ttyPrinter")
+    os.symlink(printerPort, link)
+    printer = ConnectedPrinter(None)
+    inventory = PortInventory(printer, logging.getLogger("test"))
+    assert not inventory.snapshot().isPrinterPort(printerPort)
+
+    printer.port = link
+    snapshot = inventory.snapshot()
+    assert snapshot.printerPort == link
+    assert snapshot.isPrinterPort(printerPort) and not snapshot.isPrinterPort(mcuPort)
+    assert len(devices.scans) == 1
@@ -0,0 +1,56 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Parallel port probing (PortProber.py), with MCUs answering on pseudo-terminals (conftest.terminals)
+ *
+ '''
+
+import sys
+import threading
+import pytest
+from octoprint_SafetyPrinter.PortProber import PortProber
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Needs a pseudo-terminal")
+
+def test_the_port_that_answers_wins(terminals):
+    silent, mcu = terminals(), terminals(banner=True)
+    lines = []
+    prober = PortProber([silent.path, mcu.path, "/dev/ttyNone"], 115200, 5.0, lambda msg, ttype, *args: lines.append(msg % args if args else msg))
+    found = prober.run()
+    assert found is not None
+    port, serialConn, reader = found
+    try:
+        assert port == mcu.path and serialConn.is_open
+        assert b"<R6>" in silent.received
+        assert prober.errors == 1 # /dev/ttyNone
+    finally:
+        reader.stop()
+        serialConn.close()
+        reader.wait()
+
+def test_no_answer_until_the_deadline(terminals):
+    silent = terminals()
+    lines = []
+    prober = PortProber([silent.path], 115200, 0.5, lambda msg, ttype, *args: lines.append(msg % args if args else msg))
+    assert prober.run() is None
+    assert "No answer on port: " + silent.path in lines
+
+def test_cancel(terminals):
+    silent = terminals()
+    prober = PortProber([silent.path], 115200, 30.0, lambda msg, ttype, *args: None)
+    threading.Timer(0.2, prober.cancel).start()
+    assert prober.run() is None
@@ -0,0 +1,86 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Protocol codec (Protocol.py): typed records from the R1, R2, R4 and R5 answers
+ *
+ '''
+
+import pytest
+from octoprint_SafetyPrinter import Protocol
+
+def test_parse_status():
+    status = Protocol.parseStatus("R1:T,F,F,T,F,F,#0,T,F,25,250,5,F,#1,T,T,1.5,1,0,T,")
+    assert status.header.interlock and status.header.execWarning and not status.header.resetInhibit
+    assert status.sensors == [Protocol.SensorStatus(0, True, False, 25, 250, 5, False),
+                              Protocol.SensorStatus(1, True, True, 1.5, 1, 0, True)]
+    assert isinstance(status.sensors[1].actualValue, float)
+
+def test_parse_status_without_sensors():
+    assert Protocol.parseStatus("R1:F,F,F,F,F,F,").sensors == []
+
+def test_parse_sensor_info():
+    sensors = Protocol.parseSensorInfo("R2:#0,Hotend temp,1,F,0,300,#1,Flame,0,T,0,1,")
+    assert sensors[0] == Protocol.SensorInfo(0, "Hotend temp", 1, False, 0, 300)
+    assert sensors[1].label == "Flame" and sensors[1].forceDisable
+
+def test_parse_firmware_info():
+    info = Protocol.parseFirmwareInfo("R4:1.0.2,2022/01/30,3, 6,ATmega328P,")
+    assert (info.version, info.releaseDate, info.EEPROM, info.commProtocol, info.boardType) == \
+           ("1.0.2", "2022/01/30", "3", "6", "ATmega328P")
+
+def test_parse_mcu_stats():
+    stats = Protocol.parseMCUStats("R5:1024,35.5,5.01,12,3,")
+    assert (stats.SRAM, stats.temp, stats.volts, stats.maxTime, stats.avgTime) == (1024, 35.5, 5.01, 12, 3)
+
+def test_parse_features():
+    assert Protocol.parseFeatures("R7:push,binary,") == ("binary", "push")
+    assert Protocol.parseFeatures("R7:pipeline,crc32,push,binary,") == ("binary", "pipeline", "push")
+    assert Protocol.parseFeatures("R7:") == ()
+    with pytest.raises(Protocol.ProtocolError):
+        Protocol.parseFeatures("R4:1.0.2,2022/01/30,3,6,ATmega328P,")
+
+def test_mode_answers():
+    assert Protocol.isModeOn("S1: Push on.", "S1")
+    assert not Protocol.isModeOn("S1: Push off.", "S1")
+    assert not Protocol.isModeOn("S2: Binary on.", "S1")
+    assert Protocol.isRejection("Invalid command: R7", "R7")
+    assert Protocol.isRejection("Invalid command: s1 on", "S1")
+    assert not Protocol.isRejection("Invalid command: R1", "R7")
+    assert not Protocol.isRejection("R7:push,", "R7")
+
+@pytest.mark.parametrize("frame, field, reason", [
+    ("R2:F,F,F,F,F,F,", 0, "Expected R1 answer"),
+    ("R1:F,F,F,", 3, "Incomplete status header"),
+    ("R1:F,F,X,F,F,F,", 2, "Invalid flag 'X'"),
+    ("R1:F,F,F,F,F,F,#0,T,F,25,250,", 11, "Incomplete sensor record"),
+    ("R1:F,F,F,F,F,F,0,T,F,25,250,5,F,", 6, "Invalid sensor index '0'"),
+    ("R1:F,F,F,F,F,F,#0,T,F,hot,250,5,F,", 9, "Invalid number 'hot'"),
+    ("R1:F,F,F,F,F,F,#0,T,F,25,250,5.5,F,", 11, "Invalid integer '5.5'"),
+])
+def test_malformed_status(frame, field, reason):
+    with pytest.raises(Protocol.ProtocolError) as error:
+        Protocol.parseStatus(frame)
+    assert (error.value.field, error.value.reason) == (field, reason)
+    assert isinstance(error.value, ValueError)
+
+def test_malformed_answers():
+    with pytest.raises(Protocol.ProtocolError):
+        Protocol.parseFirmwareInfo("R4:1.0.2,2022/01/30,")
+    with pytest.raises(Protocol.ProtocolError):
+        Protocol.parseMCUStats("R5:1024,warm,5.01,12,3,")
+    with pytest.raises(Protocol.ProtocolError):
+        Protocol.parseSensorInfo("R2:#0,Hotend temp,1,F,0,")
@@ -0,0 +1,143 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Status push mode (feature "push", <S1 on>)
+ *
+ '''
+
+from octoprint_SafetyPrinter import Protocol, Retry
+from octoprint_SafetyPrinter.Crc16 import crc16
+from tests.conftest import FakePort
+from tests.PluginStandIn import waitFor
+
+STATUS = "R1:F,F,F,F,F,F,#0,T,F,25,250,5,F,"
+
+def pushed(payload):
+    return ("$%d$%s\n" % (crc16(payload), payload)).encode()
+
+def test_status_pushed_before_the_answer_is_kept(offline, monkeypatch):
+    # The MCU pushes the first status right after its "S1" answer, before enable_push handles the answer
+    def answer(command, timeout=-1):
+        offline.reader.feed(pushed(STATUS))
+        return "S1: Push on."
+    monkeypatch.setattr(offline, "send_command", answer)
+    offline.enable_push()
+    assert offline.pushMode
+    assert offline.pushedFrames.qsize() == 1
+    offline.receive_pushed_status()
+    assert offline.lastStatusFrame == STATUS
+
+def test_refused_push_keeps_polling(offline, monkeypatch):
+    monkeypatch.setattr(offline, "send_command", lambda command, timeout=-1: "Error")
+    offline.enable_push()
+    assert not offline.pushMode
+    offline.reader.feed(pushed(STATUS))
+    assert offline.pushedFrames.empty()
+    assert offline.reader.clear() == ["$%d$%s" % (crc16(STATUS), STATUS)]
+
+def test_push_falls_back_to_polling(offline, monkeypatch):
+    sent = []
+    monkeypatch.setattr(offline, "send_command", lambda command, timeout=-1: sent.append(command) or "S1: Push on.")
+    offline.enable_push()
+    monkeypatch.setattr(Protocol, "PUSH_KEEPALIVE", 0.01)
+    offline.receive_pushed_status()
+    assert not offline.pushMode
+    assert sent == ["<S1 on>", "<S1 off>"]
+
+def test_push_off_on_disconnection(offline):
+    offline.serialConn = port = FakePort()
+    offline._connected = True
+    offline.pushMode = True
+    offline.reader = None
+    offline.closeConnection()
+    assert port.written == b"<S1 off>"
+    assert not offline.pushMode
+
+def test_pushed_frames_cleared_on_disconnection(offline):
+    offline.serialConn = FakePort()
+    offline._connected = True
+    offline.pushMode = True
+    offline.reader.feed(pushed(STATUS))
+    assert offline.pushedFrames.qsize() == 1
+    offline.closeConnection()
+    assert offline.pushedFrames.empty() and offline.reader is None
+
+def test_pushed_status_frames(board):
+    simulator, conn = board(("push",))
+    assert conn.pushMode and simulator.push
+    conn.update_ui_status(1.0)
+    commands = simulator.commands
+
+    simulator.setValue(0, 300)
+    assert waitFor(lambda: (conn.receive_pushed_status(0.1) or True) and
+                   Protocol.parseStatus(conn.lastStatusFrame).sensors[0].actualValue == 300)
+    assert simulator.commands == commands # Not polled
+    updates = [message for message in conn._plugin_manager.sent("statusUpdate") if message["sensorIndex"] == 0]
+    assert updates[-1]["sensorActualValue"] == 300
+
+def test_stalled_push_with_the_simulator(board, monkeypatch):
+    monkeypatch.setattr(Protocol, "PUSH_KEEPALIVE", 0.1)
+    simulator, conn = board(("push",))
+    conn.update_ui_status(1.0)
+
+    simulator.pushStalled = True
+    assert waitFor(lambda: (conn.receive_pushed_status(0.05) or True) and not conn.pushMode)
+    assert waitFor(lambda: not simulator.push)
+    assert simulator.lastCommand == "S1 off"
+
+    commands = simulator.commands
+    conn.update_ui_status()
+    assert simulator.commands == commands + 1
+    assert simulator.lastCommand == "R1"
+
+def test_force_renew_replays_last_status(board):
+    simulator, conn = board(("push",))
+    conn.update_ui_status(1.0)
+    simulator.pushStalled = True
+    while conn.next_pushed_frame()[1]:
+        pass
+    messages = conn._plugin_manager.messages
+    del messages[:]
+    commands = simulator.commands
+
+    conn.forceRenew = True
+    conn.receive_pushed_status(0)
+    updates = conn._plugin_manager.sent("statusUpdate")
+    assert sorted(message["sensorIndex"] for message in updates) == [0, 1, 2, 3]
+    assert all("sensorActualValue" in message and "sensorEnabled" in message for message in updates)
+    assert conn._plugin_manager.sent("interlockUpdate")
+    assert not conn.forceRenew
+    assert simulator.commands == commands
+
+def test_push_off_with_the_simulator(board):
+    simulator, conn = board(("push",))
+    conn.closeConnection()
+    assert waitFor(lambda: not simulator.push)
+
+def test_firmware_without_capability_query_is_polled(board):
+    simulator, conn = board()
+    assert conn.FWCommProtocol == "6" and not conn.reducedComm
+    assert not (conn.pushMode or conn.binaryMode or conn.pipeline)
+    assert not (simulator.push or simulator.binary or simulator.pipeline)
+    assert conn.transact("<R7>")[1] == Retry.ERROR_REJECTED
+    conn.update_ui_status()
+    assert simulator.lastCommand == "R1"
+
+def test_only_reported_features_are_turned_on(board):
+    simulator, conn = board(("push",))
+    assert conn.pushMode and not (conn.binaryMode or conn.pipeline)
+    assert simulator.push and not (simulator.binary or simulator.pipeline)
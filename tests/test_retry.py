@@ -0,0 +1,77 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Command retries (Retry.py and Connection.newSerialCommand): backoff, deadline and error classes
+ *
+ '''
+
+import pytest
+from octoprint_SafetyPrinter import Retry
+from octoprint_SafetyPrinter.Lanes import LANE_SAFETY, LANE_CONTROL, SAFETY_DEADLINE
+
+def test_backoff():
+    policy = Retry.RetryPolicy(5.0, baseDelay=0.05, maxDelay=0.3, jitter=0)
+    assert [policy.delay(attempt) for attempt in range(1, 6)] == [0.05, 0.1, 0.2, 0.3, 0.3]
+    jittered = Retry.RetryPolicy(5.0, baseDelay=0.1, jitter=0.5)
+    assert all(0.05 <= jittered.delay(1) <= 0.1 for _ in range(100))
+
+def test_command_policy():
+    assert Retry.commandPolicy("R5", LANE_CONTROL, 3).canRetry(Retry.ERROR_NO_ANSWER)
+    # Typed in the terminal: not sent again once the MCU may have run it
+    custom = Retry.commandPolicy("C42", LANE_CONTROL, 3)
+    assert custom.canRetry(Retry.ERROR_BUSY) and not custom.canRetry(Retry.ERROR_NO_ANSWER)
+    # Safety commands keep trying until the caller gives up, and at least for their latency target
+    assert Retry.commandPolicy("C2", LANE_SAFETY, 10).deadline == 10
+    assert Retry.commandPolicy("C2", LANE_SAFETY, 0.5).deadline == SAFETY_DEADLINE
+    assert not Retry.commandPolicy("R1", LANE_CONTROL, 3).canRetry(Retry.ERROR_DISCONNECTED)
+
+@pytest.fixture
+def attempts(offline, monkeypatch):
+    # Each transact() call takes the next result: (answer, error)
+    results = []
+    calls = []
+    def transact(command, timeout=-1, lane=None, answerTimeout=None):
+        calls.append(command)
+        return results.pop(0) if results else ("Error", Retry.ERROR_NO_ANSWER)
+    monkeypatch.setattr(offline, "transact", transact)
+    monkeypatch.setattr(Retry.random, "random", lambda: 1.0) # Shortest backoff
+    return offline, results, calls
+
+def test_transient_errors_are_retried(attempts):
+    conn, results, calls = attempts
+    results += [("Error", Retry.ERROR_BAD_CRC), ("Error", Retry.ERROR_BUSY), ("R5:1024,35.5,5.01,12,3,", None)]
+    assert conn.newSerialCommand("<R5>", 5, False) == "R5:1024,35.5,5.01,12,3,"
+    assert len(calls) == 3
+    assert conn.commandStats["R5"].asDict()["lastAttempts"] == 3
+
+def test_disconnection_is_not_retried(attempts):
+    conn, results, calls = attempts
+    results.append(("Error", Retry.ERROR_DISCONNECTED))
+    assert conn.newSerialCommand("<C3 0 on>", 5, False) == "Error"
+    assert len(calls) == 1
+    assert conn.commandStats["C3"].lastError == Retry.ERROR_DISCONNECTED
+
+def test_unanswered_command_sent_once_unless_idempotent(attempts):
+    conn, results, calls = attempts
+    assert conn.newSerialCommand("<C42 1>", 0.3, False) == "Error"
+    assert calls == ["<C42 1>"]
+
+def test_deadline(attempts):
+    conn, results, calls = attempts
+    assert conn.newSerialCommand("<R5>", 0.3, False) == "Error"
+    stats = conn.commandStats["R5"]
+    assert stats.failures == 1 and stats.lastError == Retry.ERROR_NO_ANSWER and 1 < stats.lastAttempts < 10
@@ -0,0 +1,125 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Batch sensor configuration (SensorConfig.py, configureSensors API command) against the virtual MCU
+ *
+ '''
+
+import flask
+import pytest
+import time
+from octoprint_SafetyPrinter import SafetyPrinterPlugin
+from octoprint_SafetyPrinter import SensorConfig
+from tests.PluginStandIn import StandInPlugin
+
+@pytest.fixture
+def configured(board, monkeypatch):
+    # Connected board with its sensors read. Returns (simulator, connection, commands sent by newSerialCommand)
+    simulator, conn = board()
+    conn.update_ui_status()
+    assert conn.sensors.size == 4
+    sent = []
+    newSerialCommand = conn.newSerialCommand
+    def record(command, timeout, force):
+        sent.append(command)
+        return newSerialCommand(command, timeout, force)
+    monkeypatch.setattr(conn, "newSerialCommand", record)
+    return simulator, conn, sent
+
+def statuses(result):
+    return [(item["id"], item["field"], item["status"]) for item in result["items"]]
+
+def test_enables_applied_last_and_saved_once(configured):
+    simulator, conn, sent = configured
+    result = conn.configure_sensors([{"id": 2, "enabled": "off", "SP": 200}, {"id": 0, "timer": 7, "SP": 180}])
+    assert result["valid"] and result["ok"] and result["saved"]
+    assert sent == ["<C4 2 200>", "<C7 0 7>", "<C4 0 180>", "<C3 2 off>", "<C5>"]
+    assert (simulator.sensors[0].SP, simulator.sensors[0].timer) == (180, 7)
+    assert (simulator.sensors[2].SP, simulator.sensors[2].enabled) == (200, False)
+
+def test_invalid_batch_sends_nothing(configured):
+    simulator, conn, sent = configured
+    result = conn.configure_sensors([{"id": 0, "SP": 200}, {"id": 0, "SP": 301}, {"id": 1, "timer": -1},
+                                     {"id": 9, "enabled": True}, {"id": 2, "colour": "red"}, {"id": 0, "SP": 200}])
+    assert not result["valid"] and not result["ok"] and not result["saved"]
+    assert statuses(result) == [(0, "SP", SensorConfig.STATUS_SKIPPED), (0, "SP", SensorConfig.STATUS_INVALID),
+                                (1, "timer", SensorConfig.STATUS_INVALID), (2, "colour", SensorConfig.STATUS_INVALID),
+                                (0, "SP", SensorConfig.STATUS_INVALID), (9, "enabled", SensorConfig.STATUS_INVALID)]
+    assert sent == []
+
+def test_unchanged_values_are_not_sent(configured):
+    simulator, conn, sent = configured
+    result = conn.configure_sensors([{"id": 0, "SP": 250, "enabled": True}])
+    assert result["ok"] and not result["saved"]
+    assert statuses(result) == [(0, "SP", SensorConfig.STATUS_UNCHANGED), (0, "enabled", SensorConfig.STATUS_UNCHANGED)]
+    assert sent == []
+
+def test_mcu_stops_answering(configured, monkeypatch):
+    simulator, conn, sent = configured
+    monkeypatch.setattr(SensorConfig, "CONFIG_DEADLINE", 0.5)
+    simulator.dropRate = 1.0
+    result = conn.configure_sensors([{"id": 0, "SP": 200, "timer": 7}])
+    assert result["valid"] and not result["ok"] and not result["saved"]
+    assert statuses(result) == [(0, "SP", SensorConfig.STATUS_FAILED), (0, "timer", SensorConfig.STATUS_SKIPPED)]
+    assert "<C5>" not in sent
+
+@pytest.fixture
+def slowMCU(configured, monkeypatch):
+    # Each command takes 0.3 s and is always answered. The batch deadline is 0.5 s.
+    simulator, conn, sent = configured
+    newSerialCommand = conn.newSerialCommand
+    def slow(command, timeout, force):
+        time.sleep(0.3)
+        return newSerialCommand(command, 5, force)
+    monkeypatch.setattr(conn, "newSerialCommand", slow)
+    monkeypatch.setattr(SensorConfig, "CONFIG_DEADLINE", 0.5)
+    return simulator, conn, sent
+
+def test_changes_skipped_after_the_deadline(slowMCU):
+    simulator, conn, sent = slowMCU
+    result = conn.configure_sensors([{"id": 0, "SP": 200, "timer": 7}, {"id": 2, "SP": 150}])
+    assert not result["ok"] and not result["saved"]
+    assert statuses(result) == [(0, "SP", SensorConfig.STATUS_OK), (0, "timer", SensorConfig.STATUS_OK),
+                                (2, "SP", SensorConfig.STATUS_SKIPPED)]
+    assert result["items"][2]["error"] == SensorConfig.DEADLINE_EXPIRED
+    assert simulator.sensors[2].SP == 250
+
+def test_save_skipped_after_the_deadline(slowMCU):
+    simulator, conn, sent = slowMCU
+    result = conn.configure_sensors([{"id": 0, "SP": 200, "timer": 7}])
+    assert not result["ok"] and not result["saved"]
+    assert result["error"] == "Not saved (<C5> skipped): " + SensorConfig.DEADLINE_EXPIRED
+    assert "<C5>" not in sent
+
+def test_badly_formed_changes(configured):
+    simulator, conn, sent = configured
+    with pytest.raises(ValueError):
+        conn.configure_sensors({"id": 0, "SP": 200})
+    with pytest.raises(ValueError):
+        conn.configure_sensors([{"id": "first", "SP": 200}])
+
+def test_api_command_without_connection(tmp_path):
+    standIn = StandInPlugin(str(tmp_path / "ttyNone"), str(tmp_path))
+    try:
+        plugin = SafetyPrinterPlugin()
+        plugin.boards = standIn.boards
+        plugin._console_logger = standIn._console_logger
+        with flask.Flask(__name__).test_request_context():
+            response, status = plugin.on_api_command("configureSensors", {"changes": [{"id": 0, "SP": 200}]})
+        assert status == 409
+    finally:
+        standIn.close()
@@ -0,0 +1,63 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Columnar sensor store (SensorStore.py): change detection per field
+ *
+ '''
+
+from octoprint_SafetyPrinter import Protocol
+from octoprint_SafetyPrinter.SensorStore import SensorStore, FIELDS
+
+def test_new_sensors_are_fully_dirty():
+    store = SensorStore()
+    store.resize(2)
+    assert store.dirtySensors() == [0, 1]
+    assert sorted(store.popChanges(0)) == sorted(name for name, _, _ in FIELDS)
+    assert store.dirtySensors() == [1]
+
+def test_only_changed_fields_are_dirty():
+    store = SensorStore()
+    store.resize(1)
+    store.popChanges(0)
+    status = Protocol.SensorStatus(0, True, False, 25, 250, 5, False)
+    store.setStatus(0, status)
+    store.popChanges(0)
+
+    assert store.setStatus(0, status) == 0
+    assert store.dirtySensors() == []
+    assert store.setStatus(0, status._replace(actualValue=26.5, trigger=True))
+    assert store.popChanges(0) == {"actualValue": 26.5, "trigger": True}
+
+def test_exported_types():
+    store = SensorStore()
+    store.resize(1)
+    store.setInfo(0, Protocol.SensorInfo(0, "Hotend temp", 1, True, 0, 300))
+    store.setStatus(0, Protocol.SensorStatus(0, True, False, 25, 250.5, 5, False))
+    changes = store.popChanges(0)
+    assert changes["label"] == "Hotend temp" and changes["forceDisable"] is True
+    assert type(changes["actualValue"]) is int and changes["SP"] == 250.5
+    assert store.get("enabled", 0) is True
+
+def test_resize_and_mark_all_dirty():
+    store = SensorStore()
+    store.resize(3)
+    for index in range(3):
+        store.popChanges(index)
+    store.resize(2)
+    assert store.size == 2 and len(store.columns["actualValue"]) == 2
+    store.markAllDirty()
+    assert store.dirtySensors() == [0, 1]
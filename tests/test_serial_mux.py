@@ -0,0 +1,81 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Serial I/O event loop (SerialMux.py): frames of several ports read by one thread
+ *
+ '''
+
+import logging
+import os
+import serial
+import threading
+from octoprint_SafetyPrinter.SerialMux import SerialMux
+from octoprint_SafetyPrinter.SerialReader import SerialReader
+from tests.PluginStandIn import waitFor
+
+def test_ports_read_by_one_thread(terminals):
+    mux = SerialMux(logging.getLogger("octoprint.plugins.SafetyPrinter.tests"))
+    mux.start()
+    threadNames = []
+    def onFrame(frame):
+        threadNames.append(threading.current_thread().name)
+    ports, readers = [], []
+    try:
+        for terminal in (terminals(), terminals()):
+            port = serial.Serial(terminal.path, 115200, timeout=0)
+            reader = SerialReader(port, onFrame=onFrame, mux=mux)
+            reader.start()
+            ports.append(port)
+            readers.append(reader)
+            os.write(terminal.master, b"#R,6\n")
+        assert waitFor(lambda: all(reader.frames.qsize() == 1 for reader in readers))
+        assert mux.ports() == 2
+        assert set(threadNames) == {"SafetyPrinterSerialIO"}
+        assert readers[1].frames.get_nowait() == "#R,6"
+
+        readers[0].stop()
+        assert mux.ports() == 1
+    finally:
+        for port in ports:
+            port.close()
+        mux.stop()
+        mux.join(1)
+    assert not mux.is_alive()
+
+class PipePort():
+    # Read end of a pipe, seen by the event loop as a serial port
+    def __init__(self):
+        self.readFd, self.writeFd = os.pipe()
+
+    def fileno(self):
+        return self.readFd
+
+def test_closed_port_reported_to_its_reader():
+    mux = SerialMux(logging.getLogger("octoprint.plugins.SafetyPrinter.tests"))
+    mux.start()
+    errors = []
+    port = PipePort()
+    try:
+        reader = SerialReader(port, onError=errors.append, mux=mux)
+        reader.start()
+        os.write(port.writeFd, b"#R,6")
+        os.close(port.writeFd) # Cable unplugged
+        assert waitFor(lambda: errors)
+        assert mux.ports() == 0
+    finally:
+        os.close(port.readFd)
+        mux.stop()
@@ -0,0 +1,84 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Connection against the virtual MCU (Simulator.py): connect, status poll, retries, safety commands and lost ports
+ *
+ '''
+
+import threading
+import time
+from octoprint_SafetyPrinter import Connection as ConnectionModule
+from octoprint_SafetyPrinter import Retry
+from tests.PluginStandIn import waitFor
+
+def test_connect(board):
+    simulator, conn = board()
+    states = [message["state"] for message in conn._plugin_manager.sent("connectionUpdate")]
+    assert states[-1] == ConnectionModule.STATE_CONNECTED
+    assert ConnectionModule.STATE_HANDSHAKING in states
+    assert conn.FWCommProtocol == "6" and not conn.reducedComm
+    assert conn._plugin_manager.sent("firmwareInfo")[-1]["ValidVersion"]
+
+def test_status_poll(board):
+    simulator, conn = board()
+    conn.update_ui_status()
+    simulator.setValue(0, 300)
+    simulator.trip()
+    conn.update_ui_status()
+    updates = [message for message in conn._plugin_manager.sent("statusUpdate") if message["sensorIndex"] == 0]
+    assert updates[-1]["sensorActualValue"] == 300
+    assert conn._plugin_manager.sent("interlockUpdate")[-1]["interlockStatus"]
+
+def test_bad_answers_are_retried(board):
+    simulator, conn = board()
+    simulator.badCrcRate = 1.0
+    timer = threading.Timer(0.3, setattr, (simulator, "badCrcRate", 0.0))
+    timer.start()
+    try:
+        assert conn.newSerialCommand("<R5>", 3, False) == "R5:1024,35.5,5.01,12,3,"
+    finally:
+        timer.join()
+    assert conn.commandStats["R5"].lastAttempts > 1
+    assert conn.commandStats["R5"].lastError is None
+
+def test_safety_command_goes_before_queued_reads(board):
+    simulator, conn = board(delay=0.2)
+    done = []
+    def send(command):
+        conn.newSerialCommand(command, 5, False)
+        done.append(command)
+
+    first = threading.Thread(target=send, args=("<R5>",))
+    first.start()
+    assert waitFor(lambda: simulator.lastCommand == "R5")
+    threads = [threading.Thread(target=send, args=("<R2>",)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05) # The reads wait for the port
+    threads.append(threading.Thread(target=send, args=("<C2>",)))
+    threads[-1].start()
+    for thread in [first] + threads:
+        thread.join()
+    assert done == ["<R5>", "<C2>", "<R2>", "<R2>"]
+    assert simulator.interlock
+    assert conn.safetyStats.count == 1 and conn.safetyStats.failures == 0
+
+def test_lost_port(board):
+    simulator, conn = board()
+    simulator.close()
+    assert waitFor(lambda: not conn.is_connected())
+    assert conn.transact("<R5>", 1)[1] == Retry.ERROR_DISCONNECTED
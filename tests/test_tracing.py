@@ -0,0 +1,70 @@
+'''
+ * Safety Printer Octoprint Plugin
+ * Copyright (c) 2021~22 Rodrigo C. C. Silva [https://github.com/SinisterRj/Octoprint_SafetyPrinter]
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program.  If not, see <https://www.gnu.org/licenses/>.
+ *
+ * Trip and alarm reaction traces (Tracing.py) and their /traces endpoint
+ *
+ '''
+
+import logging
+import time
+from octoprint_SafetyPrinter import SafetyPrinterPlugin
+from octoprint_SafetyPrinter.Tracing import TripTracer, TRACE_BUDGET, STAGE_RECEIVED, STAGE_PARSED, STAGE_SENT
+from tests.conftest import API_KEY
+from tests.PluginStandIn import StandInPlugin
+
+def test_last_traces_newest_first():
+    tracer = TripTracer(logging.getLogger("octoprint.plugins.SafetyPrinter.tests"), history=2)
+    for board in ("main", "main", "enclosure"):
+        tracer.finish(tracer.start("trip", board, "", [(STAGE_RECEIVED, time.monotonic() - 1.0)]))
+    traces = tracer.traces()
+    assert [trace["board"] for trace in traces] == ["enclosure", "main"]
+    assert [trace["board"] for trace in tracer.traces("main")] == ["main"]
+    assert traces[0]["total"] >= 1.0 and traces[0]["overBudget"]
+    assert [stage["stage"] for stage in traces[0]["stages"]] == [STAGE_RECEIVED, STAGE_SENT]
+
+def test_trip_traced_with_the_simulator(board):
+    simulator, conn = board()
+    conn.update_ui_status()
+    simulator.trip()
+    conn.update_ui_status()
+    traces = conn.tracer.traces("main")
+    assert [trace["kind"] for trace in traces] == ["trip"]
+    stages = [stage["stage"] for stage in traces[0]["stages"]]
+    assert stages[0] == STAGE_RECEIVED and stages[-1] == STAGE_SENT and STAGE_PARSED in stages
+    assert 0 <= traces[0]["total"] < 5
+    exported = conn.boardManager._plugin.metrics.render()
+    assert 'safetyprinter_reaction_seconds_count{board="main",kind="trip"} 1' in exported
+
+def test_traces_endpoint(api, tmp_path):
+    standIn = StandInPlugin(str(tmp_path / "ttyNone"), str(tmp_path))
+    try:
+        trace = standIn.tracer.start("trip", "main", "", [])
+        standIn.tracer.finish(trace)
+        plugin = SafetyPrinterPlugin()
+        plugin.boards = standIn.boards
+        plugin.tracer = standIn.tracer
+        client = api(plugin)
+
+        assert client.get("/traces").status_code == 401
+        response = client.get("/traces?board=main", headers={"X-Api-Key": API_KEY})
+        assert response.status_code == 200
+        result = response.get_json()
+        assert result["budget"] == TRACE_BUDGET
+        assert [trace["kind"] for trace in result["traces"]] == ["trip"]
+        assert client.get("/traces?board=enclosure", headers={"X-Api-Key": API_KEY}).status_code == 404
+    finally:
+        standIn.close()